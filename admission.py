@@ -0,0 +1,146 @@
+# admission.py
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from ratelimit import TokenBuckets
+
+# Kode close untuk penolakan sementara (Try Again Later) dan pelanggaran kebijakan
+CLOSE_TRY_AGAIN = 1013
+CLOSE_POLICY = 1008
+
+Rejection = Tuple[int, str, str]
+
+
+class Admission:
+    """Kontrol penerimaan koneksi: batas total, autentikasi berjalan, per-IP, dan antrian tunggu"""
+
+    def __init__(self, max_connections: int, max_pending_auth: int = 64,
+                 max_per_ip: int = 0, ip_rate: float = 0, ip_burst: float = 10,
+                 queue_size: int = 0, queue_timeout: float = 10, retry_after: int = 5,
+                 expiry=None):
+        self.max_connections = max_connections
+        self.max_pending_auth = max_pending_auth
+        self.max_per_ip = max_per_ip
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.expiry = expiry
+        # Koneksi yang memegang slot (sedang autentikasi atau sudah masuk)
+        self.active = 0
+        self.authenticating = 0
+        self.per_ip: Dict[str, int] = {}
+        self.ip_buckets = TokenBuckets(ip_rate, ip_burst)
+        self._ip_slots: Dict[str, int] = {}
+        self._waiters: deque = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _has_room(self) -> bool:
+        return (self.active < self.max_connections
+                and (self.max_pending_auth <= 0 or self.authenticating < self.max_pending_auth))
+
+    def _retry(self, label: str) -> Rejection:
+        return CLOSE_TRY_AGAIN, f"Server penuh; retry-after={self.retry_after}", label
+
+    def _check_ip(self, ip: str) -> Optional[Rejection]:
+        """Batas koneksi bersamaan dan koneksi baru per detik dari satu IP"""
+        if self.max_per_ip > 0 and self.per_ip.get(ip, 0) >= self.max_per_ip:
+            return CLOSE_POLICY, "Terlalu banyak koneksi dari IP ini", "ip_limit"
+        if self.ip_buckets.rate > 0:
+            slot = self._ip_slots.get(ip)
+            if slot is None:
+                slot = self._ip_slots[ip] = self.ip_buckets.allocate()
+            delay = self.ip_buckets.acquire(slot, time.monotonic())
+            if delay:
+                # Koneksi yang ditolak tidak ikut menghabiskan token
+                self.ip_buckets.tokens[slot] += 1
+                if ip not in self.per_ip:
+                    self._schedule_ip_expiry(ip)
+                return (CLOSE_TRY_AGAIN, f"Terlalu banyak koneksi baru; retry-after={math.ceil(delay)}",
+                        "ip_rate")
+        return None
+
+    async def acquire(self, ip: str) -> Optional[Rejection]:
+        """Meminta slot untuk koneksi baru; None jika diterima, selain itu (kode, alasan, label)"""
+        rejection = self._check_ip(ip)
+        if rejection is not None:
+            return rejection
+        self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+
+        if not self._has_room() or self._waiters:
+            if len(self._waiters) >= self.queue_size:
+                self._release_ip(ip)
+                return self._retry("full")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # Slot sudah dipesankan _wake tepat sebelum timeout/cancel
+                    if isinstance(e, asyncio.TimeoutError):
+                        return None
+                    self.auth_finished()
+                    self.release(ip)
+                    raise
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                self._release_ip(ip)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return self._retry("queue_timeout")
+            # Slot sudah dipesankan oleh _wake
+            return None
+
+        self.active += 1
+        self.authenticating += 1
+        return None
+
+    def _wake(self) -> None:
+        """Memberikan slot kosong ke koneksi terlama di antrian tunggu"""
+        while self._waiters and self._has_room():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.active += 1
+            self.authenticating += 1
+            waiter.set_result(None)
+
+    def auth_finished(self) -> None:
+        """Autentikasi koneksi selesai (berhasil atau gagal)"""
+        self.authenticating -= 1
+        self._wake()
+
+    def release(self, ip: str) -> None:
+        """Koneksi ditutup, slot dan kuota IP dikembalikan"""
+        self.active -= 1
+        self._release_ip(ip)
+        self._wake()
+
+    def _release_ip(self, ip: str) -> None:
+        count = self.per_ip.get(ip, 0) - 1
+        if count > 0:
+            self.per_ip[ip] = count
+            return
+        self.per_ip.pop(ip, None)
+        if ip in self._ip_slots:
+            self._schedule_ip_expiry(ip)
+
+    def _schedule_ip_expiry(self, ip: str) -> None:
+        """Bucket IP dibuang setelah terisi penuh lagi, bukan langsung saat koneksi terakhir pergi"""
+        if self.expiry is None:
+            return
+        refill = self.ip_buckets.burst / self.ip_buckets.rate if self.ip_buckets.rate > 0 else 0
+        self.expiry.schedule(("ip", ip), refill, self._expire_ip)
+
+    def _expire_ip(self, key) -> None:
+        ip = key[1]
+        if ip not in self.per_ip:
+            slot = self._ip_slots.pop(ip, None)
+            if slot is not None:
+                self.ip_buckets.release(slot)
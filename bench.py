@@ -0,0 +1,685 @@
+# bench.py
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+# Jeda singkat setelah login agar pesan kontrol awal (riwayat, room) selesai terkirim
+SERVER_WARMUP = 0.5
+# Prefix isi pesan yang membawa waktu kirim untuk mengukur latensi fan-out
+LATENCY_PREFIX = "lat "
+# Interval sampling CPU/RSS server (detik)
+MONITOR_INTERVAL = 0.5
+LOAD_MODES = ("steady", "churn", "reconnect", "slow")
+# Opsi server untuk setiap varian skenario diagnostics; off adalah acuan overhead
+DIAGNOSTICS_VARIANTS = {
+    "off": [],
+    "lag": ["--loop-lag-ms", "100"],
+    "stages": ["--stage-timing"],
+    "all": ["--loop-lag-ms", "100", "--stage-timing", "--profile-endpoint"],
+}
+
+
+def start_server(port: int, workers: int, max_connections: int, extra_args=(),
+                 script: str = SERVER_SCRIPT) -> subprocess.Popen:
+    """Menjalankan server.py (bawaan: milik checkout ini) sebagai subprocess untuk benchmark"""
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(script),
+         "--port", str(port),
+         "--workers", str(workers),
+         "--max-connections", str(max_connections),
+         "--allowed-hours", "0-24",
+         # Semua klien benchmark memakai satu akun dan satu IP, batas per pengguna/IP dimatikan
+         "--rate-limit", "0", "--user-rate-limit", "0",
+         "--max-connections-per-ip", "0", "--ip-connect-rate", "0",
+         # Reconnect storm menunggu di antrian admission alih-alih ditolak
+         "--admission-queue-size", str(max_connections),
+         *extra_args],
+        cwd=os.path.dirname(os.path.abspath(script)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    """Menghentikan server benchmark"""
+    process.terminate()
+    try:
+        process.wait(15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def wait_for_port(host: str, port: int, timeout: float = 10) -> None:
+    """Menunggu sampai server menerima koneksi TCP"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def login(uri: str, username: str, password: str):
+    """Membuka koneksi dan menyelesaikan autentikasi, mengembalikan (websocket, token)"""
+    websocket = await websockets.connect(uri, max_queue=None)
+    await websocket.recv()
+    await websocket.send(json.dumps({"username": username}))
+    await websocket.recv()
+    await websocket.send(json.dumps({"password": password}))
+    data = json.loads(await websocket.recv())
+    return websocket, data["token"]
+
+
+async def run_throughput(uri: str, clients: int, senders: int, messages: int,
+                         username: str, password: str, timeout: float) -> dict:
+    """Mengukur jumlah pesan broadcast yang terkirim per detik"""
+    sessions = await asyncio.gather(*[login(uri, username, password) for _ in range(clients)])
+    await asyncio.sleep(SERVER_WARMUP)
+
+    expected = senders * messages
+    received = [0] * clients
+    done = asyncio.Event()
+    remaining = [clients]
+
+    async def reader(index, websocket):
+        async for frame in websocket:
+            decoded = json.loads(frame)
+            for data in decoded if isinstance(decoded, list) else (decoded,):
+                # Seperti SimClient: presence dan pesan kontrol lain tidak dihitung
+                if "type" in data or "seq" not in data:
+                    continue
+                received[index] += 1
+                if received[index] == expected:
+                    remaining[0] -= 1
+                    if remaining[0] == 0:
+                        done.set()
+                    return
+
+    async def sender(websocket, token):
+        for i in range(messages):
+            await websocket.send(json.dumps({"token": token, "message": f"bench {i}", "timestamp": ""}))
+
+    readers = [asyncio.create_task(reader(i, ws)) for i, (ws, _) in enumerate(sessions)]
+    start = time.perf_counter()
+    await asyncio.gather(*[sender(ws, token) for ws, token in sessions[:senders]])
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - start
+
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*[ws.close() for ws, _ in sessions], return_exceptions=True)
+
+    delivered = sum(received)
+    return {
+        "clients": clients,
+        "senders": senders,
+        "messages_sent": expected,
+        "messages_delivered": delivered,
+        "delivery_ratio": delivered / (expected * clients),
+        "elapsed_s": round(elapsed, 3),
+        "delivered_per_s": round(delivered / elapsed, 1),
+    }
+
+
+class SimClient:
+    """Klien simulasi headless: login, membaca broadcast, dan mencatat latensi"""
+
+    def __init__(self, uri: str, slow_delay: float = 0.0):
+        self.uri = uri
+        self.slow_delay = slow_delay
+        self.websocket = None
+        self.token = None
+        self.last_seq = 0
+        self.received = 0
+        self.frames = 0
+        self.latencies: list = []
+        self.reader = None
+
+    async def connect(self, username: str, password: str) -> None:
+        self.websocket, self.token = await login(self.uri, username, password)
+        self.reader = asyncio.create_task(self.read())
+
+    async def resume(self) -> float:
+        """Tersambung ulang dengan token lama, mengembalikan lama reconnect (detik)"""
+        start = time.perf_counter()
+        websocket = await websockets.connect(self.uri, max_queue=None)
+        await websocket.recv()
+        await websocket.send(json.dumps({"type": "resume", "token": self.token,
+                                         "since": self.last_seq or None}))
+        while True:
+            data = json.loads(await websocket.recv())
+            if data.get("type") == "auth_success":
+                break
+            if data.get("type") == "resume_failed":
+                await websocket.close()
+                raise RuntimeError("resume ditolak server")
+        self.websocket = websocket
+        self.reader = asyncio.create_task(self.read())
+        return time.perf_counter() - start
+
+    async def read(self) -> None:
+        try:
+            async for frame in self.websocket:
+                now = time.perf_counter()
+                self.frames += 1
+                decoded = json.loads(frame)
+                for data in decoded if isinstance(decoded, list) else (decoded,):
+                    # Hanya pesan chat live; riwayat dan pesan kontrol selalu punya "type"
+                    if "type" in data or "seq" not in data:
+                        continue
+                    self.last_seq = max(self.last_seq, data["seq"])
+                    self.received += 1
+                    body = data.get("message", "")
+                    if body.startswith(LATENCY_PREFIX):
+                        self.latencies.append(now - float(body[len(LATENCY_PREFIX):]))
+                    if self.slow_delay:
+                        await asyncio.sleep(self.slow_delay)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def send(self, data: dict) -> bool:
+        data["token"] = self.token
+        try:
+            await self.websocket.send(json.dumps(data))
+            return True
+        except websockets.exceptions.ConnectionClosed:
+            return False
+
+    async def close(self) -> None:
+        if self.reader is not None:
+            self.reader.cancel()
+        if self.websocket is not None:
+            await self.websocket.close()
+
+
+def process_tree(pid: int) -> list:
+    """Daftar pid proses beserta semua turunannya dari /proc"""
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def sample_process(pid: int):
+    """Total waktu CPU (detik) dan RSS (byte) proses server beserta worker-nya"""
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    cpu, rss = 0.0, 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                # Lewati nama proses (bisa berisi spasi) sebelum membaca field
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{current}/statm") as f:
+                resident = int(f.read().split()[1])
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+        rss += resident * page
+    return cpu, rss
+
+
+async def monitor_server(pid: int, stop: asyncio.Event) -> int:
+    """Mencatat RSS tertinggi server selama benchmark"""
+    peak = 0
+    while not stop.is_set():
+        peak = max(peak, sample_process(pid)[1])
+        try:
+            await asyncio.wait_for(stop.wait(), MONITOR_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+    return peak
+
+
+def percentiles(samples: list) -> dict:
+    """p50/p99/p999/max dalam milidetik"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+
+    def at(q):
+        return round(ordered[int(q * last)] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": at(0.5), "p99_ms": at(0.99),
+            "p999_ms": at(0.999), "max_ms": at(1.0)}
+
+
+async def send_at_rate(clients: list, rate: float, duration: float) -> int:
+    """Mengirim pesan berlatensi dari clients dengan total laju rate pesan/detik"""
+    interval = len(clients) / rate
+    start = time.perf_counter()
+    end = start + duration
+    sent = [0]
+
+    async def run(client, offset):
+        next_send = start + offset
+        while next_send < end:
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            body = f"{LATENCY_PREFIX}{time.perf_counter()!r}"
+            if await client.send({"message": body, "timestamp": ""}):
+                sent[0] += 1
+            next_send += interval
+
+    await asyncio.gather(*[run(client, i * interval / len(clients)) for i, client in enumerate(clients)])
+    return sent[0]
+
+
+async def churn_rooms(clients: list, rate: float, stop: asyncio.Event) -> int:
+    """Setiap klien bergantian join/leave room churn dengan laju rate operasi/detik"""
+    operations = [0]
+
+    async def run(index, client):
+        room = f"churn-{index % 8}"
+        joined = False
+        while not stop.is_set():
+            msg_type = "leave" if joined else "join"
+            if await client.send({"type": msg_type, "room": room}):
+                operations[0] += 1
+                joined = not joined
+            try:
+                await asyncio.wait_for(stop.wait(), 1 / rate)
+            except asyncio.TimeoutError:
+                pass
+
+    await asyncio.gather(*[run(i, client) for i, client in enumerate(clients)])
+    return operations[0]
+
+
+async def reconnect_storm(clients: list, delay: float) -> dict:
+    """Memutus semua clients bersamaan setelah delay lalu resume serentak"""
+    await asyncio.sleep(delay)
+    await asyncio.gather(*[client.close() for client in clients], return_exceptions=True)
+    outcomes = await asyncio.gather(*[client.resume() for client in clients], return_exceptions=True)
+    durations = [outcome for outcome in outcomes if isinstance(outcome, float)]
+    result = percentiles(durations)
+    result["failed"] = len(outcomes) - len(durations)
+    return result
+
+
+async def run_load(args, mode: str, server_args=()) -> dict:
+    """Menjalankan satu skenario load terhadap server.py baru"""
+    uri = f"ws://localhost:{args.port}"
+    process = start_server(args.port, args.workers, args.clients + 10, server_args)
+    try:
+        await wait_for_port("localhost", args.port)
+        await asyncio.sleep(1 + 0.5 * args.workers)
+
+        slow_count = int(args.clients * args.slow_fraction) if mode == "slow" else 0
+        clients = [SimClient(uri, args.slow_delay if i >= args.clients - slow_count else 0.0)
+                   for i in range(args.clients)]
+        gate = asyncio.Semaphore(args.login_concurrency)
+
+        async def connect(client):
+            async with gate:
+                await client.connect(args.username, args.password)
+
+        start = time.perf_counter()
+        # Login pertama mengisi cache verifikasi server, sisanya serentak
+        await connect(clients[0])
+        await asyncio.gather(*[connect(client) for client in clients[1:]])
+        login_elapsed = time.perf_counter() - start
+        await asyncio.sleep(SERVER_WARMUP)
+
+        # Pengirim diambil dari depan, klien lambat/churn/reconnect dari belakang
+        senders = clients[:args.senders]
+        tail = clients[args.senders:]
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(monitor_server(process.pid, stop))
+        cpu_start, _ = sample_process(process.pid)
+        extra = {}
+        background = None
+        if mode == "churn":
+            churners = tail[len(tail) - int(len(tail) * args.churn_fraction):]
+            background = asyncio.create_task(churn_rooms(churners, args.churn_rate, stop))
+            extra["churn_clients"] = len(churners)
+        elif mode == "reconnect":
+            storm = tail[len(tail) - int(len(tail) * args.reconnect_fraction):]
+            background = asyncio.create_task(reconnect_storm(storm, args.duration / 2))
+            extra["reconnect_clients"] = len(storm)
+
+        start = time.perf_counter()
+        sent = await send_at_rate(senders, args.rate, args.duration)
+        # Beri waktu pesan terakhir tersampaikan ke semua klien
+        await asyncio.sleep(args.drain)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        cpu_end, _ = sample_process(process.pid)
+        peak_rss = await monitor
+        if mode == "churn":
+            extra["churn_ops_per_s"] = round(await background / args.duration, 1)
+        elif mode == "reconnect":
+            extra["reconnect"] = await background
+
+        fast = clients[:args.clients - slow_count]
+        delivered = sum(client.received for client in clients)
+        frames = sum(client.frames for client in clients)
+        result = {
+            "mode": mode,
+            "workers": args.workers,
+            "clients": args.clients,
+            "senders": len(senders),
+            "target_rate": args.rate,
+            "login_s": round(login_elapsed, 3),
+            "messages_sent": sent,
+            "messages_delivered": delivered,
+            "delivery_ratio": round(delivered / (sent * args.clients), 4) if sent else 0,
+            "delivered_per_s": round(delivered / elapsed, 1),
+            "frames_per_message": round(frames / delivered, 3) if delivered else 0,
+            "latency": percentiles([x for client in fast for x in client.latencies]),
+            "server_cpu_percent": round((cpu_end - cpu_start) / elapsed * 100, 1),
+            "server_peak_rss_mb": round(peak_rss / 2**20, 1),
+        }
+        if slow_count:
+            slow = clients[-slow_count:]
+            result["slow_clients"] = slow_count
+            result["slow_latency"] = percentiles([x for client in slow for x in client.latencies])
+            result["slow_delivered"] = sum(client.received for client in slow)
+            result["slow_disconnected"] = sum(1 for client in slow if client.reader.done())
+        result.update(extra)
+        await asyncio.gather(*[client.close() for client in clients], return_exceptions=True)
+        return result
+    finally:
+        stop_server(process)
+
+
+async def bench_load(args) -> list:
+    """Menjalankan skenario load yang dipilih secara berurutan"""
+    return [await run_load(args, mode) for mode in args.modes]
+
+
+async def bench_batching(args) -> list:
+    """Mencari titik impas micro-batching: setiap laju pesan dicoba dengan beberapa window"""
+    results = []
+    for rate in args.rates:
+        for window in args.windows:
+            run_args = argparse.Namespace(**{**vars(args), "rate": rate})
+            result = await run_load(run_args, "steady",
+                                    ["--batch-window-ms", str(window), "--batch-max", str(args.batch_max)])
+            result["batch_window_ms"] = window
+            results.append(result)
+    return results
+
+
+async def bench_diagnostics(args) -> list:
+    """Mengukur overhead mode diagnostik terhadap server tanpa diagnostik pada beban steady"""
+    results = []
+    for variant in args.variants:
+        result = await run_load(args, "steady", DIAGNOSTICS_VARIANTS[variant])
+        result["diagnostics"] = variant
+        results.append(result)
+    base = results[0]
+    for result in results[1:]:
+        result["cpu_overhead_percent"] = round(result["server_cpu_percent"] - base["server_cpu_percent"], 1)
+        result["p50_overhead_ms"] = round(result["latency"].get("p50_ms", 0) - base["latency"].get("p50_ms", 0), 2)
+    return results
+
+
+async def bench_workers(args) -> list:
+    """Membandingkan throughput broadcast untuk beberapa jumlah worker"""
+    results = []
+    for workers in args.workers:
+        process = start_server(args.port, workers, args.clients)
+        try:
+            await wait_for_port("localhost", args.port)
+            # Beri waktu semua worker untuk bind dan tersambung ke bus
+            await asyncio.sleep(1 + 0.5 * workers)
+            result = await run_throughput(f"ws://localhost:{args.port}", args.clients, args.senders,
+                                          args.messages, args.username, args.password, args.timeout)
+        finally:
+            stop_server(process)
+        result["workers"] = workers
+        results.append(result)
+    return results
+
+
+async def measure_loop_stall(stop: asyncio.Event) -> float:
+    """Mengukur jeda terlama event loop selama benchmark berjalan (ms)"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - start - 0.001)
+    return worst * 1000
+
+
+async def bench_login(args) -> list:
+    """Membandingkan login/detik dengan verifikasi inline vs thread pool"""
+    import users
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = users.UserManager(os.path.join(tmp, "users.json"))
+        manager.add_user("bench", "bench-pass")
+
+        for mode in ("inline", "pool", "pool+cache"):
+            # Cache dimatikan kecuali untuk mode pool+cache
+            users.VERIFY_CACHE_SIZE = 1024 if mode == "pool+cache" else 0
+            manager._cache.clear()
+
+            async def login_inline():
+                # Seperti handle_authentication lama: hash dihitung langsung di event loop
+                manager.verify_credentials("bench", "bench-pass")
+                await asyncio.sleep(0)
+
+            async def login_pool():
+                await manager.verify_credentials_async("bench", "bench-pass")
+
+            login = login_inline if mode == "inline" else login_pool
+            if mode == "pool+cache":
+                # Isi cache dulu, seperti login ulang setelah server restart
+                await login_pool()
+            stop = asyncio.Event()
+            stall_task = asyncio.create_task(measure_loop_stall(stop))
+            start = time.perf_counter()
+            await asyncio.gather(*[login() for _ in range(args.logins)])
+            elapsed = time.perf_counter() - start
+            stop.set()
+            results.append({
+                "mode": mode,
+                "logins": args.logins,
+                "elapsed_s": round(elapsed, 3),
+                "logins_per_s": round(args.logins / elapsed, 1),
+                "loop_max_stall_ms": round(await stall_task, 2),
+            })
+    return results
+
+
+def bench_codec(args) -> list:
+    """Membandingkan ukuran dan biaya encode/decode codec JSON vs biner, dengan dan tanpa deflate"""
+    import random
+    import string
+    import zlib
+    from codec import BINARY_CODEC, JSON_CODEC, OutgoingFrame
+
+    # Isi pesan acak (seed tetap) supaya deflate tidak diuntungkan pesan yang identik
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(2000)]
+
+    def make_body():
+        text = ""
+        while len(text) < args.body_size:
+            text += rng.choice(words) + " "
+        return text[:args.body_size]
+
+    body = make_body()
+    ts = int(time.time() * 1000)
+    token = "a" * 43  # panjang token_urlsafe(32)
+    # Arah klien->server: JSON selalu membawa token, biner terikat ke koneksi
+    publish = {"type": "publish", "room": "umum", "message": body, "ts": ts}
+    chats = [{"seq": 1000000 + i, "room": "umum", "username": args.username, "message": make_body(),
+              "timestamp": "12:00:00", "ts": ts + i} for i in range(args.messages)]
+
+    results = []
+    for name, codec in (("json", JSON_CODEC), ("binary", BINARY_CODEC)):
+        outgoing = dict(publish, token=token) if codec is JSON_CODEC else publish
+
+        start = time.perf_counter()
+        for _ in range(args.messages):
+            frame = codec.encode(outgoing)
+        publish_encode = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.messages):
+            codec.decode(frame)
+        publish_decode = time.perf_counter() - start
+        publish_size = len(frame if isinstance(frame, bytes) else frame.encode())
+
+        # Arah server->klien: frame chat seperti yang dibangun fanout
+        texts = [json.dumps(chat) for chat in chats]
+        start = time.perf_counter()
+        frames = [OutgoingFrame(text, chat).encode(codec) for text, chat in zip(texts, chats)]
+        chat_encode = time.perf_counter() - start
+        start = time.perf_counter()
+        for frame in frames:
+            codec.decode(frame)
+        chat_decode = time.perf_counter() - start
+        payloads = [frame if isinstance(frame, bytes) else frame.encode() for frame in frames]
+
+        # permessage-deflate dengan context takeover, parameter sama seperti server
+        compressor = zlib.compressobj(args.deflate_level, zlib.DEFLATED, -args.deflate_window_bits,
+                                      args.deflate_mem_level)
+        start = time.perf_counter()
+        compressed = sum(len(compressor.compress(p) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+                         for p in payloads)
+        deflate_time = time.perf_counter() - start
+
+        n = args.messages
+        results.append({
+            "codec": name,
+            "body_size": args.body_size,
+            "publish_bytes": publish_size,
+            "publish_encode_us": round(publish_encode / n * 1e6, 2),
+            "publish_decode_us": round(publish_decode / n * 1e6, 2),
+            "chat_bytes": round(sum(len(p) for p in payloads) / n, 1),
+            "chat_deflate_bytes": round(compressed / n, 1),
+            "chat_encode_us": round(chat_encode / n * 1e6, 2),
+            "chat_decode_us": round(chat_decode / n * 1e6, 2),
+            "deflate_us": round(deflate_time / n * 1e6, 2),
+        })
+    return results
+
+
+def parse_args(argv=None):
+    """Membaca argumen CLI benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark server chat WebSocket")
+    sub = parser.add_subparsers(dest="scenario", required=True)
+
+    workers = sub.add_parser("workers", help="bandingkan throughput 1 worker vs N worker")
+    workers.add_argument("--workers", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4],
+                         help="daftar jumlah worker, misalnya 1,4")
+    workers.add_argument("--clients", type=int, default=200)
+    workers.add_argument("--senders", type=int, default=10)
+    workers.add_argument("--messages", type=int, default=50, help="pesan per pengirim")
+    workers.add_argument("--timeout", type=float, default=60)
+
+    login = sub.add_parser("login", help="bandingkan login/detik dengan dan tanpa thread pool")
+    login.add_argument("--logins", type=int, default=100)
+
+    load = sub.add_parser("load", help="ribuan klien simulasi: latensi fan-out, CPU, dan RSS server")
+    load.add_argument("--modes", type=lambda v: v.split(","), default=list(LOAD_MODES),
+                      help="daftar skenario: steady,churn,reconnect,slow")
+    load.add_argument("--workers", type=int, default=1)
+    load.add_argument("--clients", type=int, default=200)
+    load.add_argument("--senders", type=int, default=10)
+    load.add_argument("--rate", type=float, default=20, help="total pesan/detik dari semua pengirim")
+    load.add_argument("--duration", type=float, default=10, help="lama pengiriman (detik)")
+    load.add_argument("--drain", type=float, default=2, help="jeda menunggu sisa pesan (detik)")
+    load.add_argument("--login-concurrency", type=int, default=50)
+    load.add_argument("--churn-fraction", type=float, default=0.2)
+    load.add_argument("--churn-rate", type=float, default=2, help="join/leave per detik per klien")
+    load.add_argument("--reconnect-fraction", type=float, default=0.5)
+    load.add_argument("--slow-fraction", type=float, default=0.1)
+    load.add_argument("--slow-delay", type=float, default=0.05, help="jeda baca per pesan klien lambat")
+
+    batching = sub.add_parser("batching", help="bandingkan micro-batching untuk beberapa window dan laju")
+    batching.add_argument("--windows", type=lambda v: [float(x) for x in v.split(",")], default=[0, 2, 5, 10],
+                          help="daftar window batch dalam ms, 0 = tanpa batching")
+    batching.add_argument("--rates", type=lambda v: [float(x) for x in v.split(",")], default=[5, 50, 200],
+                          help="daftar total laju pesan/detik")
+    batching.add_argument("--batch-max", type=int, default=32)
+    batching.add_argument("--workers", type=int, default=1)
+    batching.add_argument("--clients", type=int, default=200)
+    batching.add_argument("--senders", type=int, default=10)
+    batching.add_argument("--duration", type=float, default=8)
+    batching.add_argument("--drain", type=float, default=2)
+    batching.add_argument("--login-concurrency", type=int, default=50)
+
+    diagnostics = sub.add_parser("diagnostics", help="overhead monitor lag, stage timing, dan profiler")
+    diagnostics.add_argument("--variants", type=lambda v: v.split(","), default=list(DIAGNOSTICS_VARIANTS),
+                             help="daftar varian: off,lag,stages,all; yang pertama menjadi acuan")
+    diagnostics.add_argument("--workers", type=int, default=1)
+    diagnostics.add_argument("--clients", type=int, default=200)
+    diagnostics.add_argument("--senders", type=int, default=10)
+    diagnostics.add_argument("--rate", type=float, default=50, help="total pesan/detik dari semua pengirim")
+    diagnostics.add_argument("--duration", type=float, default=10)
+    diagnostics.add_argument("--drain", type=float, default=2)
+    diagnostics.add_argument("--login-concurrency", type=int, default=50)
+
+    codec = sub.add_parser("codec", help="bandingkan ukuran dan CPU codec JSON vs biner")
+    codec.add_argument("--messages", type=int, default=20000)
+    codec.add_argument("--body-size", type=int, default=40, help="panjang isi pesan (karakter)")
+    codec.add_argument("--deflate-window-bits", type=int, default=12)
+    codec.add_argument("--deflate-mem-level", type=int, default=5)
+    codec.add_argument("--deflate-level", type=int, default=6)
+
+    for scenario in (workers, login, load, batching, diagnostics, codec):
+        scenario.add_argument("--port", type=int, default=8799)
+        scenario.add_argument("--username", default="atha")
+        scenario.add_argument("--password", default="pass123")
+        scenario.add_argument("--output", help="simpan hasil JSON ke file ini")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.scenario == "workers":
+        results = asyncio.run(bench_workers(args))
+    elif args.scenario == "login":
+        results = asyncio.run(bench_login(args))
+    elif args.scenario == "load":
+        for mode in args.modes:
+            if mode not in LOAD_MODES:
+                raise SystemExit(f"skenario load tidak dikenal: {mode}")
+        results = asyncio.run(bench_load(args))
+    elif args.scenario == "batching":
+        results = asyncio.run(bench_batching(args))
+    elif args.scenario == "diagnostics":
+        for variant in args.variants:
+            if variant not in DIAGNOSTICS_VARIANTS:
+                raise SystemExit(f"varian diagnostics tidak dikenal: {variant}")
+        results = asyncio.run(bench_diagnostics(args))
+    elif args.scenario == "codec":
+        results = bench_codec(args)
+    output = json.dumps({"scenario": args.scenario, "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
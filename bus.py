@@ -0,0 +1,268 @@
+# bus.py
+import asyncio
+import json
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from history import MessageLog
+
+logger = logging.getLogger(__name__)
+
+# Batas panjang satu baris di bus, harus lebih besar dari max_size websocket
+LINE_LIMIT = 2 ** 21
+# Batas data yang menunggu terkirim ke satu ujung bus; ujung yang tertahan lebih dari ini
+# diputus agar memori hub tidak tumbuh tanpa batas
+MAX_WRITE_BUFFER = 32 * LINE_LIMIT
+
+# Jenis baris di bus (byte pertama setiap baris)
+OP_PUBLISH = b"P"
+OP_TOKEN = b"T"
+OP_DIRECT = b"D"
+OP_PRESENCE = b"U"
+
+
+class BusHub:
+    """Hub pub/sub lokal lewat Unix domain socket yang meneruskan pesan antar worker"""
+
+    def __init__(self, path: str, log: Optional[MessageLog] = None, max_buffer: int = MAX_WRITE_BUFFER):
+        self.path = path
+        self.max_buffer = max_buffer
+        # Hub memberi nomor urut global dan satu-satunya penulis log riwayat
+        self.log = log
+        self.last_seq = log.last_seq if log is not None else 0
+        self.server = None
+        self.writers: Set[asyncio.StreamWriter] = set()
+        # Salinan token agar worker yang baru tersambung langsung menerima semuanya
+        self.tokens: Dict[str, Tuple[str, float]] = {}
+        self._token_writes = 0
+        # Pengguna yang punya sesi di setiap worker, untuk snapshot worker baru dan
+        # membersihkan roster worker lain saat sebuah worker mati
+        self.presence: Dict[asyncio.StreamWriter, Set[str]] = {}
+
+    async def start(self) -> None:
+        """Mulai mendengarkan koneksi worker"""
+        self.server = await asyncio.start_unix_server(self._handle_worker, self.path, limit=LINE_LIMIT)
+
+    def _prune_tokens(self) -> None:
+        """Membuang token kadaluarsa dari salinan hub"""
+        now = time.time()
+        expired = [token for token, (_, expiry) in self.tokens.items() if expiry <= now]
+        for token in expired:
+            del self.tokens[token]
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Membaca baris dari satu worker lalu meneruskannya ke worker lain"""
+        self._prune_tokens()
+        now = time.time()
+        for token, (username, expiry) in self.tokens.items():
+            writer.write(_token_line(token, username, expiry - now))
+        # Satu entri per worker yang melaporkan pengguna, sama seperti diff dari bus
+        online = [username for users in self.presence.values() for username in users]
+        if online:
+            writer.write(_presence_line(online, []))
+        self.writers.add(writer)
+        self.presence[writer] = set()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line[:1] == OP_PUBLISH:
+                    line = self._sequence(line)
+                    for other in list(self.writers):
+                        self._forward(other, line)
+                    continue
+                if line[:1] == OP_TOKEN:
+                    try:
+                        data = json.loads(line[1:])
+                        self.tokens[data["token"]] = (data["username"], time.time() + data["ttl"])
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.error(f"Baris token tidak valid dari worker dilewati: {e}")
+                        continue
+                    self._token_writes += 1
+                    if self._token_writes % 1000 == 0:
+                        self._prune_tokens()
+                elif line[:1] == OP_PRESENCE:
+                    try:
+                        data = json.loads(line[1:])
+                        users = self.presence[writer]
+                        users.update(data["joined"])
+                        users.difference_update(data["left"])
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.error(f"Baris presence tidak valid dari worker dilewati: {e}")
+                        continue
+                for other in list(self.writers):
+                    if other is not writer:
+                        self._forward(other, line)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Koneksi worker ke bus terputus: {e}")
+        except Exception as e:
+            logger.error(f"Error pada bus hub: {e}")
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+            # Pengguna worker yang terputus tidak lagi dihitung online di worker lain
+            users = self.presence.pop(writer, ())
+            if users:
+                line = _presence_line([], sorted(users))
+                for other in list(self.writers):
+                    self._forward(other, line)
+
+    def _forward(self, writer: asyncio.StreamWriter, line: bytes) -> None:
+        """Menulis baris ke satu worker; worker yang tidak membaca diputus lalu dijalankan ulang"""
+        if not _write_bounded(writer, line, self.max_buffer):
+            logger.error("Worker tertinggal membaca bus, koneksinya diputus")
+            self.writers.discard(writer)
+
+    def _sequence(self, line: bytes) -> bytes:
+        """Memberi seq pada frame publish dan mencatatnya ke log riwayat"""
+        room, _, frame = line[1:-1].partition(b"\t")
+        self.last_seq += 1
+        seq = self.last_seq
+        # Frame selalu berupa objek JSON, seq disisipkan sebagai field pertama tanpa parse ulang
+        frame = b'{"seq": %d, ' % seq + frame[1:]
+        if self.log is not None:
+            self.log.append(seq, frame)
+        return OP_PUBLISH + b"%d\t%s\t%s\n" % (seq, room, frame)
+
+    async def close(self) -> None:
+        """Menutup hub dan semua koneksi worker"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.writers):
+            writer.close()
+        self.writers.clear()
+
+
+def _write_bounded(writer: asyncio.StreamWriter, line: bytes, max_buffer: int) -> bool:
+    """Menulis tanpa menunggu; jika buffer kirim melewati max_buffer koneksi diputus paksa"""
+    transport = writer.transport
+    if transport.is_closing():
+        return False
+    if transport.get_write_buffer_size() > max_buffer:
+        transport.abort()
+        return False
+    writer.write(line)
+    return True
+
+
+def _presence_line(joined: List[str], left: List[str]) -> bytes:
+    """Membuat baris bus untuk perubahan presence"""
+    payload = json.dumps({"joined": joined, "left": left})
+    return OP_PRESENCE + payload.encode() + b"\n"
+
+
+def _token_line(token: str, username: str, ttl: float) -> bytes:
+    """Membuat baris bus untuk replikasi token"""
+    payload = json.dumps({"token": token, "username": username, "ttl": ttl})
+    return OP_TOKEN + payload.encode() + b"\n"
+
+
+class BusClient:
+    """Sisi worker dari bus: mengirim broadcast lokal dan menerima broadcast worker lain
+
+    Jika koneksi ke hub putus, on_lost dipanggil sekali. Worker tidak tersambung ulang
+    sendiri karena frame selama putus sudah hilang; proses worker berhenti dan Cluster
+    menjalankannya ulang dengan state baru dari hub.
+    """
+
+    def __init__(self, path: str, on_frame: Callable[[int, str, str], None],
+                 on_token: Callable[[str, str, float], None],
+                 on_direct: Optional[Callable[[List[str], str], None]] = None,
+                 on_presence: Optional[Callable[[List[str], List[str]], None]] = None,
+                 on_lost: Optional[Callable[[], None]] = None, max_buffer: int = MAX_WRITE_BUFFER):
+        self.path = path
+        self.on_frame = on_frame
+        self.on_token = on_token
+        self.on_direct = on_direct
+        self.on_presence = on_presence
+        self.on_lost = on_lost
+        self.max_buffer = max_buffer
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        """Tersambung ke hub dan mulai membaca baris masuk"""
+        reader, self.writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+        self._task = asyncio.create_task(self._reader(reader))
+
+    async def _reader(self, reader: asyncio.StreamReader) -> None:
+        """Meneruskan baris dari hub ke callback worker"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    logger.error("Koneksi ke bus ditutup oleh hub")
+                    break
+                try:
+                    self._dispatch(line)
+                except (ValueError, KeyError, TypeError) as e:
+                    # Satu baris rusak dilewati, koneksi ke hub tetap dipakai
+                    logger.error(f"Baris bus tidak valid dilewati: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error saat membaca bus: {e}")
+        self._lost()
+
+    def _dispatch(self, line: bytes) -> None:
+        op = line[:1]
+        if op == OP_PUBLISH:
+            seq, room, frame = line[1:-1].decode().split("\t", 2)
+            self.on_frame(int(seq), room, frame)
+        elif op == OP_TOKEN:
+            data = json.loads(line[1:])
+            self.on_token(data["token"], data["username"], data["ttl"])
+        elif op == OP_DIRECT and self.on_direct is not None:
+            data = json.loads(line[1:])
+            self.on_direct(data["to"], data["frame"])
+        elif op == OP_PRESENCE and self.on_presence is not None:
+            data = json.loads(line[1:])
+            self.on_presence(data["joined"], data["left"])
+
+    def _lost(self) -> None:
+        """Menandai koneksi ke hub putus; publish berikutnya tidak lagi ditulis"""
+        writer, self.writer = self.writer, None
+        if writer is None:
+            return
+        writer.transport.abort()
+        if self.on_lost is not None:
+            self.on_lost()
+
+    def _write(self, line: bytes) -> None:
+        if self.writer is None:
+            return
+        if not _write_bounded(self.writer, line, self.max_buffer):
+            logger.error("Hub tidak membaca bus, koneksi diputus")
+            self._lost()
+
+    def publish(self, room: str, frame: str) -> None:
+        """Mengirim frame broadcast sebuah room ke hub untuk diberi seq dan diteruskan ke semua worker"""
+        # Nama room tidak pernah berisi tab (lihat rooms.ROOM_NAME_PATTERN)
+        self._write(OP_PUBLISH + f"{room}\t{frame}".encode() + b"\n")
+
+    def publish_token(self, token: str, username: str, ttl: float) -> None:
+        """Mereplikasi token baru ke worker lain"""
+        self._write(_token_line(token, username, ttl))
+
+    def publish_direct(self, usernames: List[str], frame: str) -> None:
+        """Meneruskan pesan langsung ke worker lain, masing-masing mengirim ke koneksi lokal penerima"""
+        payload = json.dumps({"to": usernames, "frame": frame})
+        self._write(OP_DIRECT + payload.encode() + b"\n")
+
+    def publish_presence(self, joined: List[str], left: List[str]) -> None:
+        """Mengirim perubahan sesi lokal (pengguna pertama kali/terakhir kali di worker ini)"""
+        self._write(_presence_line(joined, left))
+
+    async def close(self) -> None:
+        """Menutup koneksi ke hub"""
+        # on_lost tidak dipanggil untuk penutupan yang disengaja
+        self.on_lost = None
+        if self._task is not None:
+            self._task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,315 @@
+# chatcore.py
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, Optional, Set
+
+import websockets
+
+from codec import JSON_CODEC, SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON, codec_for
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOM = "umum"
+
+# Batas pesan yang menunggu dibaca pemakai; jika penuh pembacaan socket berhenti (backpressure TCP).
+# Pemakai yang tidak pernah membaca stream sebaiknya memakai inbox_size=0 (tanpa batas)
+INBOX_SIZE = 1024
+
+# Pesan kontrol autentikasi yang ditangani inti dan tidak diteruskan ke pemakai
+_HANDSHAKE_TYPES = ("auth_request", "password_request")
+
+# Penanda akhir stream pesan
+_CLOSED = object()
+
+Credentials = Callable[[str, str], Awaitable[str]]
+
+
+class AuthError(Exception):
+    """Autentikasi gagal atau kredensial tidak tersedia"""
+
+
+class ChatCore:
+    """Inti klien chat async tanpa I/O konsol: autentikasi, resume, stream pesan, dan kirim batch
+
+    Kredensial diberikan lewat username/password, atau callback async credentials(kind, prompt)
+    untuk frontend interaktif. Selama idle klien hanya menunggu socket, tanpa polling.
+    """
+
+    def __init__(self, uri: str = "ws://localhost:8765", username: Optional[str] = None,
+                 password: Optional[str] = None, binary: bool = False,
+                 credentials: Optional[Credentials] = None, inbox_size: int = INBOX_SIZE):
+        self.uri = uri
+        self.username = username
+        self.password = password
+        self.credentials = credentials
+        # Codec biner ditawarkan lewat subprotocol, JSON tetap jadi cadangan
+        self.subprotocols = [SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON] if binary else [SUBPROTOCOL_JSON]
+        self.codec = JSON_CODEC
+        self.inbox_size = inbox_size
+        self.websocket = None
+        self.auth_token = None
+        # Room yang diikuti dan room aktif tujuan pesan
+        self.rooms = {DEFAULT_ROOM}
+        self.room = DEFAULT_ROOM
+        # Seq pesan terakhir yang diterima, dipakai untuk meminta riwayat setelah reconnect
+        self.last_seq = 0
+        # True selama menunggu jawaban resume sesi
+        self.is_resuming = False
+        self.is_shutting_down = False
+        # True setelah server meminta reconnect (drain), pemakai sebaiknya connect() lagi tanpa backoff
+        self.reconnect_requested = False
+        # Roster lokal dari snapshot presence plus diff berversi
+        self.roster: Set[str] = set()
+        self.presence_epoch: Optional[str] = None
+        self.presence_version = 0
+        self._presence_resync = False
+        self.authenticated: Optional[asyncio.Future] = None
+        self._inbox: Optional[asyncio.Queue] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    @property
+    def is_authenticated(self) -> bool:
+        return (self.authenticated is not None and self.authenticated.done()
+                and not self.authenticated.cancelled() and self.authenticated.exception() is None)
+
+    async def connect(self, **options) -> "ChatCore":
+        """Membuka koneksi; token yang masih disimpan dipakai untuk resume sesi"""
+        options.setdefault("ping_interval", 20)
+        options.setdefault("ping_timeout", 10)
+        options.setdefault("close_timeout", 10)
+        self.websocket = await websockets.connect(self.uri, subprotocols=self.subprotocols, **options)
+        self.codec = codec_for(self.websocket.subprotocol)
+        self.authenticated = asyncio.get_running_loop().create_future()
+        self._inbox = asyncio.Queue(self.inbox_size)
+        self.is_shutting_down = False
+        self.is_resuming = False
+        self.reconnect_requested = False
+        self._presence_resync = False
+        if self.auth_token:
+            await self.send_resume()
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def login(self, timeout: Optional[float] = None) -> dict:
+        """Tersambung lalu menunggu autentikasi selesai, mengembalikan pesan auth_success"""
+        await self.connect()
+        return await self.wait_authenticated(timeout)
+
+    async def wait_authenticated(self, timeout: Optional[float] = None) -> dict:
+        """Menunggu future autentikasi; AuthError jika ditolak atau koneksi putus lebih dulu"""
+        return await asyncio.wait_for(asyncio.shield(self.authenticated), timeout)
+
+    async def send_resume(self) -> None:
+        """Melanjutkan sesi dengan token lama dalam satu round-trip"""
+        self.is_resuming = True
+        await self.websocket.send(self.codec.encode({
+            "type": "resume",
+            "token": self.auth_token,
+            # Klien yang belum menerima pesan apa pun tidak meminta replay riwayat
+            "since": self.last_seq or None,
+            "rooms": sorted(self.rooms),
+            "presence_epoch": self.presence_epoch,
+            "presence_version": self.presence_version
+        }))
+
+    def _prepare(self, data: dict) -> dict:
+        # Token hanya disertakan jika codec membutuhkannya
+        if self.auth_token and not self.codec.binds_auth:
+            data["token"] = self.auth_token
+        return data
+
+    async def send(self, data: dict) -> None:
+        """Mengirim satu pesan lewat codec aktif"""
+        await self.websocket.send(self.codec.encode(self._prepare(data)))
+
+    async def send_batch(self, messages: Iterable[dict]) -> None:
+        """Mengirim beberapa pesan sebagai satu frame batch, satu write dan satu wakeup server"""
+        frames = [self.codec.encode(self._prepare(data)) for data in messages]
+        if len(frames) == 1:
+            await self.websocket.send(frames[0])
+        elif frames:
+            await self.websocket.send(self.codec.encode_batch(frames))
+
+    def publish_message(self, message: str, room: Optional[str] = None) -> dict:
+        """Menyusun pesan publish untuk send atau send_batch"""
+        return {
+            "type": "publish",
+            "room": room or self.room,
+            "message": message,
+            "timestamp": time.strftime("%H:%M:%S"),
+            "ts": int(time.time() * 1000)
+        }
+
+    async def publish(self, message: str, room: Optional[str] = None) -> None:
+        await self.send(self.publish_message(message, room))
+
+    def direct_message(self, to: str, message: str) -> dict:
+        """Menyusun pesan langsung ke semua sesi seorang pengguna"""
+        return {
+            "type": "dm",
+            "to": to,
+            "message": message,
+            "timestamp": time.strftime("%H:%M:%S"),
+            "ts": int(time.time() * 1000)
+        }
+
+    async def send_direct(self, to: str, message: str) -> None:
+        await self.send(self.direct_message(to, message))
+
+    async def join(self, room: str) -> None:
+        await self.send({"type": "join", "room": room})
+
+    async def leave(self, room: Optional[str] = None) -> None:
+        await self.send({"type": "leave", "room": room or self.room})
+
+    async def request_history(self, since: int = 0, room: Optional[str] = None) -> None:
+        await self.send({"type": "history", "room": room or self.room, "since": since})
+
+    def search_request(self, query: str, **filters) -> dict:
+        """Frame pencarian; filter: room, user, from_ts, to_ts (ms), before (cursor), limit"""
+        return {"type": "search", "query": query,
+                **{key: value for key, value in filters.items() if value is not None}}
+
+    async def search(self, query: str, **filters) -> None:
+        await self.send(self.search_request(query, **filters))
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        if self.websocket is not None:
+            await self.websocket.close(code, reason)
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        """Pesan berikutnya dari server; berhenti saat koneksi tertutup"""
+        data = await self._inbox.get()
+        if data is _CLOSED:
+            # Dikembalikan agar iterasi berikutnya juga langsung berhenti
+            self._inbox.put_nowait(_CLOSED)
+            raise StopAsyncIteration
+        return data
+
+    async def _credential(self, kind: str, prompt: str) -> str:
+        value = getattr(self, kind)
+        if value is None and self.credentials is not None:
+            value = await self.credentials(kind, prompt)
+        if value is None:
+            raise AuthError(f"{kind} tidak tersedia")
+        return value
+
+    async def _read(self) -> None:
+        """Membaca frame dari socket, memperbarui state, lalu meneruskan pesan ke inbox"""
+        try:
+            async for frame in self.websocket:
+                try:
+                    decoded = self.codec.decode(frame)
+                except ValueError:
+                    logger.debug(f"Format pesan tidak valid: {frame!r}")
+                    continue
+                # Server dengan micro-batching mengirim beberapa pesan dalam satu frame
+                for data in decoded if isinstance(decoded, list) else (decoded,):
+                    if not isinstance(data, dict):
+                        continue
+                    if await self._handle(data):
+                        await self._inbox.put(data)
+                        if data.get("type") == "mailbox":
+                            # Pesan offline sudah diserahkan ke pemakai, server boleh menghapusnya
+                            await self.send({"type": "mailbox_ack", "id": data["last_id"]})
+        except websockets.exceptions.ConnectionClosed as e:
+            if not self.authenticated.done():
+                self.authenticated.set_exception(AuthError(f"Koneksi tertutup sebelum autentikasi: {e}"))
+        except AuthError as e:
+            if not self.authenticated.done():
+                self.authenticated.set_exception(e)
+            await self.websocket.close(1000, "Autentikasi dibatalkan")
+        finally:
+            if not self.authenticated.done():
+                self.authenticated.set_exception(AuthError("Koneksi tertutup sebelum autentikasi"))
+            # Future gagal yang tidak ditunggu tidak perlu memicu peringatan asyncio
+            if not self.authenticated.cancelled():
+                self.authenticated.exception()
+            if self._inbox.full():
+                # Inbox penuh: pesan terlama dibuang agar penanda akhir tetap masuk
+                self._inbox.get_nowait()
+            self._inbox.put_nowait(_CLOSED)
+
+    async def _handle(self, data: dict) -> bool:
+        """Memperbarui state dari satu pesan server; False jika pesan hanya untuk inti klien"""
+        msg_type = data.get("type")
+        if msg_type is None:
+            self.last_seq = max(self.last_seq, data.get("seq", 0))
+            return True
+        if msg_type in _HANDSHAKE_TYPES:
+            if self.is_resuming:
+                # Permintaan username diabaikan karena resume sudah dikirim
+                return False
+            if msg_type == "auth_request":
+                username = await self._credential("username", data.get("message", "Username"))
+                await self.websocket.send(self.codec.encode({"username": username}))
+            else:
+                password = await self._credential("password", data.get("message", "Password"))
+                await self.websocket.send(self.codec.encode({"password": password}))
+            return False
+        if msg_type == "auth_success":
+            self.auth_token = data["token"]
+            self.is_resuming = False
+            if not self.authenticated.done():
+                self.authenticated.set_result(data)
+            if self.last_seq and not data.get("resumed"):
+                # Minta pesan yang terlewat selama terputus
+                await self.send({"type": "history", "since": self.last_seq})
+        elif msg_type == "resume_failed":
+            # Token sudah tidak berlaku, lanjut login biasa
+            self.is_resuming = False
+            self.auth_token = None
+            self.rooms = {DEFAULT_ROOM}
+            self.room = DEFAULT_ROOM
+        elif msg_type == "history":
+            for item in data["messages"]:
+                self.last_seq = max(self.last_seq, item.get("seq", 0))
+        elif msg_type == "room_joined":
+            self.rooms.add(data["room"])
+            self.room = data["room"]
+        elif msg_type == "room_left":
+            self.rooms.discard(data["room"])
+            if self.room == data["room"]:
+                self.room = next(iter(self.rooms), None)
+        elif msg_type == "presence_snapshot":
+            self.roster = set(data["users"])
+            self.presence_epoch = data["epoch"]
+            self.presence_version = data["version"]
+            self._presence_resync = False
+        elif msg_type == "presence":
+            return await self._apply_presence(data)
+        elif msg_type == "reconnect":
+            # Server sedang restart; jeda dari server menyebar reconnect semua klien
+            self.reconnect_requested = True
+            asyncio.create_task(self._reconnect_after(self.websocket, data.get("delay_ms", 0) / 1000))
+        elif msg_type in ("server_shutdown", "server_closed"):
+            self.is_shutting_down = True
+        return True
+
+    async def _apply_presence(self, data: dict) -> bool:
+        """Menerapkan diff presence; celah versi memicu permintaan resync ke server"""
+        same_epoch = data["epoch"] == self.presence_epoch
+        if same_epoch and data["version"] <= self.presence_version:
+            # Diff lama yang sudah tercakup hasil resync
+            return False
+        if not same_epoch or data["base"] != self.presence_version:
+            if not self._presence_resync:
+                self._presence_resync = True
+                await self.send({"type": "presence", "epoch": self.presence_epoch, "since": self.presence_version})
+            return False
+        self.roster.update(data["joined"])
+        self.roster.difference_update(data["left"])
+        self.presence_version = data["version"]
+        self._presence_resync = False
+        return True
+
+    async def _reconnect_after(self, websocket, delay: float) -> None:
+        """Menutup koneksi setelah jeda agar pemakai tersambung ulang dengan resume"""
+        await asyncio.sleep(delay)
+        await websocket.close(1000, "Reconnect")
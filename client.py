@@ -1,149 +1,195 @@
 import asyncio
-import json
 import datetime
 import websockets
 import aioconsole
+import argparse
 import logging
+import random
 import sys
-import time
 import getpass
+from chatcore import DEFAULT_ROOM, AuthError, ChatCore
 
 # Konfigurasi logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class ChatClient:
-    def __init__(self):
-        self.websocket = None
-        self.username = None
-        self.auth_token = None
-        self.uri = "ws://localhost:8765"
-        self.is_shutting_down = False
-        self.is_authenticated = False
-
-    async def handle_auth_response(self, message):
-        """Menangani respons autentikasi dari server"""
-        try:
-            data = json.loads(message)
-            if not isinstance(data, dict) or "type" not in data:
-                logger.debug(f"Pesan tidak valid diterima: {message}")
-                return False
+class ChatClient(ChatCore):
+    """Frontend konsol interaktif di atas ChatCore"""
 
-            if data["type"] == "auth_request":
-                # Server meminta username
-                username = input(f"{data['message']}: ")
-                await self.websocket.send(json.dumps({"username": username}))
-                return True
-            elif data["type"] == "password_request":
-                # Server meminta password
-                password = getpass.getpass(f"{data['message']}: ")
-                await self.websocket.send(json.dumps({"password": password}))
-                return True
-            elif data["type"] == "auth_success":
-                # Autentikasi berhasil
-                self.auth_token = data["token"]
-                self.is_authenticated = True
-                logger.info(data["message"])
-                return True
-            elif data["type"] == "server_shutdown":
-                # Server akan dimatikan
-                logger.warning(f"\n[{data.get('timestamp', '')}] {data['message']}")
-                self.is_shutting_down = True
-                return True
-            elif data["type"] == "server_closed":
-                # Server sudah ditutup
-                logger.warning(f"\n[{data.get('timestamp', '')}] {data['message']}")
-                self.is_shutting_down = True
-                return True
-            return False
-        except json.JSONDecodeError:
-            logger.debug(f"Format pesan tidak valid: {message}")
-            return False
-        except Exception as e:
-            logger.debug(f"Error dalam autentikasi: {e}")
-            return False
+    def __init__(self, uri="ws://localhost:8765", binary=False):
+        super().__init__(uri, binary=binary, credentials=self.prompt_credentials)
+        self.quit_requested = False
+        self.search_next = None
+
+    async def prompt_credentials(self, kind, prompt):
+        """Meminta username/password tanpa memblokir event loop"""
+        if kind == "password":
+            # getpass memblokir, jadi dijalankan di thread executor
+            return await asyncio.get_running_loop().run_in_executor(None, getpass.getpass, f"{prompt}: ")
+        return await aioconsole.ainput(f"{prompt}: ")
+
+    def display(self, data):
+        """Menampilkan satu pesan dari server ke konsol"""
+        msg_type = data.get("type")
+        if msg_type is None:
+            if "username" not in data or "message" not in data:
+                logger.debug(f"Pesan chat tidak valid: {data!r}")
+                return
+            self.print_chat(data)
+        elif msg_type == "auth_success":
+            logger.info(data["message"])
+        elif msg_type == "resume_failed":
+            logger.info(data["message"])
+        elif msg_type == "history":
+            for item in data["messages"]:
+                self.print_chat(item)
+        elif msg_type == "search_result":
+            if not data["messages"]:
+                print(f"\nTidak ada hasil untuk '{data['query']}'")
+            for item in data["messages"]:
+                self.print_chat(item)
+            # Cursor halaman berikutnya dipakai oleh /search tanpa argumen
+            self.search_next = (data["query"], data["next"]) if data.get("next") else None
+            if self.search_next:
+                print("\nMasih ada hasil lain, gunakan /search")
+        elif msg_type == "history_end":
+            if data.get("more"):
+                print(f"\nRiwayat #{data['room']} masih ada, gunakan /history {data['last_seq']}")
+        elif msg_type == "room_joined":
+            print(f"\nBergabung ke room #{data['room']} (room aktif)")
+        elif msg_type == "room_left":
+            print(f"\nKeluar dari room #{data['room']}")
+        elif msg_type == "presence_snapshot":
+            print(f"\n{len(self.roster)} pengguna online, gunakan /who")
+        elif msg_type == "presence":
+            # Saat reconnect massal diff bisa berisi ratusan nama, cukup ringkasannya
+            for label, users in (("online", data["joined"]), ("offline", data["left"])):
+                if users:
+                    names = ", ".join(users) if len(users) <= 5 else f"{len(users)} pengguna"
+                    print(f"\n{names} {label}")
+        elif msg_type == "mailbox":
+            print(f"\n{len(data['messages'])} pesan diterima saat offline:")
+            for item in data["messages"]:
+                self.display(item)
+        elif msg_type == "mention":
+            timestamp = datetime.datetime.fromtimestamp(data["ts"] / 1000).strftime("%H:%M:%S")
+            print(f"\n[{timestamp}] #{data['room']} {data['from']} menyebut Anda: {data['message']}")
+            print("Pesan: ", end="", flush=True)
+        elif msg_type == "dm":
+            print(f"\n[{data.get('timestamp', '')}] [DM] {data['from']} -> {data['to']}: {data['message']}")
+            print("Pesan: ", end="", flush=True)
+        elif msg_type == "error":
+            print(f"\nError: {data['message']}")
+        elif msg_type == "rate_limited":
+            print(f"\nPeringatan: {data['message']}")
+        elif msg_type == "reconnect":
+            logger.info(data.get("message", "Server meminta reconnect"))
+        elif msg_type in ("server_shutdown", "server_closed"):
+            logger.warning(f"\n[{data.get('timestamp', '')}] {data['message']}")
 
     async def receive_messages(self):
-        """Menangani pesan yang masuk dari server"""
+        """Menampilkan pesan dari stream inti sampai koneksi tertutup"""
+        async for data in self:
+            self.display(data)
+            if self.is_shutting_down:
+                return False
         try:
-            async for message in self.websocket:
-                if isinstance(message, str):
-                    # Cek apakah ini pesan autentikasi, shutdown, atau server closed
-                    if await self.handle_auth_response(message):
-                        if self.is_shutting_down:
-                            return False
-                        continue
-                        
-                    try:
-                        data = json.loads(message)
-                        if not isinstance(data, dict) or "username" not in data or "message" not in data:
-                            logger.debug(f"Pesan chat tidak valid: {message}")
-                            continue
-                        print(f"\n[{data.get('timestamp', '')}] {data['username']}: {data['message']}")
-                        print("Pesan: ", end="", flush=True)
-                    except json.JSONDecodeError:
-                        logger.debug(f"Format pesan tidak valid: {message}")
-                        continue
-        except websockets.exceptions.ConnectionClosed as e:
-            if e.code == 1008 and not self.is_authenticated:
-                # Kode 1008 menandakan penolakan autentikasi atau akses di luar jam
+            await self.wait_authenticated()
+        except AuthError as e:
+            # Kode 1008 menandakan penolakan autentikasi atau akses di luar jam
+            if self.websocket.close_code == 1008:
                 logger.error("\nGagal terhubung: Autentikasi gagal atau server hanya aktif pada jam 08:00-19:59")
-            elif not self.is_authenticated:
-                logger.error(f"\nKoneksi terputus sebelum autentikasi: {e}")
             else:
-                logger.error(f"\nKoneksi terputus: {e}")
-            return False
-        except Exception as e:
-            logger.debug(f"Error saat menerima pesan: {e}")
+                logger.error(f"\n{e}")
             return False
+        if not self.quit_requested:
+            logger.error(f"\nKoneksi terputus: {self.websocket.close_code} {self.websocket.close_reason}")
         return True
 
+    def print_chat(self, data):
+        """Menampilkan satu pesan chat"""
+        timestamp = data.get("timestamp")
+        if not timestamp and data.get("ts"):
+            timestamp = datetime.datetime.fromtimestamp(data["ts"] / 1000).strftime("%H:%M:%S")
+        print(f"\n[{timestamp or ''}] #{data.get('room', DEFAULT_ROOM)} {data['username']}: {data['message']}")
+        print("Pesan: ", end="", flush=True)
+
     async def send_messages(self):
         """Mengirim pesan ke server"""
         try:
+            await self.wait_authenticated()
             while not self.is_shutting_down:
-                if not self.is_authenticated:
-                    await asyncio.sleep(0.1)
-                    continue
-
                 message = await aioconsole.ainput("Pesan: ")
                 if message.lower() == 'quit':
+                    self.quit_requested = True
                     await self.websocket.close(1000, "Client menutup koneksi")
                     return False
-                    
-                timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-                data = {
-                    "token": self.auth_token,
-                    "message": message,
-                    "timestamp": timestamp
-                }
+
+                if message.startswith("/"):
+                    data = self.handle_command(message)
+                    if data is None:
+                        continue
+                elif self.room is None:
+                    print("Anda tidak berada di room mana pun, gunakan /join <room>")
+                    continue
+                else:
+                    data = self.publish_message(message)
                 try:
-                    await self.websocket.send(json.dumps(data))
+                    await self.send(data)
                 except websockets.exceptions.ConnectionClosed:
                     logger.error("\nTidak dapat mengirim pesan: koneksi terputus")
                     return False
+        except AuthError:
+            return False
         except Exception as e:
             logger.debug(f"Error saat mengirim pesan: {e}")
             return False
         return True
 
-    async def connect_with_retry(self, max_retries=5, retry_delay=5):
-        """Mencoba koneksi dengan retry"""
-        for attempt in range(max_retries):
+    def handle_command(self, line):
+        """Menerjemahkan perintah /join, /leave, /room, /rooms, /history, /search, /msg, dan /who"""
+        command, _, arg = line.partition(" ")
+        arg = arg.strip()
+        if command == "/join" and arg:
+            return {"type": "join", "room": arg}
+        if command == "/leave":
+            return {"type": "leave", "room": arg or self.room}
+        if command == "/room" and arg:
+            if arg not in self.rooms:
+                print(f"Belum bergabung ke room #{arg}, gunakan /join {arg}")
+            else:
+                self.room = arg
+                print(f"Room aktif: #{arg}")
+            return None
+        if command == "/history":
+            since = int(arg) if arg.isdigit() else 0
+            return {"type": "history", "room": self.room, "since": since}
+        if command == "/search" and arg:
+            return self.search_request(arg)
+        if command == "/search" and self.search_next:
+            query, cursor = self.search_next
+            return self.search_request(query, before=cursor)
+        if command == "/msg":
+            target, _, text = arg.partition(" ")
+            if target and text.strip():
+                return self.direct_message(target, text.strip())
+        if command == "/who":
+            print("Online: " + ", ".join(sorted(self.roster)))
+            return None
+        if command == "/rooms":
+            print("Room: " + ", ".join(f"#{room}" for room in sorted(self.rooms)))
+            return None
+        print("Perintah: /join <room>, /leave [room], /room <room>, /rooms, /history [seq], /search <kata>, /msg <user> <pesan>, /who, quit")
+        return None
+
+    async def connect_with_retry(self, max_retries=5, retry_delay=0.5, max_delay=30):
+        """Mencoba koneksi dengan exponential backoff dan jitter"""
+        attempt = 0
+        while True:
             try:
-                async with websockets.connect(
-                    self.uri,
-                    ping_interval=20,
-                    ping_timeout=10,
-                    close_timeout=10
-                ) as websocket:
-                    self.websocket = websocket
-                    logger.info(f"Terhubung ke {self.uri}")
-                    
-                    # Reset status autentikasi
-                    self.is_authenticated = False
-                    self.auth_token = None
-                    
+                await self.connect()
+                logger.info(f"Terhubung ke {self.uri} (codec {self.codec.name})")
+                try:
                     receive_task = asyncio.create_task(self.receive_messages())
                     send_task = asyncio.create_task(self.send_messages())
                     
@@ -156,15 +202,17 @@ class ChatClient:
                     # Cancel task yang masih berjalan
                     for task in pending:
                         task.cancel()
-                    
-                    # Cek hasil task yang selesai
-                    for task in done:
-                        if not task.result():
-                            if attempt < max_retries - 1:
-                                logger.info(f"Mencoba koneksi ulang dalam {retry_delay} detik...")
-                                await asyncio.sleep(retry_delay)
-                            continue
-                            
+
+                    if self.quit_requested:
+                        return True
+                    if self.is_authenticated:
+                        # Sesi sempat berjalan, backoff dimulai lagi dari awal
+                        attempt = 0
+                    if self.reconnect_requested:
+                        continue
+                finally:
+                    await self.close()
+
             except websockets.exceptions.ConnectionClosed as e:
                 if e.code == 1008:
                     logger.error(f"Gagal terhubung: Autentikasi gagal atau server hanya aktif pada jam 08:00-19:59")
@@ -174,18 +222,23 @@ class ChatClient:
                 logger.error(f"Error WebSocket: {e}")
             except Exception as e:
                 logger.error(f"Error koneksi: {e}")
-                
-            if attempt < max_retries - 1:
-                logger.info(f"Mencoba koneksi ulang dalam {retry_delay} detik...")
-                await asyncio.sleep(retry_delay)
-            else:
+
+            attempt += 1
+            if attempt >= max_retries:
                 logger.error("Gagal terhubung setelah beberapa percobaan")
                 return False
-        
-        return False
+
+            # Full jitter agar klien tidak reconnect bersamaan setelah server restart
+            delay = random.uniform(0, min(max_delay, retry_delay * 2 ** attempt))
+            logger.info(f"Mencoba koneksi ulang dalam {delay:.2f} detik...")
+            await asyncio.sleep(delay)
 
 async def main():
-    client = ChatClient()
+    parser = argparse.ArgumentParser(description="Klien chat WebSocket")
+    parser.add_argument("--uri", default="ws://localhost:8765")
+    parser.add_argument("--binary", action="store_true", help="gunakan codec biner ringkas")
+    args = parser.parse_args()
+    client = ChatClient(args.uri, args.binary)
     
     try:
         if not await client.connect_with_retry():
@@ -0,0 +1,84 @@
+# cluster.py
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+from typing import Callable, List
+
+from bus import BusHub
+from history import MessageLog
+
+logger = logging.getLogger(__name__)
+
+# Jeda sebelum worker yang mati dijalankan ulang
+RESPAWN_DELAY = 1
+
+
+class Cluster:
+    """Menjalankan N proses worker yang berbagi port dan satu bus lokal"""
+
+    def __init__(self, target: Callable, workers: int, config: dict):
+        self.target = target
+        self.workers = workers
+        self.config = config
+        self.ctx = multiprocessing.get_context("spawn")
+        self.processes: List[multiprocessing.Process] = []
+        self.bus_dir = tempfile.mkdtemp(prefix="chat-bus-")
+        self.bus_path = os.path.join(self.bus_dir, "bus.sock")
+        self.stopping = asyncio.Event()
+
+    def _spawn(self, worker_id: int) -> multiprocessing.Process:
+        """Menjalankan satu proses worker"""
+        process = self.ctx.Process(
+            target=self.target,
+            args=(worker_id, self.config, self.bus_path),
+            name=f"chat-worker-{worker_id}",
+        )
+        process.start()
+        logger.info(f"Worker {worker_id} berjalan (pid {process.pid})")
+        return process
+
+    def _forward_signal(self, sig: int) -> None:
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, sig)
+
+    async def run(self) -> None:
+        """Menjalankan hub dan worker sampai menerima sinyal berhenti"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+        # Profil on-demand diteruskan ke semua worker
+        loop.add_signal_handler(signal.SIGUSR1, self._forward_signal, signal.SIGUSR1)
+
+        log = MessageLog(self.config["history_dir"])
+        hub = BusHub(self.bus_path, log)
+        await hub.start()
+        self.processes = [self._spawn(i) for i in range(self.workers)]
+
+        try:
+            while not self.stopping.is_set():
+                for i, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        logger.error(f"Worker {i} berhenti (exit code {process.exitcode}), menjalankan ulang")
+                        self.processes[i] = self._spawn(i)
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), RESPAWN_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            logger.info("Menghentikan semua worker...")
+            for process in self.processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in self.processes:
+                await loop.run_in_executor(None, process.join)
+            await hub.close()
+            log.close()
+            try:
+                os.unlink(self.bus_path)
+                os.rmdir(self.bus_dir)
+            except OSError:
+                pass
@@ -0,0 +1,178 @@
+# codec.py
+import json
+import struct
+from typing import Dict, List, Optional, Sequence, Union
+
+# Subprotocol WebSocket untuk memilih codec, urutan = prioritas server
+SUBPROTOCOL_BINARY = "chat.bin.v1"
+SUBPROTOCOL_JSON = "chat.json.v1"
+SUBPROTOCOLS = [SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON]
+
+# Tipe frame biner (byte pertama setiap frame)
+TYPE_JSON = 0      # pesan kontrol: sisa frame berupa objek JSON UTF-8
+TYPE_CHAT = 1      # broadcast chat dari server
+TYPE_PUBLISH = 2   # pesan chat dari klien
+TYPE_BATCH = 3     # beberapa frame digabung (arah server atau klien), masing-masing ber-prefix panjang
+
+# Header: tipe, seq, timestamp ms | tipe, timestamp ms
+_CHAT_HEADER = struct.Struct("!BQQ")
+_PUBLISH_HEADER = struct.Struct("!BQ")
+_BATCH_HEADER = struct.Struct("!BH")
+_SHORT_LEN = struct.Struct("!H")
+_LONG_LEN = struct.Struct("!I")
+
+Frame = Union[str, bytes]
+
+
+class JsonCodec:
+    """Codec teks JSON, default untuk klien tanpa subprotocol seperti index.html"""
+
+    name = SUBPROTOCOL_JSON
+    # Setiap pesan klien membawa token
+    binds_auth = False
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message)
+
+    def encode_json(self, text: str) -> str:
+        """Mengubah frame JSON yang sudah di-serialize menjadi frame codec ini"""
+        return text
+
+    def encode_batch(self, frames: List[str]) -> str:
+        """Menggabungkan frame JSON menjadi satu array JSON tanpa serialize ulang"""
+        return "[" + ",".join(frames) + "]"
+
+    def decode(self, frame: Frame) -> Union[dict, list]:
+        """Mengembalikan dict, atau list of dict untuk frame batch"""
+        return json.loads(frame)
+
+
+class BinaryCodec:
+    """Codec biner ringkas: header struct, tipe numerik, timestamp integer, body ber-prefix panjang"""
+
+    name = SUBPROTOCOL_BINARY
+    # Autentikasi terikat ke koneksi, pesan tidak perlu membawa token
+    binds_auth = True
+
+    def encode(self, message: dict) -> bytes:
+        msg_type = message.get("type")
+        if msg_type is None and "seq" in message and "username" in message:
+            room = message["room"].encode()
+            username = message["username"].encode()
+            body = message["message"].encode()
+            return b"".join((
+                _CHAT_HEADER.pack(TYPE_CHAT, message["seq"], message.get("ts", 0)),
+                _SHORT_LEN.pack(len(room)), room,
+                _SHORT_LEN.pack(len(username)), username,
+                _LONG_LEN.pack(len(body)), body,
+            ))
+        if msg_type == "publish":
+            room = message["room"].encode()
+            body = message["message"].encode()
+            return b"".join((
+                _PUBLISH_HEADER.pack(TYPE_PUBLISH, message.get("ts", 0)),
+                _SHORT_LEN.pack(len(room)), room,
+                _LONG_LEN.pack(len(body)), body,
+            ))
+        return self.encode_json(json.dumps(message))
+
+    def encode_json(self, text: str) -> bytes:
+        return bytes((TYPE_JSON,)) + text.encode()
+
+    def encode_batch(self, frames: List[bytes]) -> bytes:
+        parts = [_BATCH_HEADER.pack(TYPE_BATCH, len(frames))]
+        for frame in frames:
+            parts.append(_LONG_LEN.pack(len(frame)))
+            parts.append(frame)
+        return b"".join(parts)
+
+    def decode(self, frame: Frame) -> Union[dict, list]:
+        """Mengembalikan dict, atau list of dict untuk frame batch"""
+        if isinstance(frame, str) or not frame:
+            raise ValueError("frame biner tidak valid")
+        msg_type = frame[0]
+        try:
+            if msg_type == TYPE_JSON:
+                return json.loads(frame[1:])
+            if msg_type == TYPE_CHAT:
+                _, seq, ts = _CHAT_HEADER.unpack_from(frame)
+                offset = _CHAT_HEADER.size
+                room, offset = _read(frame, offset, _SHORT_LEN)
+                username, offset = _read(frame, offset, _SHORT_LEN)
+                body, offset = _read(frame, offset, _LONG_LEN)
+                return {"seq": seq, "room": room, "username": username, "message": body, "ts": ts}
+            if msg_type == TYPE_PUBLISH:
+                _, ts = _PUBLISH_HEADER.unpack_from(frame)
+                offset = _PUBLISH_HEADER.size
+                room, offset = _read(frame, offset, _SHORT_LEN)
+                body, offset = _read(frame, offset, _LONG_LEN)
+                return {"type": "publish", "room": room, "message": body, "ts": ts}
+            if msg_type == TYPE_BATCH:
+                _, count = _BATCH_HEADER.unpack_from(frame)
+                offset = _BATCH_HEADER.size
+                messages = []
+                for _ in range(count):
+                    (size,) = _LONG_LEN.unpack_from(frame, offset)
+                    start = offset + _LONG_LEN.size
+                    offset = start + size
+                    inner = frame[start:offset]
+                    if offset > len(frame) or inner[:1] == bytes((TYPE_BATCH,)):
+                        raise ValueError("frame batch tidak valid")
+                    messages.append(self.decode(inner))
+                return messages
+        except struct.error as e:
+            raise ValueError(f"frame biner terpotong: {e}")
+        raise ValueError(f"tipe frame biner tidak dikenal: {msg_type}")
+
+
+def _read(frame: bytes, offset: int, length: struct.Struct):
+    """Membaca string UTF-8 ber-prefix panjang, mengembalikan (teks, offset berikutnya)"""
+    (size,) = length.unpack_from(frame, offset)
+    start = offset + length.size
+    end = start + size
+    if end > len(frame):
+        raise ValueError("panjang field melebihi frame")
+    return frame[start:end].decode(), end
+
+
+JSON_CODEC = JsonCodec()
+BINARY_CODEC = BinaryCodec()
+CODECS: Dict[Optional[str], object] = {
+    None: JSON_CODEC,
+    SUBPROTOCOL_JSON: JSON_CODEC,
+    SUBPROTOCOL_BINARY: BINARY_CODEC,
+}
+
+
+def codec_for(subprotocol: Optional[str]):
+    """Codec untuk subprotocol hasil negosiasi; tanpa subprotocol berarti JSON"""
+    return CODECS.get(subprotocol, JSON_CODEC)
+
+
+def select_subprotocol(connection, subprotocols: Sequence[str]) -> Optional[str]:
+    """Memilih subprotocol yang ditawarkan klien, tetap menerima klien tanpa subprotocol"""
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in subprotocols:
+            return subprotocol
+    return None
+
+
+class OutgoingFrame:
+    """Pesan keluar yang di-encode paling banyak sekali per codec"""
+
+    __slots__ = ("text", "_message", "_binary")
+
+    def __init__(self, text: str, message: Optional[dict] = None):
+        self.text = text
+        self._message = message
+        self._binary: Optional[bytes] = None
+
+    def encode(self, codec) -> Frame:
+        if codec is JSON_CODEC:
+            return self.text
+        if self._binary is None:
+            if self._message is None:
+                # Frame dari bus atau riwayat hanya tersedia sebagai teks JSON
+                self._message = json.loads(self.text)
+            self._binary = codec.encode(self._message)
+        return self._binary
@@ -0,0 +1,26 @@
+# config.py
+import json
+from typing import List
+
+
+def config_args(path: str) -> List[str]:
+    """Mengubah file konfigurasi JSON menjadi argumen CLI agar divalidasi parser yang sama
+
+    Key memakai nama opsi CLI (max_connections atau max-connections). true menjadi flag,
+    false/null dilewati.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"File konfigurasi {path} harus berisi objek JSON")
+
+    args: List[str] = []
+    for key, value in data.items():
+        option = "--" + key.replace("_", "-")
+        if value is True:
+            args.append(option)
+        elif value is False or value is None:
+            continue
+        else:
+            args += [option, str(value)]
+    return args
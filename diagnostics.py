@@ -0,0 +1,158 @@
+# diagnostics.py
+import asyncio
+import ipaddress
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Interval tick monitor event loop (detik)
+DEFAULT_LAG_INTERVAL = 0.1
+# Interval sampling profiler (detik)
+DEFAULT_SAMPLE_INTERVAL = 0.005
+DEFAULT_PROFILE_SECONDS = 5
+
+
+class LoopMonitor:
+    """Mengukur keterlambatan bangun event loop; watchdog thread mengambil stack saat loop tertahan"""
+
+    def __init__(self, threshold: float, interval: float = DEFAULT_LAG_INTERVAL,
+                 on_lag: Optional[Callable[[float], None]] = None):
+        self.threshold = threshold
+        self.interval = interval
+        self.on_lag = on_lag
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._thread_id: Optional[int] = None
+        # Stack thread loop yang diambil watchdog selama stall berjalan
+        self._stack: Optional[str] = None
+        self._stop = threading.Event()
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Tick berkala di event loop; selisih jadwal dan waktu bangun sebenarnya adalah lag"""
+        loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while not stop_event.is_set():
+                expected = loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, loop.time() - expected)
+                self._beat = time.monotonic()
+                stack, self._stack = self._stack, None
+                if self.on_lag is not None:
+                    self.on_lag(lag)
+                if lag >= self.threshold:
+                    self._report(lag, stack)
+        finally:
+            self._stop.set()
+
+    def _report(self, lag: float, stack: Optional[str]) -> None:
+        self.stalls += 1
+        if stack is None:
+            logger.warning(f"Event loop terlambat {lag * 1000:.0f} ms")
+        else:
+            logger.warning(f"Event loop tertahan {lag * 1000:.0f} ms, stack saat tertahan:\n{stack}")
+
+    def _watch(self) -> None:
+        """Berjalan di thread terpisah; tetap hidup saat callback memblokir event loop"""
+        while not self._stop.wait(self.threshold / 2):
+            if self._stack is not None or time.monotonic() - self._beat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._stack = "".join(traceback.format_list(_callback_stack(frame)))
+
+
+def _callback_stack(frame) -> traceback.StackSummary:
+    """Stack mulai dari callback yang sedang dijalankan, frame internal event loop dibuang"""
+    stack = traceback.extract_stack(frame)
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i].name == "_run" and stack[i].filename.endswith(os.path.join("asyncio", "events.py")):
+            return traceback.StackSummary.from_list(stack[i + 1:])
+    return stack
+
+
+def _fold(frame) -> str:
+    """Stack dalam format folded (akar;...;daun) yang dibaca flamegraph.pl dan speedscope"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(thread_id: int, duration: float, interval: float = DEFAULT_SAMPLE_INTERVAL) -> Dict[str, int]:
+    """Mengambil sampel stack satu thread secara berkala, hasilnya jumlah sampel per stack"""
+    counts: Counter = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            counts[_fold(frame)] += 1
+        del frame
+        time.sleep(interval)
+    return counts
+
+
+def format_folded(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items(), key=lambda item: -item[1]))
+
+
+class Profiler:
+    """Sampling profiler on-demand untuk thread event loop, satu sesi dalam satu waktu"""
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        # Dibuat di thread event loop
+        self.thread_id = threading.get_ident()
+        self.running = False
+
+    async def run(self, seconds: float) -> str:
+        """Profil selama seconds detik dalam format folded; sampling berjalan di thread executor"""
+        if self.running:
+            raise RuntimeError("Profiling lain sedang berjalan")
+        self.running = True
+        try:
+            counts = await asyncio.get_running_loop().run_in_executor(
+                None, sample_stacks, self.thread_id, seconds, self.interval)
+        finally:
+            self.running = False
+        return format_folded(counts)
+
+
+def profile_endpoint(profiler: Profiler, max_seconds: float, path: str = "/debug/profile"):
+    """Hook process_request websockets untuk GET path?seconds=N, hanya dari loopback"""
+
+    async def process_request(connection, request):
+        url = urlsplit(request.path)
+        if url.path != path:
+            return None
+        try:
+            local = ipaddress.ip_address(connection.remote_address[0]).is_loopback
+        except (TypeError, ValueError, IndexError):
+            local = False
+        if not local:
+            return connection.respond(403, "Endpoint profil hanya untuk localhost\n")
+        try:
+            seconds = float(parse_qs(url.query).get("seconds", [DEFAULT_PROFILE_SECONDS])[0])
+        except ValueError:
+            return connection.respond(400, "seconds harus berupa angka\n")
+        try:
+            text = await profiler.run(min(max(seconds, 0.1), max_seconds))
+        except RuntimeError as e:
+            return connection.respond(409, f"{e}\n")
+        return connection.respond(200, text)
+
+    return process_request
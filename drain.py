@@ -0,0 +1,55 @@
+# drain.py
+import json
+import os
+import sys
+from typing import List, Optional
+
+# Opsi internal yang dipakai proses lama untuk menyerahkan socket dan snapshot ke proses baru
+HANDOFF_OPTIONS = ("--listen-fds", "--snapshot")
+
+
+def write_snapshot(path: str, data: dict) -> None:
+    """Menulis snapshot secara atomik; berisi token sehingga hanya bisa dibaca pemilik"""
+    tmp_path = path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Optional[dict]:
+    """Membaca lalu menghapus snapshot dari proses sebelumnya"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    os.unlink(path)
+    return data
+
+
+def restart_command(fds: List[int], snapshot_path: str, argv: Optional[List[str]] = None) -> List[str]:
+    """Perintah untuk proses pengganti: argumen asli ditambah socket listen dan snapshot"""
+    argv = list(sys.argv if argv is None else argv)
+    args, skip = [], False
+    for arg in argv[1:]:
+        if skip:
+            skip = False
+            continue
+        if arg in HANDOFF_OPTIONS:
+            skip = True
+            continue
+        if arg.startswith(tuple(option + "=" for option in HANDOFF_OPTIONS)):
+            continue
+        args.append(arg)
+    return [sys.executable, os.path.abspath(argv[0]), *args,
+            "--listen-fds", ",".join(str(fd) for fd in fds), "--snapshot", snapshot_path]
+
+
+def stagger_delays(count: int, spread: float) -> List[float]:
+    """Jeda reconnect yang tersebar rata dalam spread detik agar klien tidak datang bersamaan"""
+    if count <= 0:
+        return []
+    return [spread * i / count for i in range(count)]
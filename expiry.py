@@ -0,0 +1,73 @@
+# expiry.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Callable, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Heap dibangun ulang jika entri basinya melebihi entri hidup sebanyak ini kali lipat
+COMPACT_RATIO = 2
+COMPACT_MIN = 1024
+
+
+class ExpiryScheduler:
+    """Min-heap dengan lazy deletion untuk semua tenggat waktu (token, autentikasi, heartbeat)"""
+
+    def __init__(self, resolution: float = 0.5):
+        self.resolution = resolution
+        # Jam monotonic yang di-cache, diperbarui setiap tick
+        self.now = time.monotonic()
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._entries: Dict[Hashable, Tuple[float, Callable]] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable[[Hashable], None]) -> float:
+        """Mendaftarkan (atau memperbarui) tenggat key, mengembalikan deadline monotonic"""
+        deadline = time.monotonic() + delay
+        self._entries[key] = (deadline, callback)
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        return deadline
+
+    def cancel(self, key: Hashable) -> None:
+        """Membatalkan tenggat key; entri di heap dibuang saat muncul di puncak"""
+        self._entries.pop(key, None)
+
+    def tick(self) -> int:
+        """Menjalankan callback semua tenggat yang lewat, biaya sebanding jumlah yang kadaluarsa"""
+        self.now = now = time.monotonic()
+        heap, entries = self._heap, self._entries
+        expired = 0
+        while heap and heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(heap)
+            entry = entries.get(key)
+            if entry is None or entry[0] != deadline:
+                # Entri basi: sudah dibatalkan atau dijadwalkan ulang
+                continue
+            del entries[key]
+            expired += 1
+            try:
+                entry[1](key)
+            except Exception as e:
+                logger.error(f"Error pada callback expiry {key!r}: {e}")
+
+        if len(heap) > COMPACT_MIN and len(heap) > COMPACT_RATIO * len(entries):
+            self._compact()
+        return expired
+
+    def _compact(self) -> None:
+        """Membangun ulang heap hanya dari entri yang masih hidup"""
+        self._heap = [(deadline, next(self._counter), key)
+                      for key, (deadline, _) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Loop tick sampai stop_event diset"""
+        while not stop_event.is_set():
+            self.tick()
+            await asyncio.sleep(self.resolution)
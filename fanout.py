@@ -0,0 +1,269 @@
+# fanout.py
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Set
+
+import websockets
+
+from codec import JSON_CODEC, OutgoingFrame
+
+logger = logging.getLogger(__name__)
+
+# Kebijakan untuk klien yang lambat (antrian keluar penuh)
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE = "coalesce"
+POLICY_DISCONNECT = "disconnect"
+POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_DISCONNECT)
+
+
+class ClientChannel:
+    """Antrian keluar terbatas dengan satu writer task untuk satu klien"""
+
+    __slots__ = ("websocket", "codec", "max_queue", "policy", "close_code", "batch_max", "queue",
+                 "keys", "dropped", "closing", "observe", "_notify", "_wakeup", "_idle", "_task")
+
+    def __init__(self, websocket, max_queue: int, policy: str, close_code: int, codec=JSON_CODEC,
+                 batch_max: int = 1, notify: Optional[Callable[["ClientChannel"], None]] = None,
+                 observe: Optional[Callable[[float], None]] = None):
+        self.websocket = websocket
+        self.codec = codec
+        self.max_queue = max_queue
+        self.policy = policy
+        self.close_code = close_code
+        # batch_max > 1: frame antri digabung jadi satu frame array saat dikirim
+        self.batch_max = batch_max
+        # Dengan batching, writer dibangunkan timer engine (notify) bukan per frame
+        self._notify = notify
+        # Menerima durasi setiap send ke socket (diagnostik), None = tidak diukur
+        self.observe = observe
+        # Setiap entri berupa list [frame, key] agar bisa diganti di tempat saat coalesce
+        self.queue: deque = deque()
+        self.keys: Dict[str, list] = {}
+        self.dropped = 0
+        self.closing = False
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = asyncio.create_task(self._writer())
+
+    def push(self, frame, key: Optional[str] = None) -> bool:
+        """Memasukkan frame ke antrian tanpa menunggu socket klien"""
+        if self.closing:
+            return False
+
+        if key is not None and self.policy == POLICY_COALESCE:
+            entry = self.keys.get(key)
+            if entry is not None:
+                # Frame lama dengan key yang sama diganti frame terbaru
+                entry[0] = frame
+                return True
+
+        if len(self.queue) >= self.max_queue:
+            if self.policy == POLICY_DISCONNECT:
+                self._disconnect()
+                return False
+            old = self.queue.popleft()
+            if old[1] is not None:
+                self.keys.pop(old[1], None)
+            self.dropped += 1
+
+        entry = [frame, key]
+        self.queue.append(entry)
+        if key is not None and self.policy == POLICY_COALESCE:
+            self.keys[key] = entry
+        self._idle.clear()
+        if self._notify is None or len(self.queue) >= self.batch_max:
+            self._wakeup.set()
+        else:
+            self._notify(self)
+        return True
+
+    def _disconnect(self) -> None:
+        """Memutus klien yang tidak mampu mengikuti laju pesan"""
+        self.closing = True
+        self.queue.clear()
+        self.keys.clear()
+        self._idle.set()
+        logger.warning("Klien terlalu lambat, koneksi diputus")
+        asyncio.create_task(self.websocket.close(self.close_code, "Klien terlalu lambat"))
+
+    async def _writer(self) -> None:
+        """Mengirim isi antrian ke socket klien secara berurutan"""
+        queue = self.queue
+        send = self.websocket.send if self.observe is None else self._timed_send
+        try:
+            while True:
+                if not queue:
+                    self._idle.set()
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                if self.batch_max > 1 and len(queue) > 1:
+                    frames = []
+                    for _ in range(min(len(queue), self.batch_max)):
+                        frame, key = queue.popleft()
+                        if key is not None:
+                            self.keys.pop(key, None)
+                        frames.append(frame)
+                    await send(self.codec.encode_batch(frames))
+                    continue
+                frame, key = queue.popleft()
+                if key is not None:
+                    self.keys.pop(key, None)
+                await send(frame)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error pada writer klien: {e}")
+        finally:
+            self.closing = True
+            queue.clear()
+            self.keys.clear()
+            self._idle.set()
+
+    async def _timed_send(self, frame) -> None:
+        start = time.perf_counter()
+        try:
+            await self.websocket.send(frame)
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    async def wait_idle(self) -> None:
+        """Menunggu sampai antrian klien kosong"""
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        """Menghentikan writer task"""
+        self.closing = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class FanoutEngine:
+    """Broadcast yang men-serialize frame sekali lalu membaginya ke antrian per klien"""
+
+    def __init__(self, max_queue: int = 256, policy: str = POLICY_DROP_OLDEST,
+                 close_code: int = 1008, batch_window: float = 0.0, batch_max: int = 32):
+        if policy not in POLICIES:
+            raise ValueError(f"Kebijakan klien lambat tidak dikenal: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.close_code = close_code
+        # Micro-batching aktif jika batch_window > 0 (detik)
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        # Callback durasi send per frame untuk channel baru, None = tidak diukur
+        self.send_observer: Optional[Callable[[float], None]] = None
+        self.channels: Dict[object, ClientChannel] = {}
+        # Klien yang menunggu flush batch, dilayani satu timer untuk semua klien
+        self._pending: Set[ClientChannel] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Counter untuk metrik: frame yang masuk antrian dan yang dibuang dari klien yang sudah pergi
+        self.frames_out = 0
+        self.dropped_closed = 0
+
+    def register(self, websocket, codec=JSON_CODEC) -> ClientChannel:
+        """Mendaftarkan klien beserta codec-nya dan memulai writer task-nya"""
+        if self.batch_window > 0 and self.batch_max > 1:
+            channel = ClientChannel(websocket, self.max_queue, self.policy, self.close_code, codec,
+                                    self.batch_max, self._schedule_flush, self.send_observer)
+        else:
+            channel = ClientChannel(websocket, self.max_queue, self.policy, self.close_code, codec,
+                                    observe=self.send_observer)
+        self.channels[websocket] = channel
+        return channel
+
+    def _schedule_flush(self, channel: ClientChannel) -> None:
+        """Menandai klien untuk flush batch berikutnya dan memasang timer jika belum ada"""
+        self._pending.add(channel)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush_batches)
+
+    def _flush_batches(self) -> None:
+        """Timer batch: membangunkan writer semua klien yang punya frame tertunda"""
+        self._flush_handle = None
+        pending, self._pending = self._pending, set()
+        for channel in pending:
+            channel._wakeup.set()
+
+    async def unregister(self, websocket) -> None:
+        """Menghapus klien dan menghentikan writer task-nya"""
+        channel = self.channels.pop(websocket, None)
+        if channel is not None:
+            self.dropped_closed += channel.dropped
+            await channel.close()
+
+    def send(self, websocket, message: dict, key: Optional[str] = None) -> bool:
+        """Mengirim pesan ke satu klien lewat antriannya"""
+        channel = self.channels.get(websocket)
+        if channel is None:
+            return False
+        ok = channel.push(channel.codec.encode(message), key)
+        self.frames_out += ok
+        return ok
+
+    def send_frame(self, websocket, text: str, key: Optional[str] = None) -> bool:
+        """Mengirim frame JSON yang sudah di-serialize ke satu klien"""
+        channel = self.channels.get(websocket)
+        if channel is None:
+            return False
+        ok = channel.push(channel.codec.encode_json(text), key)
+        self.frames_out += ok
+        return ok
+
+    def broadcast(self, message: dict, recipients: Optional[Iterable] = None,
+                  key: Optional[str] = None) -> str:
+        """Serialize pesan sekali per codec lalu bagikan ke semua penerima, mengembalikan teks JSON"""
+        text = json.dumps(message)
+        self.broadcast_frame(OutgoingFrame(text, message), recipients, key)
+        return text
+
+    def broadcast_frame(self, frame, recipients: Optional[Iterable] = None,
+                        key: Optional[str] = None) -> int:
+        """Membagikan frame JSON (teks atau OutgoingFrame), mengembalikan jumlah penerima"""
+        out = frame if isinstance(frame, OutgoingFrame) else OutgoingFrame(frame)
+        text = out.text
+        channels = self.channels
+        if recipients is None:
+            targets = channels.values()
+        else:
+            targets = (channels.get(websocket) for websocket in recipients)
+        delivered = 0
+        for channel in targets:
+            if channel is None:
+                continue
+            data = text if channel.codec is JSON_CODEC else out.encode(channel.codec)
+            if channel.push(data, key):
+                delivered += 1
+        self.frames_out += delivered
+        return delivered
+
+    def queue_depth(self) -> int:
+        """Total frame yang sedang menunggu di semua antrian klien"""
+        return sum(len(channel.queue) for channel in self.channels.values())
+
+    def max_queue_depth(self) -> int:
+        """Antrian klien terpanjang saat ini"""
+        return max((len(channel.queue) for channel in self.channels.values()), default=0)
+
+    def dropped(self) -> int:
+        """Total frame yang dibuang karena antrian klien penuh"""
+        return self.dropped_closed + sum(channel.dropped for channel in self.channels.values())
+
+    async def flush(self, timeout: float) -> None:
+        """Menunggu semua antrian terkirim, paling lama selama timeout"""
+        waiters = [channel.wait_idle() for channel in self.channels.values()]
+        if not waiters:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*waiters), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Sebagian antrian klien belum terkirim saat flush")
@@ -0,0 +1,381 @@
+# history.py
+import asyncio
+import bisect
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ukuran maksimal satu segmen log sebelum pindah ke segmen baru
+SEGMENT_SIZE = 64 * 1024 * 1024
+# Satu entri indeks seq->offset untuk setiap INDEX_INTERVAL pesan
+INDEX_INTERVAL = 64
+# Maksimal pesan yang ditulis writer thread dalam satu batch
+WRITE_BATCH = 1024
+
+_INDEX_ENTRY = struct.Struct("<QQ")
+_LOG_SUFFIX = ".log"
+_INDEX_SUFFIX = ".idx"
+
+
+class HistoryRing:
+    """Ring buffer berukuran tetap berbasis array untuk pesan terbaru satu room"""
+
+    __slots__ = ("capacity", "seqs", "frames", "start", "count", "covered_from")
+
+    def __init__(self, capacity: int, covered_from: int = 0):
+        self.capacity = capacity
+        self.seqs = array("Q", bytes(8 * capacity))
+        self.frames: List[Optional[str]] = [None] * capacity
+        self.start = 0
+        self.count = 0
+        # Semua pesan room dengan seq > covered_from dijamin ada di ring
+        self.covered_from = covered_from
+
+    def append(self, seq: int, frame: str) -> None:
+        """Menambahkan pesan, menimpa pesan tertua jika ring penuh"""
+        if self.count == self.capacity:
+            self.covered_from = self.seqs[self.start]
+            self.seqs[self.start] = seq
+            self.frames[self.start] = frame
+            self.start = (self.start + 1) % self.capacity
+        else:
+            index = (self.start + self.count) % self.capacity
+            self.seqs[index] = seq
+            self.frames[index] = frame
+            self.count += 1
+
+    def covers(self, seq: int) -> bool:
+        """Cek apakah semua pesan setelah seq masih ada di ring"""
+        return seq >= self.covered_from
+
+    def since(self, seq: int, limit: int) -> List[Tuple[int, str]]:
+        """Mendapatkan pesan dengan seq > seq, paling banyak limit pesan"""
+        seqs, start, capacity = self.seqs, self.start, self.capacity
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if seqs[(start + mid) % capacity] <= seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        end = min(self.count, lo + limit)
+        return [(seqs[(start + i) % capacity], self.frames[(start + i) % capacity])
+                for i in range(lo, end)]
+
+
+class MessageLog:
+    """Log append-only bersegmen di disk dengan indeks jarang seq->offset"""
+
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE,
+                 index_interval: int = INDEX_INTERVAL, readonly: bool = False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.readonly = readonly
+        self.last_seq = 0
+        self._lock = threading.Lock()
+        self._indexes: Dict[int, Tuple[List[int], List[int]]] = {}
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._index_file = None
+        self._size = 0
+        self._records = 0
+
+        os.makedirs(directory, exist_ok=True)
+        if not readonly:
+            self._recover()
+            self._thread = threading.Thread(target=self._writer_loop, name="history-log", daemon=True)
+            self._thread.start()
+
+    def _path(self, base: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"{base:020d}{suffix}")
+
+    def _segments(self) -> List[int]:
+        """Daftar seq awal setiap segmen, terurut"""
+        return sorted(int(name[:-len(_LOG_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(_LOG_SUFFIX))
+
+    def _load_index(self, base: int) -> Tuple[List[int], List[int]]:
+        """Membaca file indeks sebuah segmen"""
+        seqs, offsets = [], []
+        try:
+            with open(self._path(base, _INDEX_SUFFIX), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return seqs, offsets
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        for seq, offset in _INDEX_ENTRY.iter_unpack(data[:usable]):
+            seqs.append(seq)
+            offsets.append(offset)
+        return seqs, offsets
+
+    def _index_for(self, base: int) -> Tuple[List[int], List[int]]:
+        """Indeks sebuah segmen; mode readonly selalu membaca ulang karena ditulis proses lain"""
+        if self.readonly:
+            return self._load_index(base)
+        with self._lock:
+            seqs, offsets = self._indexes.get(base, ([], []))
+            return list(seqs), list(offsets)
+
+    def _recover(self) -> None:
+        """Memuat indeks dan mencari seq terakhir dari segmen terakhir"""
+        segments = self._segments()
+        for base in segments:
+            self._indexes[base] = self._load_index(base)
+        if not segments:
+            return
+
+        base = segments[-1]
+        seqs, offsets = self._indexes[base]
+        path = self._path(base, _LOG_SUFFIX)
+        offset = offsets[-1] if offsets else 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            tail = f.read()
+        valid = tail.rfind(b"\n") + 1
+        for line in tail[:valid].splitlines():
+            self.last_seq = json.loads(line)["seq"]
+        if not self.last_seq:
+            self.last_seq = base - 1
+        if valid < len(tail):
+            # Buang baris terakhir yang tidak lengkap akibat crash
+            with open(path, "r+b") as f:
+                f.truncate(offset + valid)
+            logger.warning(f"Memotong baris tidak lengkap di akhir {path}")
+
+        self._file = open(path, "ab")
+        self._index_file = open(self._path(base, _INDEX_SUFFIX), "ab")
+        self._size = offset + valid
+        self._records = len(tail[:valid].splitlines())
+
+    def append(self, seq: int, frame) -> None:
+        """Memasukkan pesan (str atau bytes) ke antrian writer thread tanpa menunggu disk"""
+        self._queue.put((seq, frame))
+
+    def _roll(self, seq: int) -> None:
+        """Menutup segmen aktif dan membuka segmen baru mulai dari seq"""
+        if self._file is not None:
+            self._file.close()
+            self._index_file.close()
+        self._file = open(self._path(seq, _LOG_SUFFIX), "ab")
+        self._index_file = open(self._path(seq, _INDEX_SUFFIX), "ab")
+        self._size = 0
+        self._records = 0
+        with self._lock:
+            self._indexes[seq] = ([], [])
+
+    def _writer_loop(self) -> None:
+        """Writer thread: menulis pesan dari antrian ke segmen aktif"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            try:
+                while len(batch) < WRITE_BATCH:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        self._queue.put(None)
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Error saat menulis log riwayat: {e}")
+        if self._file is not None:
+            self._file.close()
+            self._index_file.close()
+
+    def _write_batch(self, batch: list) -> None:
+        """Menulis satu batch pesan beserta entri indeksnya"""
+        for seq, frame in batch:
+            if self._file is None or self._size >= self.segment_size:
+                self._roll(seq)
+            if self._records % self.index_interval == 0:
+                self._index_file.write(_INDEX_ENTRY.pack(seq, self._size))
+                with self._lock:
+                    seqs, offsets = self._indexes[self._current_base()]
+                    seqs.append(seq)
+                    offsets.append(self._size)
+            data = (frame if isinstance(frame, bytes) else frame.encode()) + b"\n"
+            self._file.write(data)
+            self._size += len(data)
+            self._records += 1
+            self.last_seq = seq
+        self._file.flush()
+        self._index_file.flush()
+
+    def _current_base(self) -> int:
+        return int(os.path.basename(self._file.name)[:-len(_LOG_SUFFIX)])
+
+    def read_since(self, seq: int, room: Optional[str], limit: int) -> List[Tuple[int, str]]:
+        """Membaca pesan dengan seq > seq dari disk lewat mmap (blocking, jalankan di executor)"""
+        segments = self._segments()
+        first = max(bisect.bisect_right(segments, seq + 1) - 1, 0)
+        result: List[Tuple[int, str]] = []
+
+        for base in segments[first:]:
+            seqs, offsets = self._index_for(base)
+            position = bisect.bisect_right(seqs, seq + 1) - 1
+            offset = offsets[position] if position >= 0 else 0
+            try:
+                f = open(self._path(base, _LOG_SUFFIX), "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                if os.fstat(f.fileno()).st_size <= offset:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    end_of_data = len(mm)
+                    while offset < end_of_data:
+                        end = mm.find(b"\n", offset)
+                        if end < 0:
+                            break
+                        line = mm[offset:end]
+                        offset = end + 1
+                        message = json.loads(line)
+                        if message["seq"] <= seq:
+                            continue
+                        if room is not None and message.get("room") != room:
+                            continue
+                        result.append((message["seq"], line.decode()))
+                        if len(result) >= limit:
+                            return result
+        return result
+
+    def read_seqs(self, wanted: List[int]) -> Dict[int, str]:
+        """Membaca pesan dengan seq tertentu dari disk lewat mmap (blocking, jalankan di executor)"""
+        segments = self._segments()
+        by_segment: Dict[int, List[int]] = {}
+        for seq in sorted(set(wanted)):
+            position = bisect.bisect_right(segments, seq) - 1
+            if position >= 0:
+                by_segment.setdefault(segments[position], []).append(seq)
+        result: Dict[int, str] = {}
+
+        for base, targets in by_segment.items():
+            seqs, offsets = self._index_for(base)
+            try:
+                f = open(self._path(base, _LOG_SUFFIX), "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    offset = 0
+                    for target in targets:
+                        # Loncat lewat indeks jarang jika titiknya di depan posisi scan sekarang
+                        position = bisect.bisect_right(seqs, target) - 1
+                        if position >= 0 and offsets[position] > offset:
+                            offset = offsets[position]
+                        while offset < len(mm):
+                            end = mm.find(b"\n", offset)
+                            if end < 0:
+                                offset = len(mm)
+                                break
+                            line = mm[offset:end]
+                            seq = json.loads(line)["seq"]
+                            if seq > target:
+                                break
+                            offset = end + 1
+                            if seq == target:
+                                result[seq] = line.decode()
+                                break
+        return result
+
+    def close(self) -> None:
+        """Menunggu writer thread menulis sisa antrian lalu berhenti"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+class History:
+    """Riwayat pesan: ring per room di memori ditambah log di disk"""
+
+    def __init__(self, ring_size: int, log: Optional[MessageLog] = None):
+        self.ring_size = ring_size
+        self.log = log
+        self.rings: Dict[str, HistoryRing] = {}
+        self.last_seq = log.last_seq if log is not None else 0
+
+    def next_seq(self) -> int:
+        """Mengambil nomor urut pesan berikutnya"""
+        self.last_seq += 1
+        return self.last_seq
+
+    def record(self, seq: int, room: str, frame: str) -> None:
+        """Menyimpan frame ke ring room dan (jika log dimiliki proses ini) ke disk"""
+        ring = self.rings.get(room)
+        if ring is None:
+            ring = self.rings[room] = HistoryRing(self.ring_size, seq - 1)
+        ring.append(seq, frame)
+        if seq > self.last_seq:
+            self.last_seq = seq
+        if self.log is not None and not self.log.readonly:
+            self.log.append(seq, frame)
+
+    def snapshot(self) -> dict:
+        """Isi semua ring untuk diserahkan ke proses pengganti"""
+        return {
+            "last_seq": self.last_seq,
+            "rooms": {
+                room: {"covered_from": ring.covered_from, "messages": ring.since(0, ring.capacity)}
+                for room, ring in self.rings.items()
+            },
+        }
+
+    def restore(self, data: dict) -> None:
+        """Membangun ulang ring dari snapshot proses sebelumnya"""
+        for room, entry in data.get("rooms", {}).items():
+            ring = self.rings[room] = HistoryRing(self.ring_size, entry["covered_from"])
+            for seq, frame in entry["messages"]:
+                ring.append(seq, frame)
+        self.last_seq = max(self.last_seq, data.get("last_seq", 0))
+
+    async def since(self, room: str, seq: int, limit: int) -> List[Tuple[int, str]]:
+        """Mendapatkan (seq, frame) room dengan seq > seq, dari ring atau dari disk"""
+        ring = self.rings.get(room)
+        if ring is not None and ring.covers(seq):
+            return ring.since(seq, limit)
+        if self.log is None:
+            return ring.since(seq, limit) if ring is not None else []
+
+        loop = asyncio.get_running_loop()
+        entries = await loop.run_in_executor(None, self.log.read_since, seq, room, limit)
+        if len(entries) < limit and ring is not None:
+            # Pesan terbaru mungkin belum sampai di disk, lengkapi dari ring
+            last = entries[-1][0] if entries else seq
+            entries.extend(ring.since(last, limit - len(entries)))
+        return entries
+
+    async def lookup(self, hits: List[Tuple[int, str]]) -> List[str]:
+        """Frame untuk daftar (seq, room) hasil pencarian, dari ring atau dari disk, urutan tetap"""
+        frames: Dict[int, str] = {}
+        missing = []
+        for seq, room in hits:
+            ring = self.rings.get(room)
+            if ring is not None and ring.covers(seq - 1):
+                entries = ring.since(seq - 1, 1)
+                if entries and entries[0][0] == seq:
+                    frames[seq] = entries[0][1]
+                    continue
+            missing.append(seq)
+        if missing and self.log is not None:
+            loop = asyncio.get_running_loop()
+            frames.update(await loop.run_in_executor(None, self.log.read_seqs, missing))
+        return [frames[seq] for seq, _ in hits if seq in frames]
@@ -0,0 +1,329 @@
+# mailboxes.py
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ukuran maksimal satu segmen sebelum pindah ke segmen baru
+SEGMENT_SIZE = 16 * 1024 * 1024
+# Segmen tertua dengan porsi entri hidup di bawah rasio ini disalin ke segmen aktif lalu dihapus
+COMPACT_RATIO = 0.25
+# Interval writer thread membuang entri kadaluarsa dan memadatkan segmen (detik)
+MAINTENANCE_INTERVAL = 60
+# Maksimal record yang ditulis writer thread dalam satu batch
+WRITE_BATCH = 1024
+
+# Record: jenis, id, kadaluarsa (detik epoch), panjang username, panjang payload
+_HEADER = struct.Struct("<BQdHI")
+KIND_MESSAGE = 1
+# Ack menghapus semua pesan pengguna dengan id <= id record
+KIND_ACK = 2
+_SUFFIX = ".mbx"
+
+
+class _Entry:
+    """Satu pesan di kotak surat; payload disimpan di memori sampai ditulis ke segmen"""
+
+    __slots__ = ("owner", "id", "expires", "base", "offset", "size", "payload", "dead")
+
+    def __init__(self, owner: str, entry_id: int, expires: float, payload: Optional[bytes] = None):
+        self.owner = owner
+        self.id = entry_id
+        self.expires = expires
+        self.base: Optional[int] = None
+        self.offset = 0
+        self.size = len(payload) if payload is not None else 0
+        self.payload = payload
+        self.dead = False
+
+
+class Mailbox:
+    """Kotak surat per pengguna: segmen append-only di disk dan indeks offset per pengguna di memori
+
+    put/ack dipanggil dari event loop dan tidak menyentuh disk; writer thread menulis record,
+    membuang entri kadaluarsa, dan memadatkan segmen. fetch membaca disk (jalankan di executor).
+    """
+
+    def __init__(self, directory: str, cap: int = 500, ttl: float = 7 * 24 * 3600,
+                 segment_size: int = SEGMENT_SIZE, compact_ratio: float = COMPACT_RATIO):
+        self.directory = directory
+        self.cap = cap
+        self.ttl = ttl
+        self.segment_size = segment_size
+        self.compact_ratio = compact_ratio
+        self.count = 0
+        self._lock = threading.Lock()
+        self._boxes: Dict[str, Deque[_Entry]] = {}
+        # Entri hidup per segmen dan jumlah record pesan yang pernah ditulis ke segmen itu
+        self._live: Dict[int, Dict[int, _Entry]] = {}
+        self._records: Dict[int, int] = {}
+        self._next_id = 1
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._file = None
+        self._base = 0
+        self._size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._roll()
+        self._thread = threading.Thread(target=self._writer_loop, name="mailbox", daemon=True)
+        self._thread.start()
+
+    def _path(self, base: int) -> str:
+        return os.path.join(self.directory, f"{base:08d}{_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        return sorted(int(name[:-len(_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(_SUFFIX))
+
+    def _recover(self) -> None:
+        """Membangun ulang indeks dari semua segmen; ack dan entri kadaluarsa dibuang"""
+        now = time.time()
+        boxes: Dict[str, Dict[int, _Entry]] = {}
+        for base in self._segments():
+            path = self._path(base)
+            with open(path, "rb") as f:
+                data = f.read()
+            self._records[base] = 0
+            self._live[base] = {}
+            offset = 0
+            while offset + _HEADER.size <= len(data):
+                kind, entry_id, expires, name_size, size = _HEADER.unpack_from(data, offset)
+                start = offset + _HEADER.size + name_size
+                if start + size > len(data):
+                    break
+                username = data[offset + _HEADER.size:start].decode()
+                self._next_id = max(self._next_id, entry_id + 1)
+                box = boxes.setdefault(username, {})
+                if kind == KIND_MESSAGE:
+                    self._records[base] += 1
+                    if expires > now:
+                        # Salinan hasil pemadatan menggantikan salinan lama dengan id sama
+                        entry = _Entry(username, entry_id, expires)
+                        entry.base, entry.offset, entry.size = base, start, size
+                        box[entry_id] = entry
+                elif kind == KIND_ACK:
+                    for acked in [i for i in box if i <= entry_id]:
+                        del box[acked]
+                offset = start + size
+            if offset < len(data):
+                # Record terakhir tidak lengkap akibat crash
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+                logger.warning(f"Memotong record tidak lengkap di akhir {path}")
+
+        for username, entries in boxes.items():
+            if not entries:
+                continue
+            box = self._boxes[username] = deque(entries[i] for i in sorted(entries))
+            for entry in box:
+                self._live[entry.base][entry.id] = entry
+            self.count += len(box)
+        if self.count:
+            logger.info(f"Kotak surat dimuat: {self.count} pesan untuk {len(self._boxes)} pengguna")
+
+    def put(self, username: str, frame: str) -> None:
+        """Menyimpan frame untuk pengguna offline; penulisan ke disk dilakukan writer thread"""
+        with self._lock:
+            entry = _Entry(username, self._next_id, time.time() + self.ttl, frame.encode())
+            self._next_id += 1
+            box = self._boxes.setdefault(username, deque())
+            box.append(entry)
+            self.count += 1
+            evicted = None
+            while len(box) > self.cap:
+                oldest = box.popleft()
+                evicted = oldest.id
+                self._forget(oldest)
+        self._queue.put((KIND_MESSAGE, username, entry))
+        if evicted is not None:
+            # Pesan tertua yang melewati cap dibuang secara permanen
+            self._queue.put((KIND_ACK, username, evicted))
+
+    def pending(self, username: str) -> int:
+        """Jumlah pesan yang menunggu untuk pengguna"""
+        box = self._boxes.get(username)
+        return len(box) if box else 0
+
+    def ack(self, username: str, upto: int) -> int:
+        """Menghapus pesan dengan id <= upto yang sudah diterima klien, mengembalikan jumlahnya"""
+        removed = 0
+        with self._lock:
+            box = self._boxes.get(username)
+            while box and box[0].id <= upto:
+                self._forget(box.popleft())
+                removed += 1
+        if removed:
+            self._queue.put((KIND_ACK, username, upto))
+        return removed
+
+    def _forget(self, entry: _Entry) -> None:
+        """Melepas entri yang sudah dikeluarkan dari box pemiliknya (dipanggil dengan lock)"""
+        self.count -= 1
+        entry.dead = True
+        if entry.base is not None:
+            self._live.get(entry.base, {}).pop(entry.id, None)
+        box = self._boxes.get(entry.owner)
+        if box is not None and not box:
+            del self._boxes[entry.owner]
+
+    def fetch(self, username: str, limit: int) -> List[Tuple[int, str]]:
+        """Membaca (id, frame) pesan yang belum kadaluarsa (blocking, jalankan di executor)"""
+        now = time.time()
+        with self._lock:
+            box = self._boxes.get(username, ())
+            entries = [entry for entry in box if entry.expires > now][:limit]
+        result = []
+        for entry in entries:
+            payload = self._read(entry)
+            if payload is not None:
+                result.append((entry.id, payload.decode()))
+        return result
+
+    def _read(self, entry: _Entry) -> Optional[bytes]:
+        # Segmen bisa dipindah pemadatan di antara membaca lokasi dan membaca file, coba ulang
+        for _ in range(3):
+            with self._lock:
+                if entry.dead:
+                    return None
+                if entry.payload is not None:
+                    return entry.payload
+                base, offset, size = entry.base, entry.offset, entry.size
+            try:
+                with open(self._path(base), "rb") as f:
+                    return os.pread(f.fileno(), size, offset)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _roll(self) -> None:
+        """Membuka segmen baru sebagai segmen aktif"""
+        if self._file is not None:
+            self._file.close()
+        segments = self._segments()
+        self._base = (segments[-1] + 1) if segments else 1
+        self._file = open(self._path(self._base), "ab")
+        self._size = 0
+        with self._lock:
+            self._live[self._base] = {}
+            self._records[self._base] = 0
+
+    def _writer_loop(self) -> None:
+        """Writer thread: menulis record dari antrian dan menjalankan pemeliharaan berkala"""
+        next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+        while True:
+            try:
+                item = self._queue.get(timeout=MAINTENANCE_INTERVAL)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            batch = [item] if item else []
+            try:
+                while len(batch) < WRITE_BATCH:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        self._queue.put(None)
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+                if time.monotonic() >= next_maintenance:
+                    next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+                    self.maintain()
+            except Exception as e:
+                logger.error(f"Error saat menulis kotak surat: {e}")
+        self._file.close()
+
+    def _append(self, kind: int, entry_id: int, expires: float, username: str, payload: bytes = b"") -> int:
+        """Menulis satu record ke segmen aktif, mengembalikan offset payload"""
+        if self._size >= self.segment_size:
+            self._roll()
+        name = username.encode()
+        self._file.write(_HEADER.pack(kind, entry_id, expires, len(name), len(payload)) + name + payload)
+        offset = self._size + _HEADER.size + len(name)
+        self._size = offset + len(payload)
+        return offset
+
+    def _write_batch(self, batch: list) -> None:
+        """Menulis satu batch record; lokasi entri baru dipasang setelah data di-flush"""
+        placed = []
+        for kind, username, value in batch:
+            if kind == KIND_MESSAGE:
+                with self._lock:
+                    if value.dead:
+                        continue
+                    payload = value.payload
+                offset = self._append(kind, value.id, value.expires, username, payload)
+                placed.append((value, self._base, offset))
+            else:
+                self._append(kind, value, 0.0, username)
+        self._file.flush()
+        with self._lock:
+            for entry, base, offset in placed:
+                self._records[base] += 1
+                if entry.dead:
+                    continue
+                entry.base, entry.offset, entry.payload = base, offset, None
+                self._live[base][entry.id] = entry
+
+    def maintain(self) -> None:
+        """Membuang entri kadaluarsa lalu memadatkan segmen dari yang tertua"""
+        now = time.time()
+        with self._lock:
+            for box in list(self._boxes.values()):
+                while box and box[0].expires <= now:
+                    self._forget(box.popleft())
+
+        # Hanya segmen tertua yang dipadatkan: record ack di segmen yang lebih baru
+        # masih dibutuhkan selama pesan yang di-ack-nya ada di segmen sebelumnya
+        for base in sorted(self._records):
+            if base == self._base:
+                break
+            with self._lock:
+                live = list(self._live.get(base, {}).values())
+                total = self._records[base]
+            if live and len(live) >= total * self.compact_ratio:
+                break
+            if live:
+                self._relocate(base, live)
+            os.unlink(self._path(base))
+            with self._lock:
+                self._live.pop(base, None)
+                self._records.pop(base, None)
+
+    def _relocate(self, base: int, entries: List[_Entry]) -> None:
+        """Menyalin entri hidup sebuah segmen ke segmen aktif"""
+        placed = []
+        with open(self._path(base), "rb") as f:
+            for entry in entries:
+                payload = os.pread(f.fileno(), entry.size, entry.offset)
+                offset = self._append(KIND_MESSAGE, entry.id, entry.expires, entry.owner, payload)
+                placed.append((entry, self._base, offset))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        with self._lock:
+            for entry, new_base, offset in placed:
+                self._records[new_base] += 1
+                self._live.get(base, {}).pop(entry.id, None)
+                if entry.dead:
+                    continue
+                entry.base, entry.offset = new_base, offset
+                self._live[new_base][entry.id] = entry
+
+    def close(self) -> None:
+        """Menunggu writer thread menulis sisa antrian lalu berhenti"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
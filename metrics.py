@@ -0,0 +1,160 @@
+# metrics.py
+import bisect
+import math
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bucket default histogram durasi dalam detik
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = ",".join(f'{name}="{value}"' for name, value in labels)
+    return "{" + escaped + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Counter naik-saja; nilai bisa diambil dari callback saat scrape"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, func: Optional[Callable[[], float]] = None,
+                 labels: Tuple[Tuple[str, str], ...] = ()):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.label_pairs = labels
+        self.value = 0
+        self._children: Dict[str, "Counter"] = {}
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def labels(self, name: str, value: str) -> "Counter":
+        """Counter anak untuk satu nilai label, dibuat sekali lalu di-cache"""
+        child = self._children.get(value)
+        if child is None:
+            child = self._children[value] = type(self)(self.name, self.help, labels=((name, value),))
+        return child
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        if self._children:
+            return [(self.name, child.label_pairs, child.value) for child in self._children.values()]
+        return [(self.name, self.label_pairs, self.func() if self.func else self.value)]
+
+
+class Gauge(Counter):
+    """Nilai sesaat yang bisa naik turun"""
+
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+
+class Histogram:
+    """Histogram bucket tetap berbasis array, observe cukup satu bisect"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 labels: Tuple[Tuple[str, str], ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_pairs = labels
+        self._children: Dict[str, "Histogram"] = {}
+        self.bounds = tuple(sorted(buckets))
+        # Satu slot tambahan untuk nilai di atas bucket terbesar (+Inf)
+        self.counts = array("Q", bytes(8 * (len(self.bounds) + 1)))
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def labels(self, name: str, value: str) -> "Histogram":
+        """Histogram anak untuk satu nilai label, dibuat sekali lalu di-cache"""
+        child = self._children.get(value)
+        if child is None:
+            child = self._children[value] = type(self)(self.name, self.help, self.bounds, ((name, value),))
+        return child
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        if self._children:
+            return [sample for child in self._children.values() for sample in child.samples()]
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += count
+            result.append((f"{self.name}_bucket", self.label_pairs + (("le", _format_value(float(bound))),),
+                           cumulative))
+        result.append((f"{self.name}_sum", self.label_pairs, self.sum))
+        result.append((f"{self.name}_count", self.label_pairs, self.count))
+        return result
+
+
+class Registry:
+    """Kumpulan metrik proses ini dalam format teks Prometheus"""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metrik {metric.name} sudah terdaftar")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, func: Optional[Callable[[], float]] = None) -> Counter:
+        return self._register(Counter(name, help, func))
+
+    def gauge(self, name: str, help: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help, func))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        """Menyusun semua metrik menjadi teks exposition Prometheus"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def metrics_endpoint(registry: Registry = REGISTRY, path: str = "/metrics"):
+    """Membuat hook process_request websockets yang melayani path metrik lewat HTTP biasa"""
+
+    def process_request(connection, request):
+        if request.path != path:
+            return None
+        response = connection.respond(200, registry.render())
+        # Headers websockets multi-value, hapus dulu agar tidak ada dua Content-Type
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = CONTENT_TYPE
+        return response
+
+    return process_request
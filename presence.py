@@ -0,0 +1,123 @@
+# presence.py
+import asyncio
+import json
+import secrets
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set
+
+# Jendela penggabungan diff (detik) dan jumlah diff yang disimpan untuk klien tertinggal
+DEFAULT_WINDOW = 0.05
+DEFAULT_LOG_SIZE = 256
+
+
+class Presence:
+    """Roster pengguna online berversi; perubahan dalam satu window digabung menjadi satu diff
+
+    Pengguna dihitung per sumber: worker ini (punya minimal satu sesi lokal) dan setiap
+    worker lain yang melaporkannya lewat bus. Pengguna online jika minimal satu sumber.
+    """
+
+    def __init__(self, window: float = DEFAULT_WINDOW, log_size: int = DEFAULT_LOG_SIZE,
+                 on_diff: Optional[Callable[[dict], None]] = None,
+                 on_local: Optional[Callable[[List[str], List[str]], None]] = None):
+        self.window = window
+        # Versi hanya bermakna dalam satu epoch (satu proses); epoch berbeda berarti snapshot
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        # Roster pada self.version
+        self.online: Set[str] = set()
+        self.on_diff = on_diff
+        self.on_local = on_local
+        self.log: deque = deque(maxlen=log_size)
+        self._counts: Dict[str, int] = {}
+        # Username yang statusnya mungkin berubah sejak diff terakhir
+        self._changed: Set[str] = set()
+        # Transisi sesi lokal untuk direplikasi ke worker lain, True = join
+        self._local: Dict[str, bool] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._snapshot = None
+
+    def add(self, username: str, local: bool = True) -> None:
+        """Satu sumber menyatakan pengguna online"""
+        count = self._counts.get(username, 0) + 1
+        self._counts[username] = count
+        if count == 1:
+            self._changed.add(username)
+        if local:
+            self._mark_local(username, True)
+        self._schedule_flush()
+
+    def remove(self, username: str, local: bool = True) -> None:
+        """Satu sumber menyatakan pengguna offline"""
+        count = self._counts.get(username, 0) - 1
+        if count > 0:
+            self._counts[username] = count
+        elif self._counts.pop(username, None) is not None:
+            self._changed.add(username)
+        if local:
+            self._mark_local(username, False)
+        self._schedule_flush()
+
+    def _mark_local(self, username: str, joined: bool) -> None:
+        # Join lalu leave (atau sebaliknya) dalam satu window saling meniadakan
+        if self._local.get(username) is (not joined):
+            del self._local[username]
+        else:
+            self._local[username] = joined
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self) -> None:
+        """Menerbitkan perubahan yang terkumpul sebagai satu diff berversi"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if self._local:
+            local, self._local = self._local, {}
+            if self.on_local is not None:
+                self.on_local(sorted(u for u, joined in local.items() if joined),
+                              sorted(u for u, joined in local.items() if not joined))
+
+        changed, self._changed = self._changed, set()
+        joined = sorted(u for u in changed if u in self._counts and u not in self.online)
+        left = sorted(u for u in changed if u not in self._counts and u in self.online)
+        if not joined and not left:
+            return
+        self.online.update(joined)
+        self.online.difference_update(left)
+        self.version += 1
+        self.log.append((self.version, joined, left))
+        if self.on_diff is not None:
+            self.on_diff(self._diff(self.version - 1, joined, left))
+
+    def _diff(self, base: int, joined: List[str], left: List[str]) -> dict:
+        return {"type": "presence", "epoch": self.epoch, "base": base, "version": self.version,
+                "joined": joined, "left": left}
+
+    def snapshot_frame(self) -> str:
+        """Snapshot roster dalam JSON, di-serialize sekali per versi"""
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            text = json.dumps({"type": "presence_snapshot", "epoch": self.epoch,
+                               "version": self.version, "users": sorted(self.online)})
+            self._snapshot = (self.version, text)
+        return self._snapshot[1]
+
+    def sync_frame(self, epoch=None, since=None) -> str:
+        """Diff gabungan sejak versi since, atau snapshot jika versi tersebut sudah keluar dari log"""
+        if epoch != self.epoch or not isinstance(since, int) or not 0 <= since <= self.version:
+            return self.snapshot_frame()
+        if since < self.version and (not self.log or self.log[0][0] > since + 1):
+            return self.snapshot_frame()
+        net: Dict[str, bool] = {}
+        for version, joined, left in self.log:
+            if version <= since:
+                continue
+            for username in joined:
+                net[username] = True
+            for username in left:
+                net[username] = False
+        return json.dumps(self._diff(since, sorted(u for u, on in net.items() if on),
+                                     sorted(u for u, on in net.items() if not on)))
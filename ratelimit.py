@@ -0,0 +1,96 @@
+# ratelimit.py
+import time
+from array import array
+from typing import Dict, List
+
+
+class TokenBuckets:
+    """Kumpulan token bucket dalam array paralel, satu slot per pemilik (~20 byte per slot)"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = array("d")
+        self.stamps = array("d")
+        self.strikes = array("I")
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.tokens) - len(self._free)
+
+    def allocate(self) -> int:
+        """Mengambil slot kosong dengan bucket penuh"""
+        now = time.monotonic()
+        if self._free:
+            slot = self._free.pop()
+            self.tokens[slot] = self.burst
+            self.stamps[slot] = now
+            self.strikes[slot] = 0
+            return slot
+        self.tokens.append(self.burst)
+        self.stamps.append(now)
+        self.strikes.append(0)
+        return len(self.tokens) - 1
+
+    def release(self, slot: int) -> None:
+        self._free.append(slot)
+
+    def acquire(self, slot: int, now: float) -> float:
+        """Memakai satu token, mengembalikan lama tunggu (detik) sampai utangnya lunas"""
+        tokens = self.tokens[slot] + (now - self.stamps[slot]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        tokens -= 1
+        self.tokens[slot] = tokens
+        self.stamps[slot] = now
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+
+class RateLimiter:
+    """Token bucket per koneksi dan per pengguna; rate <= 0 mematikan level tersebut"""
+
+    def __init__(self, rate: float, burst: float, user_rate: float, user_burst: float):
+        self.connections = TokenBuckets(rate, burst)
+        self.users = TokenBuckets(user_rate, user_burst)
+        # username -> [slot, jumlah koneksi]
+        self._user_slots: Dict[str, list] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.connections.rate > 0 or self.users.rate > 0
+
+    def connect(self, username: str):
+        """Mendaftarkan koneksi, mengembalikan (slot koneksi, slot pengguna)"""
+        entry = self._user_slots.get(username)
+        if entry is None:
+            entry = self._user_slots[username] = [self.users.allocate(), 0]
+        entry[1] += 1
+        return self.connections.allocate(), entry[0]
+
+    def disconnect(self, username: str, slot: int) -> None:
+        self.connections.release(slot)
+        entry = self._user_slots.get(username)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._user_slots[username]
+                self.users.release(entry[0])
+
+    def acquire(self, slot: int, user_slot: int) -> float:
+        """Lama tunggu sebelum pesan berikutnya boleh diproses, 0 jika tidak dibatasi"""
+        now = time.monotonic()
+        delay = 0.0
+        if self.connections.rate > 0:
+            delay = self.connections.acquire(slot, now)
+        if self.users.rate > 0:
+            delay = max(delay, self.users.acquire(user_slot, now))
+        strikes = self.connections.strikes
+        if delay:
+            strikes[slot] += 1
+        elif strikes[slot]:
+            strikes[slot] = 0
+        return delay
+
+    def strikes(self, slot: int) -> int:
+        """Jumlah pesan berturut-turut yang terkena batas pada koneksi ini"""
+        return self.connections.strikes[slot]
@@ -0,0 +1,147 @@
+# recorder.py
+import base64
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_VERSION = 1
+# Maksimal event yang menunggu writer thread; di atas itu event dibuang agar event loop tidak tertahan
+MAX_PENDING = 100_000
+# Maksimal event yang ditulis writer thread dalam satu batch
+WRITE_BATCH = 1024
+
+EVENT_OPEN = "open"
+EVENT_FRAME = "frame"
+EVENT_CLOSE = "close"
+
+
+class Recorder:
+    """Merekam frame masuk per koneksi ke file JSONL untuk di-replay (replay.py)
+
+    Dipanggil dari event loop tanpa I/O: event masuk antrian, writer thread yang
+    meng-serialize dan menulisnya. Frame autentikasi tidak pernah direkam, jadi capture
+    tidak berisi password; sesi tercatat lewat event open dengan username-nya.
+    """
+
+    def __init__(self, path: str, max_pending: int = MAX_PENDING):
+        self.path = path
+        self.max_pending = max_pending
+        self.recorded = 0
+        self.dropped = 0
+        self._ids = itertools.count(1)
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        # Capture berisi token sesi, hanya bisa dibaca pemilik. O_APPEND dan satu write per
+        # batch membuat proses lama dan baru saat drain bisa menambah file yang sama
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._write(json.dumps({"event": "capture", "version": CAPTURE_VERSION, "pid": os.getpid(),
+                                "started": time.time(), "t": time.monotonic()}) + "\n")
+        self._thread = threading.Thread(target=self._writer_loop, name="recorder", daemon=True)
+        self._thread.start()
+
+    def _put(self, event: tuple) -> None:
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self.recorded += 1
+        self._queue.put(event)
+
+    def connection_opened(self, username: str, subprotocol: Optional[str], resumed: bool = False,
+                          rooms: Iterable[str] = ()) -> int:
+        """Mencatat sesi baru yang sudah terautentikasi, mengembalikan id koneksi"""
+        conn = next(self._ids)
+        self._put((EVENT_OPEN, conn, time.monotonic(), (username, subprotocol, resumed, list(rooms))))
+        return conn
+
+    def frame(self, conn: int, frame) -> None:
+        """Mencatat satu frame masuk apa adanya (teks atau biner)"""
+        self._put((EVENT_FRAME, conn, time.monotonic(), frame))
+
+    def connection_closed(self, conn: int) -> None:
+        self._put((EVENT_CLOSE, conn, time.monotonic(), None))
+
+    def _writer_loop(self) -> None:
+        """Writer thread: meng-serialize event dari antrian dan menulisnya per batch"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            try:
+                while len(batch) < WRITE_BATCH:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        self._queue.put(None)
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            try:
+                self._write("".join(_format(event) for event in batch))
+            except Exception as e:
+                logger.error(f"Error saat menulis capture: {e}")
+        os.close(self._fd)
+
+    def _write(self, text: str) -> None:
+        data = memoryview(text.encode())
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    def close(self) -> None:
+        """Menunggu writer thread menulis sisa antrian lalu menutup file"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            if self.dropped:
+                logger.warning(f"Capture {self.path}: {self.dropped} event dibuang karena antrian penuh")
+
+
+def _format(event: tuple) -> str:
+    kind, conn, t, data = event
+    record = {"event": kind, "conn": conn, "t": round(t, 6)}
+    if kind == EVENT_OPEN:
+        username, subprotocol, resumed, rooms = data
+        record.update(user=username, subprotocol=subprotocol, resumed=resumed, rooms=rooms)
+    elif kind == EVENT_FRAME:
+        if isinstance(data, str):
+            record["text"] = data
+        else:
+            record["binary"] = base64.b64encode(data).decode()
+    return json.dumps(record) + "\n"
+
+
+def read_capture(paths: List[str]) -> Iterator[dict]:
+    """Event dari satu atau beberapa capture (misalnya satu per worker) urut waktu monotonic
+
+    Id koneksi diberi prefix nomor file dan nomor header agar unik saat capture digabung
+    atau satu file ditambahi oleh beberapa proses berturut-turut.
+    """
+    events = []
+    for index, path in enumerate(paths):
+        part = 0
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Baris terakhir bisa terpotong jika server berhenti mendadak
+                    logger.warning(f"Baris capture tidak valid di {path}, dilewati")
+                    continue
+                if event.get("event") == "capture":
+                    part += 1
+                    continue
+                if event.get("event") not in (EVENT_OPEN, EVENT_FRAME, EVENT_CLOSE):
+                    continue
+                event["conn"] = f"{index}.{part}:{event['conn']}"
+                events.append(event)
+    events.sort(key=lambda event: event["t"])
+    return iter(events)
@@ -0,0 +1,332 @@
+# replay.py
+import argparse
+import asyncio
+import base64
+import json
+import shlex
+from collections import deque
+from typing import Dict, List, Optional
+
+import websockets
+
+from bench import SERVER_SCRIPT, percentiles, start_server, stop_server, wait_for_port
+from codec import codec_for
+from recorder import EVENT_CLOSE, EVENT_FRAME, EVENT_OPEN, read_capture
+
+# Login sesi dimulai sekian detik sebelum event open-nya
+LOGIN_LEAD = 1.0
+# Metrik yang dibandingkan berdampingan pada --compare: (label, key, sub-key)
+COMPARE_ROWS = (
+    ("frame terkirim/detik", "sent_per_s", None),
+    ("pesan diterima/detik", "received_per_s", None),
+    ("echo p50 (ms)", "echo_latency", "p50_ms"),
+    ("echo p99 (ms)", "echo_latency", "p99_ms"),
+    ("echo p999 (ms)", "echo_latency", "p999_ms"),
+    ("telat kirim p99 (ms)", "send_lag", "p99_ms"),
+    ("login gagal", "login_failed", None),
+)
+
+
+class ReplayConnection:
+    """Satu sesi dari capture: login ulang dengan kredensial replay lalu mengirim frame sesuai jadwal"""
+
+    def __init__(self, uri: str, username: str, password: Optional[str], subprotocol: Optional[str],
+                 rooms: List[str]):
+        self.uri = uri
+        self.username = username
+        self.subprotocol = subprotocol
+        self.codec = codec_for(subprotocol)
+        self.rooms = rooms
+        self.websocket = None
+        self.token = None
+        self.error: Optional[str] = None
+        self.sent = 0
+        self.skipped = 0
+        self.frames = 0
+        self.received = 0
+        # Keterlambatan kirim terhadap jadwal capture dan latensi echo pesan sendiri (detik)
+        self.lags: List[float] = []
+        self.latencies: List[float] = []
+        # Isi pesan publish -> waktu kirim, dicocokkan dengan broadcast yang kembali
+        self.pending: Dict[str, deque] = {}
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self.run(password))
+
+    async def login(self, password: Optional[str]) -> None:
+        """Login baru dengan username sesi capture; resume tidak diputar ulang karena tokennya sudah lain"""
+        if password is None:
+            raise RuntimeError("kredensial tidak tersedia")
+        self.websocket = await websockets.connect(
+            self.uri, subprotocols=[self.subprotocol] if self.subprotocol else None, max_queue=None)
+        await self.websocket.recv()
+        await self.websocket.send(self.codec.encode({"username": self.username}))
+        await self.websocket.recv()
+        await self.websocket.send(self.codec.encode({"password": password}))
+        data = self.codec.decode(await self.websocket.recv())
+        if data.get("type") != "auth_success":
+            raise RuntimeError(data.get("message", "autentikasi gagal"))
+        self.token = data["token"]
+
+    async def run(self, password: Optional[str]) -> None:
+        """Login lalu mengirim frame dari antrian sampai event close (None)"""
+        loop = asyncio.get_running_loop()
+        reader = None
+        try:
+            await self.login(password)
+            reader = asyncio.create_task(self.read())
+            # Sesi resume di capture membawa room-nya sendiri, replay login baru lalu join ulang
+            for room in self.rooms:
+                await self.websocket.send(self.prepare({"type": "join", "room": room})[0])
+            while True:
+                item = await self.queue.get()
+                if item is None:
+                    break
+                due, event = item
+                lag = due - loop.time()
+                if lag > 0:
+                    await asyncio.sleep(lag)
+                frame, messages = self.decode_event(event)
+                now = loop.time()
+                self.lags.append(max(0.0, now - due))
+                for message in messages:
+                    self.pending.setdefault(message, deque()).append(now)
+                await self.websocket.send(frame)
+                self.sent += 1
+        except websockets.exceptions.ConnectionClosed as e:
+            self.error = f"koneksi ditutup: {e}"
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            while not self.queue.empty():
+                if self.queue.get_nowait() is not None:
+                    self.skipped += 1
+            if self.websocket is not None:
+                await self.websocket.close()
+            if reader is not None:
+                reader.cancel()
+
+    def prepare(self, data) -> tuple:
+        """Mengganti token capture dengan token sesi replay; (frame, isi pesan publish)"""
+        items = data if isinstance(data, list) else (data,)
+        messages = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            if "token" in item:
+                item["token"] = self.token
+            if item.get("type", "publish") == "publish" and isinstance(item.get("message"), str):
+                messages.append(item["message"])
+        if isinstance(data, list):
+            return self.codec.encode_batch([self.codec.encode(item) for item in data]), messages
+        return self.codec.encode(data), messages
+
+    def decode_event(self, event: dict) -> tuple:
+        if "binary" in event:
+            # Codec biner mengikat autentikasi ke koneksi, frame dikirim apa adanya
+            frame = base64.b64decode(event["binary"])
+            try:
+                _, messages = self.prepare(self.codec.decode(frame))
+            except ValueError:
+                messages = []
+            return frame, messages
+        text = event["text"]
+        try:
+            frame, messages = self.prepare(json.loads(text))
+        except ValueError:
+            # Frame rusak tetap dikirim agar jalur error server ikut diuji
+            return text, []
+        # Frame tanpa token dikirim persis seperti yang direkam
+        return (frame if '"token"' in text else text), messages
+
+    async def read(self) -> None:
+        """Menghitung frame masuk dan mencatat latensi echo pesan yang dikirim sesi ini"""
+        loop = asyncio.get_running_loop()
+        try:
+            async for frame in self.websocket:
+                now = loop.time()
+                self.frames += 1
+                try:
+                    data = self.codec.decode(frame)
+                except ValueError:
+                    continue
+                # Frame batch berisi beberapa pesan, throughput dihitung per pesan
+                items = data if isinstance(data, list) else (data,)
+                self.received += len(items)
+                if not self.pending:
+                    continue
+                for item in items:
+                    # Broadcast chat tidak punya type; pesan sendiri dicocokkan dengan isinya
+                    if not isinstance(item, dict) or "type" in item or item.get("username") != self.username:
+                        continue
+                    sent = self.pending.get(item.get("message"))
+                    if sent:
+                        self.latencies.append(now - sent.popleft())
+                        if not sent:
+                            del self.pending[item["message"]]
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+def peak_connections(events: List[dict]) -> int:
+    """Jumlah sesi terbuka bersamaan terbanyak dalam capture"""
+    open_now = peak = 0
+    for event in events:
+        if event["event"] == EVENT_OPEN:
+            open_now += 1
+            peak = max(peak, open_now)
+        elif event["event"] == EVENT_CLOSE:
+            open_now -= 1
+    return peak
+
+
+async def replay(events: List[dict], uri: str, speed: float, credentials: Dict[str, str],
+                 default_password: Optional[str], drain: float, login_lead: float = LOGIN_LEAD) -> dict:
+    """Memutar ulang capture dengan jarak antar-event asli dibagi speed"""
+    loop = asyncio.get_running_loop()
+    connections: Dict[str, ReplayConnection] = {}
+    sessions: List[ReplayConnection] = []
+    orphans = 0
+
+    # Event open di capture dicatat setelah autentikasi selesai, jadi login replay dimulai
+    # login_lead detik lebih awal agar frame pertama sesi tidak tertahan login
+    def scheduled(event):
+        return event["t"] - login_lead * speed if event["event"] == EVENT_OPEN else event["t"]
+
+    ordered = sorted(events, key=scheduled)
+    start = loop.time()
+    base = scheduled(ordered[0]) if ordered else 0
+    for event in ordered:
+        due = start + (scheduled(event) - base) / speed
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = event["event"]
+        if kind == EVENT_OPEN:
+            connection = ReplayConnection(uri, event["user"], credentials.get(event["user"], default_password),
+                                          event.get("subprotocol"), event.get("rooms", []))
+            connections[event["conn"]] = connection
+            sessions.append(connection)
+        elif kind == EVENT_FRAME:
+            connection = connections.get(event["conn"])
+            if connection is None:
+                # Koneksi sudah terbuka sebelum rekaman dimulai
+                orphans += 1
+                continue
+            connection.queue.put_nowait((due, event))
+        elif kind == EVENT_CLOSE:
+            connection = connections.pop(event["conn"], None)
+            if connection is not None:
+                connection.queue.put_nowait(None)
+
+    # Sesi yang masih terbuka di akhir capture diberi waktu menerima sisa pesan
+    await asyncio.sleep(drain)
+    for connection in connections.values():
+        connection.queue.put_nowait(None)
+    await asyncio.gather(*[connection.task for connection in sessions], return_exceptions=True)
+    elapsed = loop.time() - start
+
+    sent = sum(connection.sent for connection in sessions)
+    received = sum(connection.received for connection in sessions)
+    frames = sum(connection.frames for connection in sessions)
+    errors: Dict[str, int] = {}
+    for connection in sessions:
+        if connection.error is not None:
+            errors[connection.error] = errors.get(connection.error, 0) + 1
+    return {
+        "speed": speed,
+        "capture_s": round(events[-1]["t"] - events[0]["t"], 3) if events else 0,
+        "replay_s": round(elapsed, 3),
+        "connections": len(sessions),
+        "peak_connections": peak_connections(events),
+        "login_failed": sum(1 for connection in sessions if connection.token is None),
+        "frames_sent": sent,
+        "frames_skipped": orphans + sum(connection.skipped for connection in sessions),
+        "frames_received": frames,
+        "messages_received": received,
+        "sent_per_s": round(sent / elapsed, 1) if elapsed else 0,
+        "received_per_s": round(received / elapsed, 1) if elapsed else 0,
+        "send_lag": percentiles([lag for connection in sessions for lag in connection.lags]),
+        "echo_latency": percentiles([x for connection in sessions for x in connection.latencies]),
+        "errors": errors,
+    }
+
+
+def compare_table(baseline: dict, current: dict) -> str:
+    """Tabel metrik baseline dan hasil sekarang berdampingan beserta selisihnya"""
+    lines = [f"{'metrik':<24}{'baseline':>12}{'sekarang':>12}{'selisih':>12}"]
+    for label, key, sub in COMPARE_ROWS:
+        old, new = baseline.get(key), current.get(key)
+        if sub is not None:
+            old = old.get(sub) if isinstance(old, dict) else None
+            new = new.get(sub) if isinstance(new, dict) else None
+        if old is None or new is None:
+            lines.append(f"{label:<24}{str(old):>12}{str(new):>12}{'-':>12}")
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else f"{new - old:+g}"
+        lines.append(f"{label:<24}{old:>12g}{new:>12g}{change:>12}")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    """Membaca argumen CLI replay"""
+    parser = argparse.ArgumentParser(description="Replay capture server chat (server.py --record)")
+    parser.add_argument("captures", nargs="+", help="file capture JSONL, beberapa file (per worker) digabung")
+    parser.add_argument("--uri", default="ws://localhost:8765", help="server tujuan jika tidak memakai --spawn")
+    parser.add_argument("--spawn", action="store_true", help="jalankan server.py baru untuk replay ini")
+    parser.add_argument("--server-script", default=SERVER_SCRIPT, help="server.py yang dijalankan --spawn")
+    parser.add_argument("--server-args", default="", help="opsi tambahan untuk server --spawn")
+    parser.add_argument("--port", type=int, default=8799, help="port server --spawn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0, help="kelipatan kecepatan, 1 = jarak waktu asli")
+    parser.add_argument("--credentials", help="file JSON {username: password} untuk login ulang sesi capture")
+    parser.add_argument("--password", help="password untuk pengguna yang tidak ada di --credentials")
+    parser.add_argument("--login-lead", type=float, default=LOGIN_LEAD,
+                        help="mulai login sesi sekian detik sebelum jadwalnya")
+    parser.add_argument("--drain", type=float, default=2, help="jeda menunggu sisa pesan di akhir (detik)")
+    parser.add_argument("--output", help="simpan hasil JSON ke file ini")
+    parser.add_argument("--compare", help="hasil JSON replay sebelumnya untuk dibandingkan")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed harus lebih dari 0")
+    return args
+
+
+async def run(args) -> dict:
+    events = list(read_capture(args.captures))
+    credentials = {}
+    if args.credentials:
+        with open(args.credentials) as f:
+            credentials = json.load(f)
+    if not args.spawn:
+        return await replay(events, args.uri, args.speed, credentials, args.password, args.drain,
+                            args.login_lead)
+
+    process = start_server(args.port, args.workers, peak_connections(events) + 10,
+                           shlex.split(args.server_args), args.server_script)
+    try:
+        await wait_for_port("localhost", args.port)
+        await asyncio.sleep(1 + 0.5 * args.workers)
+        return await replay(events, f"ws://localhost:{args.port}", args.speed, credentials,
+                            args.password, args.drain, args.login_lead)
+    finally:
+        stop_server(process)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    result["captures"] = args.captures
+    output = json.dumps({"scenario": "replay", "results": result}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print(compare_table(baseline, result))
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# rooms.py
+import re
+from typing import Dict, Set
+
+# Room yang otomatis diikuti setiap klien setelah autentikasi
+DEFAULT_ROOM = "umum"
+
+# Nama room: huruf, angka, garis bawah, titik, atau strip, maksimal 64 karakter
+ROOM_NAME_PATTERN = re.compile(r"^[\w.\-]{1,64}$")
+
+_EMPTY: frozenset = frozenset()
+
+
+def is_valid_room(name) -> bool:
+    """Cek apakah nama room valid"""
+    return isinstance(name, str) and ROOM_NAME_PATTERN.match(name) is not None
+
+
+class RoomIndex:
+    """Indeks room->subscriber dan indeks balik koneksi->room"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[object]] = {}
+        self.client_rooms: Dict[object, Set[str]] = {}
+
+    def join(self, client, room: str) -> bool:
+        """Menambahkan klien ke room, False jika sudah tergabung"""
+        rooms = self.client_rooms.setdefault(client, set())
+        if room in rooms:
+            return False
+        rooms.add(room)
+        self.subscribers.setdefault(room, set()).add(client)
+        return True
+
+    def leave(self, client, room: str) -> bool:
+        """Mengeluarkan klien dari room, False jika belum tergabung"""
+        rooms = self.client_rooms.get(client)
+        if not rooms or room not in rooms:
+            return False
+        rooms.discard(room)
+        self._remove_subscriber(room, client)
+        return True
+
+    def leave_all(self, client) -> Set[str]:
+        """Mengeluarkan klien dari semua room-nya, biaya sebanding jumlah room klien"""
+        rooms = self.client_rooms.pop(client, None)
+        if not rooms:
+            return set()
+        for room in rooms:
+            self._remove_subscriber(room, client)
+        return rooms
+
+    def _remove_subscriber(self, room: str, client) -> None:
+        """Menghapus subscriber dan membuang room yang sudah kosong"""
+        members = self.subscribers.get(room)
+        if members is not None:
+            members.discard(client)
+            if not members:
+                del self.subscribers[room]
+
+    def members(self, room: str):
+        """Mendapatkan subscriber sebuah room (jangan diubah oleh pemanggil)"""
+        return self.subscribers.get(room, _EMPTY)
+
+    def rooms_of(self, client):
+        """Mendapatkan room yang diikuti klien"""
+        return self.client_rooms.get(client, _EMPTY)
+
+    def is_member(self, client, room: str) -> bool:
+        """Cek apakah klien tergabung dalam room"""
+        return room in self.client_rooms.get(client, _EMPTY)
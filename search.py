@@ -0,0 +1,470 @@
+# search.py
+import bisect
+import json
+import logging
+import math
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+MAX_TOKEN_LENGTH = 64
+# Memtable dibekukan menjadi segmen setelah sekian pesan, atau setelah sepi sekian detik
+FLUSH_DOCS = 10_000
+FLUSH_INTERVAL = 30
+# Segmen bertingkat: MERGE_FACTOR segmen berurutan pada tingkat yang sama digabung menjadi satu
+MERGE_FACTOR = 4
+# Maksimal pesan yang diindeks indexer thread dalam satu batch
+INDEX_BATCH = 1024
+# Pesan per pembacaan log saat mengejar pesan yang belum terindeks setelah start
+CATCHUP_BATCH = 1000
+
+_MAGIC = b"CSI1"
+# Setelah magic: jumlah pesan dan panjang header JSON (room, pengguna, token)
+_HEADER = struct.Struct("<QI")
+_SUFFIX = ".seg"
+
+# Hasil pencarian: (seq, room)
+Hit = Tuple[int, str]
+
+
+def tokenize(text: str) -> Set[str]:
+    """Kata unik huruf kecil dalam teks"""
+    return {token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) <= MAX_TOKEN_LENGTH}
+
+
+def encode_postings(seqs: Iterable[int]) -> bytes:
+    """Posting list naik dikodekan sebagai selisih berurutan dalam varint"""
+    out = bytearray()
+    previous = 0
+    for seq in seqs:
+        delta = seq - previous
+        previous = seq
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_postings(data) -> List[int]:
+    result = []
+    previous = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        result.append(previous)
+        value = shift = 0
+    return result
+
+
+class _MemTable:
+    """Indeks pesan terbaru yang belum dibekukan; hanya diubah indexer thread"""
+
+    def __init__(self):
+        self.postings: Dict[str, List[int]] = {}
+        self.seqs: List[int] = []
+        self.rooms: List[str] = []
+        self.users: List[str] = []
+        self.times: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.seqs)
+
+    def add(self, seq: int, room: str, username: str, ts: int, tokens: Set[str]) -> None:
+        self.seqs.append(seq)
+        self.rooms.append(room)
+        self.users.append(username)
+        self.times.append(ts)
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                self.postings[token] = [seq]
+            else:
+                postings.append(seq)
+
+    def lookup(self, token: str) -> List[int]:
+        return self.postings.get(token, [])
+
+    def meta(self, seq: int) -> Tuple[str, str, int]:
+        i = bisect.bisect_left(self.seqs, seq)
+        return self.rooms[i], self.users[i], self.times[i]
+
+
+class Segment:
+    """Segmen indeks immutable: posting list per token (varint selisih) dan metadata per pesan"""
+
+    def __init__(self, seqs: array, room_ids: array, user_ids: array, times: array,
+                 rooms: List[str], users: List[str], terms: List[str], offsets: array, blob,
+                 path: Optional[str] = None):
+        self.seqs = seqs
+        self.room_ids = room_ids
+        self.user_ids = user_ids
+        self.times = times
+        self.rooms = rooms
+        self.users = users
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.blob = blob
+        self.path = path
+        self.min_ts = min(times) if times else 0
+        self.max_ts = max(times) if times else 0
+
+    def __len__(self) -> int:
+        return len(self.seqs)
+
+    @property
+    def first_seq(self) -> int:
+        return self.seqs[0]
+
+    @property
+    def last_seq(self) -> int:
+        return self.seqs[-1]
+
+    def lookup(self, token: str) -> List[int]:
+        i = self.terms.get(token)
+        if i is None:
+            return []
+        return decode_postings(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def meta(self, seq: int) -> Tuple[str, str, int]:
+        i = bisect.bisect_left(self.seqs, seq)
+        return self.rooms[self.room_ids[i]], self.users[self.user_ids[i]], self.times[i]
+
+    @classmethod
+    def build(cls, seqs: List[int], rooms: List[str], users: List[str], times: List[int],
+              postings: Dict[str, List[int]]) -> "Segment":
+        """Membekukan pesan berurutan seq beserta posting list-nya menjadi segmen"""
+        room_names = sorted(set(rooms))
+        user_names = sorted(set(users))
+        room_index = {name: i for i, name in enumerate(room_names)}
+        user_index = {name: i for i, name in enumerate(user_names)}
+        terms = sorted(postings)
+        offsets = array("Q", [0])
+        blob = bytearray()
+        for term in terms:
+            blob += encode_postings(postings[term])
+            offsets.append(len(blob))
+        return cls(array("Q", seqs), array("I", (room_index[r] for r in rooms)),
+                   array("I", (user_index[u] for u in users)), array("Q", times),
+                   room_names, user_names, terms, offsets, bytes(blob))
+
+    @classmethod
+    def merge(cls, segments: List["Segment"]) -> "Segment":
+        """Menggabungkan segmen berurutan seq; posting list cukup disambung per token"""
+        seqs: List[int] = []
+        rooms: List[str] = []
+        users: List[str] = []
+        times: List[int] = []
+        postings: Dict[str, List[int]] = {}
+        for segment in segments:
+            seqs.extend(segment.seqs)
+            rooms.extend(segment.rooms[i] for i in segment.room_ids)
+            users.extend(segment.users[i] for i in segment.user_ids)
+            times.extend(segment.times)
+            for term in segment.terms:
+                postings.setdefault(term, []).extend(segment.lookup(term))
+        return cls.build(seqs, rooms, users, times, postings)
+
+    def write(self, directory: str) -> None:
+        """Menulis segmen secara atomik sebagai {seq awal}-{seq akhir}.seg"""
+        terms = sorted(self.terms, key=self.terms.get)
+        header = json.dumps({"rooms": self.rooms, "users": self.users, "terms": terms}).encode()
+        path = os.path.join(directory, f"{self.first_seq:020d}-{self.last_seq:020d}{_SUFFIX}")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC + _HEADER.pack(len(self.seqs), len(header)) + header)
+            for column in (self.seqs, self.room_ids, self.user_ids, self.times, self.offsets):
+                f.write(column.tobytes())
+            f.write(self.blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.path = path
+
+    @classmethod
+    def load(cls, path: str) -> "Segment":
+        """Membaca segmen; posting list tetap di mmap dan hanya didekode saat dicari"""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:4] != _MAGIC:
+            raise ValueError(f"{path} bukan segmen indeks pencarian")
+        docs, header_length = _HEADER.unpack_from(mm, len(_MAGIC))
+        position = len(_MAGIC) + _HEADER.size
+        header = json.loads(mm[position:position + header_length])
+        position += header_length
+        columns = []
+        layout = (("Q", docs), ("I", docs), ("I", docs), ("Q", docs), ("Q", len(header["terms"]) + 1))
+        for typecode, count in layout:
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(mm[position:position + size])
+            columns.append(column)
+            position += size
+        seqs, room_ids, user_ids, times, offsets = columns
+        return cls(seqs, room_ids, user_ids, times, header["rooms"], header["users"], header["terms"],
+                   offsets, memoryview(mm)[position:], path)
+
+
+class SearchIndex:
+    """Indeks terbalik inkremental untuk pesan chat
+
+    add dipanggil dari event loop dan hanya memasukkan frame ke antrian. Indexer thread
+    men-parse dan mengindeks ke memtable, membekukannya menjadi segmen, dan merger thread
+    menggabungkan segmen di latar belakang. search membaca segmen (jalankan di executor).
+    """
+
+    def __init__(self, directory: Optional[str] = None, log=None, flush_docs: int = FLUSH_DOCS,
+                 flush_interval: float = FLUSH_INTERVAL, merge_factor: int = MERGE_FACTOR):
+        self.directory = directory
+        self.log = log
+        self.flush_docs = flush_docs
+        self.flush_interval = flush_interval
+        self.merge_factor = merge_factor
+        # Seq terbesar yang sudah diindeks (ditulis indexer thread)
+        self.last_seq = 0
+        self.segments: List[Segment] = []
+        self._memtable = _MemTable()
+        self._lock = threading.Lock()
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._merge_wanted = threading.Event()
+        self._closing = False
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+        self._indexer = threading.Thread(target=self._indexer_loop, name="search-index", daemon=True)
+        self._merger = threading.Thread(target=self._merger_loop, name="search-merge", daemon=True)
+        self._indexer.start()
+        self._merger.start()
+
+    @property
+    def docs(self) -> int:
+        return sum(len(segment) for segment in self.segments) + len(self._memtable)
+
+    def _load(self) -> None:
+        """Memuat segmen dari disk; segmen yang sudah tercakup hasil merge (crash) dibuang"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.unlink(os.path.join(self.directory, name))
+        # Nama segmen: {seq awal:020d}-{seq akhir:020d}.seg
+        names = sorted((name for name in os.listdir(self.directory) if name.endswith(_SUFFIX)),
+                       key=lambda name: (int(name[:20]), -int(name[21:41])))
+        if names and self.log is not None and not self.log.readonly \
+                and max(int(name[21:41]) for name in names) > self.log.last_seq:
+            # Log riwayat lebih pendek dari indeks (misalnya direktori riwayat dihapus)
+            logger.warning("Indeks pencarian melewati log riwayat, indeks dibangun ulang")
+            for name in names:
+                os.unlink(os.path.join(self.directory, name))
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if self.segments and int(name[21:41]) <= self.segments[-1].last_seq:
+                os.unlink(path)
+                continue
+            try:
+                self.segments.append(Segment.load(path))
+            except (ValueError, OSError, struct.error) as e:
+                logger.error(f"Segmen {name} rusak, dibuang: {e}")
+                os.unlink(path)
+                break
+        if self.segments:
+            self.last_seq = self.segments[-1].last_seq
+            logger.info(f"Indeks pencarian dimuat: {self.docs} pesan dalam {len(self.segments)} segmen")
+
+    def add(self, seq: int, frame: str) -> None:
+        """Memasukkan frame broadcast ke antrian indexer tanpa menunggu"""
+        self._queue.put((seq, frame))
+
+    def _catch_up(self) -> None:
+        """Mengindeks pesan di log riwayat yang belum masuk indeks (memtable hilang saat crash)"""
+        while not self._closing:
+            entries = self.log.read_since(self.last_seq, None, CATCHUP_BATCH)
+            for seq, frame in entries:
+                self._index(seq, frame)
+            if len(entries) < CATCHUP_BATCH:
+                break
+            if len(self._memtable) >= self.flush_docs:
+                self._flush()
+
+    def _index(self, seq: int, frame) -> None:
+        # Pesan yang sudah diindeks dari log saat catch-up juga datang lewat antrian
+        if seq <= self.last_seq:
+            return
+        self.last_seq = seq
+        try:
+            message = json.loads(frame)
+        except ValueError:
+            return
+        text = message.get("message")
+        if not isinstance(text, str):
+            return
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        with self._lock:
+            self._memtable.add(seq, message.get("room", ""), message.get("username", ""),
+                               int(message.get("ts", 0)), tokens)
+
+    def _flush(self) -> None:
+        """Membekukan memtable menjadi segmen baru"""
+        memtable = self._memtable
+        if not memtable:
+            return
+        segment = Segment.build(memtable.seqs, memtable.rooms, memtable.users, memtable.times,
+                                memtable.postings)
+        if self.directory is not None:
+            segment.write(self.directory)
+        with self._lock:
+            self.segments.append(segment)
+            self._memtable = _MemTable()
+        self._merge_wanted.set()
+
+    def _indexer_loop(self) -> None:
+        """Indexer thread: mengejar log lalu mengindeks frame dari antrian per batch"""
+        try:
+            if self.log is not None:
+                self._catch_up()
+        except Exception as e:
+            logger.error(f"Error saat mengejar log riwayat: {e}")
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            batch = [item] if item else []
+            try:
+                while len(batch) < INDEX_BATCH:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        self._queue.put(None)
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            try:
+                for seq, frame in batch:
+                    self._index(seq, frame)
+                # Antrian kosong selama flush_interval: memtable dibekukan walau belum penuh
+                if len(self._memtable) >= self.flush_docs or not batch:
+                    self._flush()
+            except Exception as e:
+                logger.error(f"Error saat mengindeks pesan: {e}")
+        try:
+            self._flush()
+        except Exception as e:
+            logger.error(f"Error saat menyimpan indeks pencarian: {e}")
+
+    def _level(self, segment: Segment) -> int:
+        return int(math.log(max(len(segment) / self.flush_docs, 1), self.merge_factor))
+
+    def _merge_candidates(self) -> List[Segment]:
+        """merge_factor segmen berurutan pertama dengan tingkat ukuran yang sama"""
+        segments = self.segments
+        for start in range(len(segments) - self.merge_factor + 1):
+            run = segments[start:start + self.merge_factor]
+            if len({self._level(segment) for segment in run}) == 1:
+                return run
+        return []
+
+    def _merger_loop(self) -> None:
+        """Merger thread: menggabungkan segmen tanpa menahan indexer atau pencarian"""
+        while True:
+            self._merge_wanted.wait()
+            self._merge_wanted.clear()
+            if self._closing:
+                break
+            try:
+                while not self._closing:
+                    with self._lock:
+                        run = self._merge_candidates()
+                    if not run:
+                        break
+                    merged = Segment.merge(run)
+                    if self.directory is not None:
+                        merged.write(self.directory)
+                    with self._lock:
+                        start = self.segments.index(run[0])
+                        self.segments[start:start + len(run)] = [merged]
+                    for segment in run:
+                        if segment.path is not None:
+                            os.unlink(segment.path)
+            except Exception as e:
+                logger.error(f"Error saat menggabungkan segmen pencarian: {e}")
+
+    def search(self, query: str, rooms: Optional[Set[str]] = None, username: Optional[str] = None,
+               from_ts: Optional[int] = None, to_ts: Optional[int] = None, before: Optional[int] = None,
+               limit: int = 20) -> Tuple[List[Hit], Optional[int]]:
+        """Pesan terbaru yang memuat semua kata query (blocking, jalankan di executor)
+
+        Filter: rooms, username, rentang ts (ms) from_ts..to_ts, dan cursor before (seq).
+        Mengembalikan (hit urut seq turun, cursor halaman berikutnya atau None).
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return [], None
+        need = limit + 1
+
+        def matches(source) -> List[Hit]:
+            postings = sorted((source.lookup(token) for token in tokens), key=len)
+            if not postings[0]:
+                return []
+            candidates = postings[0]
+            for other in postings[1:]:
+                members = set(other)
+                candidates = [seq for seq in candidates if seq in members]
+            found = []
+            for seq in reversed(candidates):
+                if before is not None and seq >= before:
+                    continue
+                room, user, ts = source.meta(seq)
+                if rooms is not None and room not in rooms:
+                    continue
+                if username is not None and user != username:
+                    continue
+                if (from_ts is not None and ts < from_ts) or (to_ts is not None and ts > to_ts):
+                    continue
+                found.append((seq, room))
+                if len(found) >= need:
+                    break
+            return found
+
+        with self._lock:
+            hits = matches(self._memtable)
+            segments = list(self.segments)
+        # Segmen terbaru lebih dulu; segmen lama hanya didekode jika halaman belum penuh
+        for segment in reversed(segments):
+            if len(hits) >= need:
+                break
+            if before is not None and segment.first_seq >= before:
+                continue
+            if (from_ts is not None and segment.max_ts < from_ts) or (to_ts is not None and segment.min_ts > to_ts):
+                continue
+            hits.extend(matches(segment)[:need - len(hits)])
+        if len(hits) > limit:
+            return hits[:limit], hits[limit - 1][0]
+        return hits, None
+
+    def close(self) -> None:
+        """Menunggu indexer menyimpan memtable dan merger selesai"""
+        if self._indexer is None:
+            return
+        self._queue.put(None)
+        self._indexer.join()
+        self._closing = True
+        self._merge_wanted.set()
+        self._merger.join()
+        self._indexer = None
@@ -6,28 +6,232 @@ import logging
 import signal
 import sys
 import secrets
-from datetime import datetime, timedelta
+import argparse
+import random
+import os
+import socket
+import subprocess
+import re
+import functools
+from datetime import datetime
 from users import user_manager
+from fanout import FanoutEngine, POLICIES, POLICY_DROP_OLDEST
+from bus import BusClient
+from cluster import Cluster
+from rooms import RoomIndex, DEFAULT_ROOM, is_valid_room
+from history import History, MessageLog
+from expiry import ExpiryScheduler
+from codec import SUBPROTOCOLS, codec_for, select_subprotocol
+from metrics import REGISTRY, metrics_endpoint
+from ratelimit import RateLimiter
+from admission import Admission
+from config import config_args
+from presence import Presence
+from mailboxes import Mailbox
+from diagnostics import LoopMonitor, Profiler, profile_endpoint
+from recorder import Recorder
+from search import SearchIndex
+from drain import read_snapshot, restart_command, stagger_delays, write_snapshot
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 
 # Konfigurasi logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Konfigurasi server
+HOST = "localhost"
+PORT = 8765
+WORKERS = 1
 MAX_CONNECTIONS = 5
-AUTH_TIMEOUT = 3600
+AUTH_TIMEOUT = 30  # tenggat menyelesaikan autentikasi setelah handshake
+HANDSHAKE_TIMEOUT = 10  # tenggat handshake HTTP/WebSocket
 TOKEN_EXPIRY = 3600
 ALLOWED_HOURS = range(8, 20)  # Server hanya bisa diakses dari jam 08:00 - 19:59
 
 # Menyimpan koneksi klien yang aktif
 connected_clients = set()
-client_ping_times = {}
 auth_tokens = {}
 pending_auth = {}
+# Indeks username -> koneksi lokal miliknya, untuk pesan langsung tanpa scan connected_clients
+user_sessions = {}
 
-# Konfigurasi heartbeat
-HEARTBEAT_INTERVAL = 3600
-PING_TIMEOUT = 3600
+# Admission control: autentikasi berjalan, batas per IP, dan antrian tunggu saat penuh
+MAX_PENDING_AUTH = 64
+MAX_CONNECTIONS_PER_IP = 20  # 0 = tanpa batas
+IP_CONNECT_RATE = 5  # koneksi baru per detik per IP, 0 = tanpa batas
+IP_CONNECT_BURST = 20
+ADMISSION_QUEUE_SIZE = 0  # 0 = langsung ditolak saat penuh
+ADMISSION_QUEUE_TIMEOUT = 10
+RETRY_AFTER = 5  # detik, dikirim di alasan close 1013
+
+# Keepalive bawaan websockets: ping setiap PING_INTERVAL detik, koneksi ditutup jika pong
+# tidak datang dalam PING_TIMEOUT detik; 0 = nonaktif
+PING_INTERVAL = 20
+PING_TIMEOUT = 20
+
+# Sampling RTT (opt-in): setiap RTT_SAMPLE_INTERVAL detik latency keepalive dari
+# RTT_SAMPLE_SIZE klien acak dicatat ke histogram; 0 = nonaktif
+RTT_SAMPLE_INTERVAL = 0
+RTT_SAMPLE_SIZE = 32
+
+# Diagnostik, semuanya nonaktif secara default
+LOOP_LAG_MS = 0  # lag event loop di atas ambang ini dicatat beserta stack, 0 = monitor nonaktif
+STAGE_TIMING = False  # durasi per tahap (auth, decode, validate, handle, fanout, send) ke histogram
+PROFILE_ENDPOINT = False  # GET /debug/profile?seconds=N dari localhost
+PROFILE_SECONDS = 10  # lama profil yang dipicu SIGUSR1
+PROFILE_DIR = "."
+profiler = None
+
+# Capture frame masuk untuk replay.py; dalam mode multi-worker setiap worker menulis
+# RECORD_PATH.<pid>. None = nonaktif
+RECORD_PATH = None
+recorder = None
+
+# Satu scheduler untuk semua tenggat waktu: token dan autentikasi
+EXPIRY_RESOLUTION = 0.5
+expiry = ExpiryScheduler(EXPIRY_RESOLUTION)
+
+def create_admission():
+    """Membuat admission control dari konfigurasi modul saat ini"""
+    return Admission(MAX_CONNECTIONS, MAX_PENDING_AUTH, MAX_CONNECTIONS_PER_IP,
+                     IP_CONNECT_RATE, IP_CONNECT_BURST, ADMISSION_QUEUE_SIZE,
+                     ADMISSION_QUEUE_TIMEOUT, RETRY_AFTER, expiry)
+
+admission = create_admission()
+
+# Konfigurasi antrian keluar per klien
+OUTBOUND_QUEUE_SIZE = 256
+SLOW_CLIENT_POLICY = POLICY_DROP_OLDEST  # drop_oldest, coalesce, atau disconnect
+SLOW_CLIENT_CLOSE_CODE = 1008
+# Key coalesce: frame state yang tertunda diganti frame terbaru dengan key yang sama
+# (kebijakan coalesce). Diff presence yang terlewat dideteksi klien dari celah versi
+KEY_PRESENCE = "presence"
+KEY_RATE_LIMITED = "rate_limited"
+KEY_RECONNECT = "reconnect"
+FLUSH_TIMEOUT = 5
+
+# Konfigurasi permessage-deflate (COMPRESSION = None untuk mematikan)
+COMPRESSION = "deflate"
+DEFLATE_WINDOW_BITS = 12
+DEFLATE_MEM_LEVEL = 5
+DEFLATE_LEVEL = 6
+
+# Micro-batching frame keluar: frame dalam satu window (ms) atau sampai BATCH_MAX
+# frame digabung menjadi satu frame array per klien; 0 = tanpa batching
+BATCH_WINDOW_MS = 0
+BATCH_MAX = 32
+# Jumlah maksimum pesan dalam satu frame batch dari klien
+MAX_INBOUND_BATCH = 64
+
+# Rate limit pesan masuk (pesan/detik dan burst), 0 = tanpa batas. Klien yang melewati
+# batas tidak dibaca sementara sehingga TCP backpressure memperlambat pengirimnya
+RATE_LIMIT = 10
+RATE_BURST = 20
+USER_RATE_LIMIT = 20  # gabungan semua koneksi satu pengguna (per worker)
+USER_RATE_BURST = 40
+RATE_LIMIT_WARN = True  # kirim frame rate_limited saat klien mulai dibatasi
+RATE_LIMIT_DISCONNECT = 0  # putus setelah sekian pesan berturut-turut dibatasi, 0 = tidak pernah
+
+limiter = RateLimiter(RATE_LIMIT, RATE_BURST, USER_RATE_LIMIT, USER_RATE_BURST)
+
+# Batas room yang diikuti satu koneksi, termasuk yang dipulihkan saat resume; 0 = tanpa batas
+MAX_ROOMS_PER_CONNECTION = 64
+
+fanout = FanoutEngine(OUTBOUND_QUEUE_SIZE, SLOW_CLIENT_POLICY, SLOW_CLIENT_CLOSE_CODE,
+                      BATCH_WINDOW_MS / 1000, BATCH_MAX)
+
+# Metrik proses ini, dibaca lewat HTTP GET /metrics pada port yang sama
+metric_connections = REGISTRY.gauge("chat_connections", "Klien terautentikasi yang tersambung",
+                                    lambda: len(connected_clients))
+metric_connections_total = REGISTRY.counter("chat_connections_total", "Koneksi WebSocket yang diterima")
+metric_rejected = REGISTRY.counter("chat_connections_rejected_total", "Koneksi ditolak admission control per alasan")
+metric_authenticating = REGISTRY.gauge("chat_auth_in_flight", "Koneksi yang sedang autentikasi",
+                                       lambda: admission.authenticating)
+metric_admission_queue = REGISTRY.gauge("chat_admission_queue", "Koneksi di antrian tunggu admission",
+                                        lambda: admission.waiting)
+metric_auth = REGISTRY.counter("chat_auth_total", "Hasil autentikasi per outcome")
+metric_messages_in = REGISTRY.counter("chat_messages_in_total", "Pesan yang diterima dari klien")
+metric_messages_out = REGISTRY.counter("chat_messages_out_total", "Frame yang masuk antrian keluar klien",
+                                       lambda: fanout.frames_out)
+metric_dropped = REGISTRY.counter("chat_messages_dropped_total", "Frame dibuang karena antrian klien penuh",
+                                  fanout.dropped)
+metric_throttled = REGISTRY.counter("chat_messages_throttled_total", "Pesan masuk yang ditunda rate limit")
+metric_fanout = REGISTRY.histogram("chat_fanout_seconds", "Durasi fan-out satu broadcast ke antrian subscriber")
+metric_rtt = REGISTRY.histogram("chat_client_rtt_seconds", "RTT keepalive klien (sampel)")
+metric_queue_depth = REGISTRY.gauge("chat_outbound_queue_depth", "Total frame menunggu di antrian keluar",
+                                    fanout.queue_depth)
+metric_queue_max = REGISTRY.gauge("chat_outbound_queue_max", "Antrian keluar klien terpanjang",
+                                  fanout.max_queue_depth)
+metric_tokens = REGISTRY.gauge("chat_auth_tokens", "Jumlah token di token store", lambda: len(auth_tokens))
+metric_online = REGISTRY.gauge("chat_online_users", "Pengguna online menurut roster presence",
+                               lambda: len(presence.online) if presence is not None else 0)
+metric_mailbox_stored = REGISTRY.counter("chat_mailbox_stored_total", "Pesan yang disimpan ke kotak surat offline")
+metric_mailbox_pending = REGISTRY.gauge("chat_mailbox_pending", "Pesan yang menunggu di kotak surat offline",
+                                        lambda: mailbox.count if mailbox is not None else 0)
+metric_loop_lag = REGISTRY.histogram("chat_loop_lag_seconds", "Keterlambatan bangun event loop (--loop-lag-ms)")
+metric_stage = REGISTRY.histogram("chat_stage_seconds", "Durasi per tahap pemrosesan (--stage-timing)")
+metric_search_segments = REGISTRY.gauge("chat_search_segments", "Segmen indeks pencarian",
+                                        lambda: len(search_index.segments) if search_index is not None else 0)
+metric_search = REGISTRY.histogram("chat_search_seconds", "Durasi satu pencarian di executor")
+metric_record_dropped = REGISTRY.counter("chat_record_dropped_total", "Event capture yang dibuang (antrian penuh)",
+                                         lambda: recorder.dropped if recorder is not None else 0)
+stage_auth, stage_decode, stage_validate, stage_handle, stage_fanout, stage_send = (
+    metric_stage.labels("stage", name) for name in ("auth", "decode", "validate", "handle", "fanout", "send"))
+
+# Konfigurasi riwayat pesan
+HISTORY_SIZE = 500  # pesan terbaru per room yang disimpan di memori
+HISTORY_DIR = "history"
+HISTORY_BATCH = 100
+HISTORY_REPLAY_LIMIT = 1000
+
+# Riwayat pesan, dibuat di main() setelah konfigurasi diterapkan
+history = None
+
+# Indeks room untuk fan-out yang hanya menyentuh subscriber room
+rooms = RoomIndex()
+
+# Bus antar worker, hanya terisi dalam mode multi-worker
+bus = None
+
+# Presence: snapshot roster sekali saat autentikasi, lalu diff join/leave berversi yang
+# digabung per PRESENCE_WINDOW_MS; klien yang tertinggal lebih dari PRESENCE_LOG_SIZE
+# diff menerima snapshot baru. Dibuat di main()
+PRESENCE_WINDOW_MS = 50
+PRESENCE_LOG_SIZE = 256
+presence = None
+
+# Kotak surat offline untuk pesan langsung dan mention (@username) ke pengguna yang tidak
+# tersambung; hanya mode satu proses. MAILBOX_CAP pesan per pengguna (0 = nonaktif),
+# kadaluarsa setelah MAILBOX_TTL detik, dikirim dalam frame berisi MAILBOX_BATCH pesan
+MAILBOX_DIR = "mailbox"
+MAILBOX_CAP = 500
+MAILBOX_TTL = 7 * 24 * 3600
+MAILBOX_BATCH = 100
+MAX_MENTIONS = 10
+MENTION_PATTERN = re.compile(r"@([\w.\-]{1,64})")
+mailbox = None
+# Referensi task store_mentions yang sedang berjalan agar tidak dibuang garbage collector
+mention_tasks = set()
+
+# Pencarian teks penuh atas riwayat: indeks terbalik inkremental yang diisi dari jalur
+# broadcast oleh thread latar belakang. Memtable dibekukan menjadi segmen di SEARCH_DIR
+# setiap SEARCH_FLUSH_DOCS pesan (0 = nonaktif); dalam mode multi-worker indeks tiap
+# worker hanya di memori dan dibangun dari log riwayat hub
+SEARCH_DIR = "search"
+SEARCH_FLUSH_DOCS = 10000
+SEARCH_PAGE = 20
+SEARCH_PAGE_MAX = 100
+MAX_SEARCH_QUERY = 256
+search_index = None
+
+# Drain untuk deploy (SIGUSR2): socket listen diserahkan ke proses baru,
+# klien diminta reconnect bertahap dalam DRAIN_SPREAD detik
+DRAIN_SPREAD = 5
+DRAIN_TIMEOUT = 20
+SNAPSHOT_FILE = "drain-snapshot.json"  # relatif terhadap HISTORY_DIR
+LISTEN_FDS = []  # socket listen warisan proses lama
+SNAPSHOT_PATH = None  # snapshot token dan riwayat dari proses lama
+draining = False
 
 # Flag untuk graceful shutdown
 shutdown_event = asyncio.Event()
@@ -38,27 +242,313 @@ def generate_token():
 
 def is_token_valid(token):
     """Cek apakah token masih valid"""
-    if token not in auth_tokens:
+    data = auth_tokens.get(token)
+    if data is None:
+        return False
+    # Dibandingkan dengan jam monotonic yang di-cache scheduler, bukan datetime.now()
+    return expiry.now < data["expiry"]
+
+def store_token(token, username):
+    """Menyimpan token baru dan mereplikasinya ke worker lain"""
+    auth_tokens[token] = {
+        "username": username,
+        "expiry": expiry.schedule(("token", token), TOKEN_EXPIRY, expire_token)
+    }
+    if bus is not None:
+        bus.publish_token(token, username, TOKEN_EXPIRY)
+
+def on_bus_token(token, username, ttl):
+    """Menerima token yang dibuat oleh worker lain"""
+    adopt_token(token, username, ttl)
+
+def adopt_token(token, username, ttl):
+    """Menyimpan token dari worker lain atau proses sebelumnya dengan sisa masa berlakunya"""
+    auth_tokens[token] = {
+        "username": username,
+        "expiry": expiry.schedule(("token", token), ttl, expire_token)
+    }
+
+def broadcast(message, room):
+    """Broadcast pesan ke subscriber room dan mencatatnya di riwayat"""
+    if bus is not None:
+        # Dalam mode multi-worker hub memberi seq, pesan dikirim ke klien lokal
+        # saat kembali dari hub lewat on_bus_frame
+        bus.publish(room, json.dumps(message))
+        return
+    seq = history.next_seq()
+    start = time.perf_counter()
+    frame = fanout.broadcast({"seq": seq, **message}, rooms.members(room))
+    elapsed = time.perf_counter() - start
+    metric_fanout.observe(elapsed)
+    if STAGE_TIMING:
+        stage_fanout.observe(elapsed)
+    history.record(seq, room, frame)
+    if search_index is not None:
+        search_index.add(seq, frame)
+
+def on_bus_frame(seq, room, frame):
+    """Menerima broadcast room yang sudah diberi seq oleh hub"""
+    start = time.perf_counter()
+    fanout.broadcast_frame(frame, rooms.members(room))
+    elapsed = time.perf_counter() - start
+    metric_fanout.observe(elapsed)
+    if STAGE_TIMING:
+        stage_fanout.observe(elapsed)
+    history.record(seq, room, frame)
+    if search_index is not None:
+        search_index.add(seq, frame)
+
+async def replay_history(websocket, since, room=None):
+    """Mengirim ulang pesan setelah seq since dalam frame batch per room"""
+    targets = [room] if room is not None else sorted(rooms.rooms_of(websocket))
+    for target in targets:
+        entries = await history.since(target, since, HISTORY_REPLAY_LIMIT)
+        room_json = json.dumps(target)
+        for i in range(0, len(entries), HISTORY_BATCH):
+            batch = ",".join(frame for _, frame in entries[i:i + HISTORY_BATCH])
+            # Frame riwayat sudah berupa JSON sehingga batch cukup digabung tanpa serialize ulang
+            fanout.send_frame(websocket, f'{{"type": "history", "room": {room_json}, "messages": [{batch}]}}')
+        fanout.send(websocket, {
+            "type": "history_end",
+            "room": target,
+            "last_seq": entries[-1][0] if entries else since,
+            "more": len(entries) >= HISTORY_REPLAY_LIMIT
+        })
+
+def add_session(username, websocket):
+    """Mendaftarkan koneksi terautentikasi ke indeks pengguna"""
+    sessions = user_sessions.get(username)
+    if sessions is None:
+        sessions = user_sessions[username] = set()
+        presence.add(username)
+    sessions.add(websocket)
+
+def remove_session(username, websocket):
+    """Menghapus koneksi dari indeks pengguna, username tanpa koneksi dibuang"""
+    sessions = user_sessions.get(username)
+    if sessions is not None:
+        sessions.discard(websocket)
+        if not sessions:
+            del user_sessions[username]
+            presence.remove(username)
+
+def deliver_direct(usernames, frame):
+    """Mengirim frame pesan langsung ke semua koneksi lokal para pengguna, mengembalikan jumlah penerima"""
+    recipients = set()
+    for username in usernames:
+        recipients.update(user_sessions.get(username, ()))
+    return fanout.broadcast_frame(frame, recipients) if recipients else 0
+
+def on_bus_direct(usernames, frame):
+    """Menerima pesan langsung dari worker lain"""
+    deliver_direct(usernames, frame)
+
+def on_bus_lost():
+    """Tanpa bus worker tidak bisa meneruskan pesan; berhenti agar Cluster menjalankannya ulang"""
+    logger.error("Koneksi ke bus hilang, worker dihentikan untuk dijalankan ulang")
+    shutdown_event.set()
+
+def on_presence_diff(diff):
+    """Membagikan diff presence ke semua klien terautentikasi, di-serialize sekali"""
+    fanout.broadcast(diff, key=KEY_PRESENCE)
+
+def on_presence_local(joined, left):
+    """Mereplikasi perubahan sesi lokal ke worker lain"""
+    if bus is not None:
+        bus.publish_presence(joined, left)
+
+def on_bus_presence(joined, left):
+    """Menerima perubahan presence dari worker lain"""
+    for username in joined:
+        presence.add(username, local=False)
+    for username in left:
+        presence.remove(username, local=False)
+
+async def store_mentions(username, room, message, ts):
+    """Menyimpan mention ke kotak surat pengguna yang sedang tidak online"""
+    targets = {target for target in MENTION_PATTERN.findall(message[:4096])[:MAX_MENTIONS]
+               if target != username and target not in user_sessions}
+    targets = await user_manager.existing_async(targets)
+    if not targets or mailbox is None:
+        return
+    frame = json.dumps({"type": "mention", "room": room, "from": username, "message": message, "ts": ts})
+    for target in targets:
+        if target in user_sessions:
+            continue
+        mailbox.put(target, frame)
+        metric_mailbox_stored.inc()
+
+async def deliver_mailbox(websocket, username):
+    """Mengirim isi kotak surat dalam frame batch; dihapus setelah klien mengirim mailbox_ack"""
+    if not mailbox.pending(username):
+        return
+    loop = asyncio.get_running_loop()
+    entries = await loop.run_in_executor(None, mailbox.fetch, username, MAILBOX_CAP)
+    for i in range(0, len(entries), MAILBOX_BATCH):
+        chunk = entries[i:i + MAILBOX_BATCH]
+        # Frame tersimpan sudah berupa JSON sehingga batch cukup digabung tanpa serialize ulang
+        messages = ",".join(frame for _, frame in chunk)
+        fanout.send_frame(websocket, f'{{"type": "mailbox", "last_id": {chunk[-1][0]}, "messages": [{messages}]}}')
+
+async def search_history(websocket, data, room):
+    """Mencari pesan di room yang diikuti klien dan mengirim satu halaman hasil"""
+    query = data.get("query")
+    if search_index is None:
+        send_error(websocket, "Pencarian tidak aktif")
+        return
+    if not isinstance(query, str) or not query.strip() or len(query) > MAX_SEARCH_QUERY:
+        send_error(websocket, f"query harus berupa teks 1-{MAX_SEARCH_QUERY} karakter")
+        return
+    filters = {}
+    # Rentang waktu memakai from_ts/to_ts (ms) agar tidak tertukar dengan since (seq) di history
+    for key in ("from_ts", "to_ts", "before"):
+        value = data.get(key)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+            send_error(websocket, f"{key} harus berupa bilangan bulat >= 0")
+            return
+        filters[key] = value
+    user = data.get("user")
+    if user is not None and not isinstance(user, str):
+        send_error(websocket, "user harus berupa username")
+        return
+    limit = data.get("limit", SEARCH_PAGE)
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        send_error(websocket, "limit harus berupa bilangan bulat >= 1")
+        return
+    if "room" in data:
+        if not rooms.is_member(websocket, room):
+            send_error(websocket, f"Anda belum bergabung ke room {room}")
+            return
+        targets = {room}
+    else:
+        targets = set(rooms.rooms_of(websocket))
+
+    # Pencarian berjalan di executor, event loop tetap mengirim pesan live
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    hits, cursor = await loop.run_in_executor(None, functools.partial(
+        search_index.search, query, targets, user, limit=min(limit, SEARCH_PAGE_MAX), **filters))
+    metric_search.observe(time.perf_counter() - start)
+    frames = await history.lookup(hits)
+    fanout.send_frame(websocket, '{"type": "search_result", "query": %s, "next": %s, "messages": [%s]}' % (
+        json.dumps(query), json.dumps(cursor), ",".join(frames)))
+
+def join_room(websocket, room):
+    """Bergabung ke room dengan batas room per koneksi, False jika batas tercapai"""
+    joined = rooms.rooms_of(websocket)
+    if MAX_ROOMS_PER_CONNECTION and room not in joined and len(joined) >= MAX_ROOMS_PER_CONNECTION:
         return False
-    return datetime.now() < auth_tokens[token]["expiry"]
+    rooms.join(websocket, room)
+    return True
+
+def send_error(websocket, message):
+    """Mengirim pesan error ke satu klien"""
+    fanout.send(websocket, {"type": "error", "message": message})
+
+async def process_message(websocket, username, data):
+    """Memproses pesan klien yang sudah terautentikasi berdasarkan tipenya"""
+    msg_type = data.get("type", "publish")
+    room = data.get("room", DEFAULT_ROOM)
+
+    if not is_valid_room(room):
+        send_error(websocket, "Nama room tidak valid")
+        return
+
+    if msg_type == "publish":
+        if draining:
+            # Seq diteruskan proses baru, pesan di sini akan hilang dari riwayatnya
+            send_error(websocket, "Server sedang restart, kirim ulang setelah tersambung kembali")
+            return
+        message = data.get("message")
+        if not isinstance(message, str):
+            send_error(websocket, "Pesan harus berupa teks")
+            return
+        if not rooms.is_member(websocket, room):
+            send_error(websocket, f"Anda belum bergabung ke room {room}")
+            return
+        broadcast_message = {
+            "room": room,
+            "username": username,
+            "message": message,
+            "timestamp": data.get("timestamp", ""),
+            "ts": int(time.time() * 1000)
+        }
+        # Frame di-serialize sekali lalu masuk antrian tiap subscriber room,
+        # sehingga klien lambat tidak menahan loop penerima ini
+        broadcast(broadcast_message, room)
+        if mailbox is not None and "@" in message:
+            # Dijadwalkan terpisah agar lookup pengguna tidak menahan frame berikutnya
+            task = asyncio.create_task(store_mentions(username, room, message, broadcast_message["ts"]))
+            mention_tasks.add(task)
+            task.add_done_callback(mention_tasks.discard)
+    elif msg_type == "join":
+        if not join_room(websocket, room):
+            send_error(websocket, f"Maksimal {MAX_ROOMS_PER_CONNECTION} room per koneksi")
+            return
+        fanout.send(websocket, {"type": "room_joined", "room": room})
+    elif msg_type == "history":
+        since = data.get("since", 0)
+        if isinstance(since, bool) or not isinstance(since, int) or since < 0:
+            send_error(websocket, "since harus berupa bilangan bulat >= 0")
+            return
+        if "room" in data and not rooms.is_member(websocket, room):
+            send_error(websocket, f"Anda belum bergabung ke room {room}")
+            return
+        await replay_history(websocket, since, room if "room" in data else None)
+    elif msg_type == "search":
+        await search_history(websocket, data, room)
+    elif msg_type == "dm":
+        target = data.get("to")
+        message = data.get("message")
+        if not isinstance(target, str) or not target:
+            send_error(websocket, "Tujuan pesan langsung harus berupa username")
+            return
+        if not isinstance(message, str):
+            send_error(websocket, "Pesan harus berupa teks")
+            return
+        # Dalam mode multi-worker penerima bisa tersambung ke worker lain
+        offline = bus is None and target not in user_sessions
+        if offline and (mailbox is None or not await user_manager.existing_async([target])):
+            send_error(websocket, f"Pengguna {target} sedang tidak online")
+            return
+        # Semua sesi penerima dan sesi lain pengirim menerima salinan yang sama
+        usernames = [target] if target == username else [target, username]
+        frame = json.dumps({
+            "type": "dm",
+            "from": username,
+            "to": target,
+            "message": message,
+            "timestamp": data.get("timestamp", ""),
+            "ts": int(time.time() * 1000)
+        })
+        # Penerima bisa tersambung (atau drain menutup kotak surat) selama lookup pengguna
+        if offline and target not in user_sessions and mailbox is not None:
+            # Ditulis ke disk oleh writer thread, pengirim tidak menunggu I/O
+            mailbox.put(target, frame)
+            metric_mailbox_stored.inc()
+        deliver_direct(usernames, frame)
+        if bus is not None:
+            bus.publish_direct(usernames, frame)
+    elif msg_type == "mailbox_ack":
+        last_id = data.get("id")
+        if mailbox is not None and isinstance(last_id, int):
+            mailbox.ack(username, last_id)
+    elif msg_type == "presence":
+        # Klien mendeteksi celah versi dan meminta diff sejak versinya, atau snapshot
+        fanout.send_frame(websocket, presence.sync_frame(data.get("epoch"), data.get("since")))
+    elif msg_type == "leave":
+        if rooms.leave(websocket, room):
+            fanout.send(websocket, {"type": "room_left", "room": room})
+        else:
+            send_error(websocket, f"Anda belum bergabung ke room {room}")
+    else:
+        send_error(websocket, f"Tipe pesan tidak dikenal: {msg_type}")
 
 def is_access_allowed():
     """Cek apakah waktu saat ini berada dalam jam yang diizinkan"""
     current_hour = datetime.now().hour
     return current_hour in ALLOWED_HOURS
 
-async def cleanup_expired_tokens():
-    """Membersihkan token yang sudah kadaluarsa"""
-    while not shutdown_event.is_set():
-        current_time = datetime.now()
-        expired_tokens = [
-            token for token, data in auth_tokens.items()
-            if current_time >= data["expiry"]
-        ]
-        for token in expired_tokens:
-            del auth_tokens[token]
-        await asyncio.sleep(60)
-
 async def broadcast_server_shutdown():
     """Broadcast pesan shutdown ke semua client"""
     if connected_clients:
@@ -68,11 +558,7 @@ async def broadcast_server_shutdown():
             "timestamp": datetime.now().strftime("%H:%M:%S")
         }
         try:
-            await asyncio.gather(
-                *[client.send(json.dumps(shutdown_message)) 
-                  for client in connected_clients],
-                return_exceptions=True
-            )
+            fanout.broadcast(shutdown_message)
             await asyncio.sleep(5)
         except Exception as e:
             logger.error(f"Error saat broadcast shutdown: {e}")
@@ -86,42 +572,50 @@ async def broadcast_server_closed():
             "timestamp": datetime.now().strftime("%H:%M:%S")
         }
         try:
-            await asyncio.gather(
-                *[client.send(json.dumps(close_message)) 
-                  for client in connected_clients],
-                return_exceptions=True
-            )
+            fanout.broadcast(close_message)
+            await fanout.flush(FLUSH_TIMEOUT)
         except Exception as e:
             logger.error(f"Error saat broadcast server closed: {e}")
 
-async def check_heartbeat():
-    """Memeriksa koneksi client menggunakan heartbeat"""
-    while not shutdown_event.is_set():
-        try:
-            current_time = time.time()
-            disconnected_clients = set()
-            
-            for client in connected_clients:
-                last_ping = client_ping_times.get(client, 0)
-                if current_time - last_ping > PING_TIMEOUT:
-                    logger.warning(f"Client timeout - tidak ada heartbeat dalam {PING_TIMEOUT} detik")
-                    disconnected_clients.add(client)
-            
-            for client in disconnected_clients:
-                connected_clients.remove(client)
-                client_ping_times.pop(client, None)
-                try:
-                    await client.close(1000, "Timeout - tidak ada heartbeat")
-                except Exception as e:
-                    logger.error(f"Error saat menutup koneksi client: {e}")
-            
-            await asyncio.sleep(HEARTBEAT_INTERVAL)
-        except Exception as e:
-            logger.error(f"Error dalam heartbeat checker: {e}")
-            await asyncio.sleep(1)
+def expire_token(key):
+    """Callback expiry: membuang token yang sudah kadaluarsa"""
+    auth_tokens.pop(key[1], None)
+
+def expire_auth(key):
+    """Callback expiry: menutup koneksi yang tidak menyelesaikan autentikasi tepat waktu"""
+    websocket = key[1]
+    metric_auth.labels("outcome", "timeout").inc()
+    logger.warning(f"Autentikasi tidak selesai dalam {AUTH_TIMEOUT} detik")
+    asyncio.create_task(websocket.close(1008, "Timeout autentikasi"))
+
+def resume_session(websocket, data):
+    """Melanjutkan sesi dengan token yang masih valid, mengembalikan username atau None"""
+    token = data.get("token")
+    if not isinstance(token, str) or not is_token_valid(token):
+        return None
+    username = auth_tokens[token]["username"]
+    # Perpanjang masa berlaku token yang dipakai ulang
+    store_token(token, username)
+
+    since = data.get("since")
+    requested_rooms = data.get("rooms", [])
+    if not isinstance(requested_rooms, list):
+        requested_rooms = []
+    pending_auth[websocket] = {
+        "username": username,
+        "start_time": datetime.now(),
+        "resume": {
+            "since": since if isinstance(since, int) and not isinstance(since, bool) and since >= 0 else None,
+            "rooms": [room for room in requested_rooms if is_valid_room(room)][:MAX_ROOMS_PER_CONNECTION or None],
+            "presence_epoch": data.get("presence_epoch"),
+            "presence_version": data.get("presence_version")
+        }
+    }
+    return username
 
 async def handle_authentication(websocket):
     """Menangani proses autentikasi"""
+    codec = codec_for(websocket.subprotocol)
     try:
         # Cek akses berdasarkan jam
         if not is_access_allowed():
@@ -132,10 +626,34 @@ async def handle_authentication(websocket):
             "type": "auth_request",
             "message": "Silakan masukkan username Anda"
         }
-        await websocket.send(json.dumps(auth_request))
+        await websocket.send(codec.encode(auth_request))
         
         response = await websocket.recv()
-        data = json.loads(response)
+        data = codec.decode(response)
+
+        if data.get("type") == "resume":
+            # Sesi dilanjutkan dalam satu round-trip tanpa username/password
+            start = time.perf_counter()
+            username = resume_session(websocket, data)
+            if STAGE_TIMING:
+                stage_auth.observe(time.perf_counter() - start)
+            if username:
+                metric_auth.labels("outcome", "resumed").inc()
+                await websocket.send(codec.encode({
+                    "type": "auth_success",
+                    "token": data["token"],
+                    "resumed": True,
+                    "message": "Sesi dilanjutkan"
+                }))
+                return username
+            metric_auth.labels("outcome", "resume_failed").inc()
+            await websocket.send(codec.encode({
+                "type": "resume_failed",
+                "message": "Sesi tidak valid, silakan login ulang"
+            }))
+            await websocket.send(codec.encode(auth_request))
+            response = await websocket.recv()
+            data = codec.decode(response)
         
         if "username" not in data:
             await websocket.close(1008)
@@ -147,10 +665,10 @@ async def handle_authentication(websocket):
             "type": "password_request",
             "message": "Silakan masukkan password Anda"
         }
-        await websocket.send(json.dumps(password_request))
+        await websocket.send(codec.encode(password_request))
         
         response = await websocket.recv()
-        data = json.loads(response)
+        data = codec.decode(response)
         
         if "password" not in data:
             await websocket.close(1008)
@@ -158,7 +676,12 @@ async def handle_authentication(websocket):
             
         password = data["password"]
         
-        if not user_manager.verify_credentials(username, password):
+        start = time.perf_counter()
+        valid = await user_manager.verify_credentials_async(username, password)
+        if STAGE_TIMING:
+            stage_auth.observe(time.perf_counter() - start)
+        if not valid:
+            metric_auth.labels("outcome", "failure").inc()
             await websocket.close(1008)
             return None
         
@@ -168,17 +691,15 @@ async def handle_authentication(websocket):
         }
         
         token = generate_token()
-        auth_tokens[token] = {
-            "username": username,
-            "expiry": datetime.now() + timedelta(seconds=TOKEN_EXPIRY)
-        }
+        store_token(token, username)
+        metric_auth.labels("outcome", "success").inc()
         
         auth_response = {
             "type": "auth_success",
             "token": token,
             "message": "Autentikasi berhasil"
         }
-        await websocket.send(json.dumps(auth_response))
+        await websocket.send(codec.encode(auth_response))
         
         return username
         
@@ -189,79 +710,141 @@ async def handle_authentication(websocket):
         return None
 
 async def handle_message(websocket):
-    """Handler untuk koneksi WebSocket baru"""
-    if len(connected_clients) >= MAX_CONNECTIONS:
-        await websocket.close(1008, "Server penuh")
+    """Handler untuk koneksi WebSocket baru: admission control lalu sesi klien"""
+    ip = websocket.remote_address[0] if websocket.remote_address else ""
+    rejection = await admission.acquire(ip)
+    if rejection is not None:
+        code, reason, label = rejection
+        metric_rejected.labels("reason", label).inc()
+        await websocket.close(code, reason)
         return
-        
-    username = await handle_authentication(websocket)
+    metric_connections_total.inc()
+    try:
+        await serve_client(websocket)
+    finally:
+        admission.release(ip)
+
+async def serve_client(websocket):
+    """Autentikasi lalu melayani pesan satu klien yang sudah diterima admission control"""
+    expiry.schedule(("auth", websocket), AUTH_TIMEOUT, expire_auth)
+    try:
+        username = await handle_authentication(websocket)
+    finally:
+        expiry.cancel(("auth", websocket))
+        admission.auth_finished()
     if not username:
         return
         
+    # Codec dipilih lewat subprotocol; codec biner mengikat autentikasi ke koneksi
+    codec = codec_for(websocket.subprotocol)
     connected_clients.add(websocket)
-    client_ping_times[websocket] = time.time()
+    add_session(username, websocket)
+    slot, user_slot = limiter.connect(username)
+    fanout.register(websocket, codec)
+    rooms.join(websocket, DEFAULT_ROOM)
+
+    resume = pending_auth.get(websocket, {}).get("resume")
+    if resume is None:
+        fanout.send_frame(websocket, presence.snapshot_frame())
+    else:
+        # Sesi yang dilanjutkan cukup menerima diff sejak versi presence terakhirnya
+        fanout.send_frame(websocket, presence.sync_frame(resume["presence_epoch"], resume["presence_version"]))
+        for room in resume["rooms"]:
+            join_room(websocket, room)
+        if resume["since"] is not None:
+            await replay_history(websocket, resume["since"])
+    if mailbox is not None:
+        await deliver_mailbox(websocket, username)
+    conn = None
+    if recorder is not None:
+        conn = recorder.connection_opened(username, websocket.subprotocol, resume is not None,
+                                          resume["rooms"] if resume is not None else ())
     
     try:
-        while not shutdown_event.is_set():
-            try:
-                pong_waiter = await websocket.ping()
-                start_time = time.time()
-                
-                await pong_waiter
-                end_time = time.time()
-                
-                latency = (end_time - start_time) * 1000
-                logger.info(f"Latency untuk {username}: {latency:.2f}ms")
-                
-                client_ping_times[websocket] = time.time()
-                
-                await asyncio.sleep(5)
-                
-            except websockets.exceptions.ConnectionClosed:
+        async for message in websocket:
+            if shutdown_event.is_set():
                 break
-                
-            async for message in websocket:
-                if shutdown_event.is_set():
-                    break
-                    
+            if conn is not None:
+                recorder.frame(conn, message)
+
+            if STAGE_TIMING:
+                start = time.perf_counter()
+            try:
+                decoded = codec.decode(message)
+            except ValueError:
+                logger.error("Pesan tidak valid: format pesan salah")
+                continue
+            if STAGE_TIMING:
+                stage_decode.observe(time.perf_counter() - start)
+            # Klien boleh menggabungkan beberapa pesan dalam satu frame batch
+            batch = decoded if isinstance(decoded, list) else (decoded,)
+            if len(batch) > MAX_INBOUND_BATCH:
+                logger.error(f"Batch dari {username} terlalu besar: {len(batch)} pesan")
+                continue
+
+            for data in batch:
+                metric_messages_in.inc()
+                # Setiap pesan dalam batch tetap dihitung rate limit
+                delay = limiter.acquire(slot, user_slot) if limiter.enabled else 0
+                if delay:
+                    metric_throttled.inc()
+                    strikes = limiter.strikes(slot)
+                    if RATE_LIMIT_DISCONNECT and strikes >= RATE_LIMIT_DISCONNECT:
+                        logger.warning(f"Klien {username} diputus karena melewati rate limit")
+                        await websocket.close(1008, "Terlalu banyak pesan")
+                        return
+                    if RATE_LIMIT_WARN and strikes == 1:
+                        fanout.send(websocket, {
+                            "type": "rate_limited",
+                            "message": "Terlalu banyak pesan, pengiriman diperlambat",
+                            "retry_after_ms": int(delay * 1000)
+                        }, key=KEY_RATE_LIMITED)
+                    # Berhenti membaca; buffer websockets penuh lalu TCP menahan pengirim
+                    await asyncio.sleep(delay)
                 try:
-                    data = json.loads(message)
-                    
-                    if "token" not in data or not is_token_valid(data["token"]):
+                    if STAGE_TIMING:
+                        start = time.perf_counter()
+                    if not isinstance(data, dict):
+                        raise ValueError("pesan klien harus berupa objek")
+
+                    if not codec.binds_auth and ("token" not in data or not is_token_valid(data["token"])):
                         await websocket.close(1008)
                         return
-                        
-                    broadcast_message = {
-                        "username": username,
-                        "message": data["message"],
-                        "timestamp": data.get("timestamp", "")
-                    }
-                    if connected_clients:
-                        await asyncio.gather(
-                            *[client.send(json.dumps(broadcast_message)) 
-                              for client in connected_clients]
-                        )
-                except json.JSONDecodeError:
-                    logger.error("Pesan tidak valid: format JSON salah")
+
+                    if STAGE_TIMING:
+                        stage_validate.observe(time.perf_counter() - start)
+                        start = time.perf_counter()
+                        await process_message(websocket, username, data)
+                        stage_handle.observe(time.perf_counter() - start)
+                    else:
+                        await process_message(websocket, username, data)
+                except ValueError:
+                    logger.error("Pesan tidak valid: format pesan salah")
                 except Exception as e:
                     logger.error(f"Error saat memproses pesan: {e}")
-                    
+                
     except websockets.exceptions.ConnectionClosed as e:
         logger.info(f"Koneksi terputus: {e}")
     except Exception as e:
         logger.error(f"Error dalam handle_message: {e}")
     finally:
+        if conn is not None:
+            recorder.connection_closed(conn)
         connected_clients.remove(websocket)
-        client_ping_times.pop(websocket, None)
+        remove_session(username, websocket)
+        limiter.disconnect(username, slot)
         pending_auth.pop(websocket, None)
+        rooms.leave_all(websocket)
+        await fanout.unregister(websocket)
 
-async def shutdown(server):
+async def shutdown(servers):
     """Graceful shutdown server"""
     logger.info("Memulai proses shutdown...")
     shutdown_event.set()
     
-    await broadcast_server_shutdown()
-    await broadcast_server_closed()  # Tambahan broadcast server closed
+    if not draining:
+        await broadcast_server_shutdown()
+        await broadcast_server_closed()  # Tambahan broadcast server closed
     
     if connected_clients:
         await asyncio.gather(
@@ -269,37 +852,420 @@ async def shutdown(server):
             return_exceptions=True
         )
     
-    server.close()
-    await server.wait_closed()
+    for server in servers:
+        server.close()
+        await server.wait_closed()
     logger.info("Server berhasil dimatikan")
 
-async def main():
-    heartbeat_task = asyncio.create_task(check_heartbeat())
-    cleanup_task = asyncio.create_task(cleanup_expired_tokens())
+def snapshot_tokens():
+    """Token yang masih berlaku beserta sisa masa berlakunya (detik)"""
+    now = time.monotonic()
+    return [[token, data["username"], data["expiry"] - now]
+            for token, data in auth_tokens.items() if data["expiry"] > now]
+
+def load_snapshot(path):
+    """Memuat token dan riwayat terbaru yang diserahkan proses lama"""
+    data = read_snapshot(path)
+    if data is None:
+        logger.warning(f"Snapshot {path} tidak ditemukan")
+        return
+    for token, username, ttl in data["tokens"]:
+        adopt_token(token, username, ttl)
+    history.restore(data["history"])
+    logger.info(f"Snapshot dimuat: {len(data['tokens'])} token, riwayat sampai seq {history.last_seq}")
+
+async def drain(servers):
+    """Menyerahkan socket listen ke proses baru lalu memindahkan klien secara bertahap"""
+    global draining, mailbox, search_index
+    if draining:
+        return
+    draining = True
+    logger.info("Memulai drain untuk restart...")
+
+    # Socket listen diduplikasi dulu agar antrian koneksi tetap hidup setelah server berhenti accept
+    fds = [os.dup(sock.fileno()) for server in servers for sock in server.sockets]
+    for server in servers:
+        server.close(close_connections=False)
+
+    # Seq berhenti bertambah di sini dan log ditutup sebelum proses baru membukanya
+    history.log.close()
+    if mailbox is not None:
+        # Selama drain pesan ke pengguna offline ditolak seperti tanpa kotak surat
+        mailbox.close()
+        mailbox = None
+    if search_index is not None:
+        # Memtable disimpan sebagai segmen untuk dimuat proses baru
+        search_index.close()
+        search_index = None
+    snapshot_path = os.path.join(HISTORY_DIR, SNAPSHOT_FILE)
+    write_snapshot(snapshot_path, {"tokens": snapshot_tokens(), "history": history.snapshot()})
+    process = subprocess.Popen(restart_command(fds, snapshot_path), pass_fds=fds)
+    for fd in fds:
+        os.close(fd)
+    logger.info(f"Proses pengganti berjalan (pid {process.pid})")
+
+    clients = list(connected_clients)
+    for websocket, delay in zip(clients, stagger_delays(len(clients), DRAIN_SPREAD)):
+        fanout.send(websocket, {
+            "type": "reconnect",
+            "delay_ms": int(delay * 1000),
+            "message": "Server restart, menyambung ulang..."
+        }, key=KEY_RECONNECT)
+
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while connected_clients and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    await fanout.flush(FLUSH_TIMEOUT)
+    if connected_clients:
+        logger.warning(f"{len(connected_clients)} klien belum pindah saat drain selesai")
+    shutdown_event.set()
+
+def listen_options():
+    """Alamat listen: socket warisan proses lama atau HOST/PORT"""
+    if LISTEN_FDS:
+        return [{"sock": socket.socket(fileno=fd)} for fd in LISTEN_FDS]
+    return [{"host": HOST, "port": PORT}]
+
+async def sample_rtt(stop_event):
+    """Satu task untuk semua klien: mencatat latency keepalive sebagian klien ke histogram"""
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), RTT_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        clients = list(connected_clients)
+        for websocket in random.sample(clients, min(RTT_SAMPLE_SIZE, len(clients))):
+            # latency bernilai 0 sampai pong keepalive pertama diterima
+            if websocket.latency:
+                metric_rtt.observe(websocket.latency)
+
+def http_endpoints():
+    """Hook process_request: /metrics, ditambah /debug/profile jika diaktifkan"""
+    metrics = metrics_endpoint()
+    if not PROFILE_ENDPOINT:
+        return metrics
+    # Profil berjalan di dalam handshake HTTP sehingga dibatasi open_timeout
+    profile = profile_endpoint(profiler, max(1, HANDSHAKE_TIMEOUT - 1))
+
+    async def process_request(connection, request):
+        response = metrics(connection, request)
+        if response is None:
+            response = await profile(connection, request)
+        return response
+
+    return process_request
+
+async def dump_profile():
+    """Menulis profil event loop PROFILE_SECONDS detik ke PROFILE_DIR (dipicu SIGUSR1)"""
+    logger.info(f"Profiling event loop selama {PROFILE_SECONDS} detik")
+    try:
+        text = await profiler.run(PROFILE_SECONDS)
+    except RuntimeError as e:
+        logger.warning(f"Profil tidak dibuat: {e}")
+        return
+    path = os.path.join(PROFILE_DIR, f"profile-{os.getpid()}-{int(time.time())}.folded")
+    with open(path, "w") as f:
+        f.write(text)
+    logger.info(f"Profil ditulis ke {path}")
+
+def keepalive_options():
+    """Opsi keepalive websockets.serve; 0 berarti nonaktif"""
+    return {"ping_interval": PING_INTERVAL or None, "ping_timeout": PING_TIMEOUT or None}
+
+async def main(reuse_port=False, bus_path=None):
+    global bus, history, presence, mailbox, profiler, recorder, search_index
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shutdown_event.set)
+
+    # Dalam mode multi-worker log riwayat ditulis oleh hub, worker hanya membaca
+    history = History(HISTORY_SIZE, MessageLog(HISTORY_DIR, readonly=bus_path is not None))
+    presence = Presence(PRESENCE_WINDOW_MS / 1000, PRESENCE_LOG_SIZE, on_presence_diff, on_presence_local)
+    if bus_path is None and MAILBOX_CAP > 0:
+        mailbox = Mailbox(MAILBOX_DIR, MAILBOX_CAP, MAILBOX_TTL)
+    if SEARCH_FLUSH_DOCS > 0:
+        search_index = SearchIndex(SEARCH_DIR if bus_path is None else None, history.log, SEARCH_FLUSH_DOCS)
+    if RECORD_PATH is not None:
+        recorder = Recorder(RECORD_PATH if bus_path is None else f"{RECORD_PATH}.{os.getpid()}")
+        logger.info(f"Merekam frame masuk ke {recorder.path}")
+    if SNAPSHOT_PATH is not None:
+        load_snapshot(SNAPSHOT_PATH)
+
+    if bus_path is not None:
+        bus = BusClient(bus_path, on_bus_frame, on_bus_token, on_bus_direct, on_bus_presence, on_bus_lost)
+        await bus.connect()
+
+    expiry_task = asyncio.create_task(expiry.run(shutdown_event))
+    background = [expiry_task]
+    if RTT_SAMPLE_INTERVAL > 0 and PING_INTERVAL:
+        background.append(asyncio.create_task(sample_rtt(shutdown_event)))
+    if LOOP_LAG_MS > 0:
+        monitor = LoopMonitor(LOOP_LAG_MS / 1000, on_lag=metric_loop_lag.observe)
+        background.append(asyncio.create_task(monitor.run(shutdown_event)))
+    profiler = Profiler()
+    loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.create_task(dump_profile()))
     
-    server = await websockets.serve(
-        handle_message,
-        "localhost",
-        8765
-    )
-    logger.info(f"Server chat berjalan di ws://localhost:8765 (Maksimal {MAX_CONNECTIONS} koneksi)")
+    servers = [
+        await websockets.serve(
+            handle_message,
+            reuse_port=reuse_port,
+            subprotocols=SUBPROTOCOLS,
+            select_subprotocol=select_subprotocol,
+            process_request=http_endpoints(),
+            open_timeout=HANDSHAKE_TIMEOUT,
+            **listen,
+            **keepalive_options(),
+            **compression_options()
+        )
+        for listen in listen_options()
+    ]
+    logger.info(f"Server chat berjalan di ws://{HOST}:{PORT} (Maksimal {MAX_CONNECTIONS} koneksi)")
+    if bus_path is None:
+        # Drain hanya untuk mode satu proses; dalam mode multi-worker log dimiliki hub
+        loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.create_task(drain(servers)))
     
     try:
         await shutdown_event.wait()
     except KeyboardInterrupt:
         logger.info("Menerima sinyal shutdown")
     finally:
-        await shutdown(server)
-        heartbeat_task.cancel()
-        cleanup_task.cancel()
+        await shutdown(servers)
+        for task in background:
+            task.cancel()
         try:
-            await asyncio.gather(heartbeat_task, cleanup_task, return_exceptions=True)
+            await asyncio.gather(*background, return_exceptions=True)
         except asyncio.CancelledError:
             pass
+        if bus is not None:
+            await bus.close()
+        history.log.close()
+        if mailbox is not None:
+            mailbox.close()
+        if search_index is not None:
+            search_index.close()
+        if recorder is not None:
+            recorder.close()
+
+def compression_options():
+    """Opsi permessage-deflate untuk websockets.serve sesuai konfigurasi"""
+    if COMPRESSION != "deflate":
+        return {"compression": None}
+    return {
+        "compression": None,
+        "extensions": [ServerPerMessageDeflateFactory(
+            server_max_window_bits=DEFLATE_WINDOW_BITS,
+            compress_settings={"memLevel": DEFLATE_MEM_LEVEL, "level": DEFLATE_LEVEL}
+        )]
+    }
+
+def apply_config(config):
+    """Menerapkan konfigurasi dari argumen CLI ke variabel modul"""
+    global HOST, PORT, WORKERS, MAX_CONNECTIONS, ALLOWED_HOURS, HISTORY_DIR
+    global COMPRESSION, DEFLATE_WINDOW_BITS, DEFLATE_MEM_LEVEL, DEFLATE_LEVEL
+    global BATCH_WINDOW_MS, BATCH_MAX, OUTBOUND_QUEUE_SIZE, SLOW_CLIENT_POLICY, SLOW_CLIENT_CLOSE_CODE
+    global RATE_LIMIT, RATE_BURST, USER_RATE_LIMIT, USER_RATE_BURST, RATE_LIMIT_DISCONNECT
+    global AUTH_TIMEOUT, HANDSHAKE_TIMEOUT, MAX_PENDING_AUTH, MAX_CONNECTIONS_PER_IP
+    global IP_CONNECT_RATE, IP_CONNECT_BURST, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT, RETRY_AFTER
+    global PING_INTERVAL, PING_TIMEOUT, RTT_SAMPLE_INTERVAL, RTT_SAMPLE_SIZE
+    global PRESENCE_WINDOW_MS, PRESENCE_LOG_SIZE, MAILBOX_DIR, MAILBOX_CAP, MAILBOX_TTL
+    global LOOP_LAG_MS, STAGE_TIMING, PROFILE_ENDPOINT, PROFILE_SECONDS, PROFILE_DIR, RECORD_PATH
+    global SEARCH_DIR, SEARCH_FLUSH_DOCS, MAX_ROOMS_PER_CONNECTION
+    global admission, LISTEN_FDS, SNAPSHOT_PATH
+    HOST = config["host"]
+    PORT = config["port"]
+    WORKERS = config["workers"]
+    MAX_CONNECTIONS = config["max_connections"]
+    HISTORY_DIR = config["history_dir"]
+    COMPRESSION = None if config["compression"] == "none" else config["compression"]
+    DEFLATE_WINDOW_BITS = config["deflate_window_bits"]
+    DEFLATE_MEM_LEVEL = config["deflate_mem_level"]
+    DEFLATE_LEVEL = config["deflate_level"]
+    BATCH_WINDOW_MS = config["batch_window_ms"]
+    BATCH_MAX = config["batch_max"]
+    fanout.batch_window = BATCH_WINDOW_MS / 1000
+    fanout.batch_max = BATCH_MAX
+    OUTBOUND_QUEUE_SIZE = config["outbound_queue_size"]
+    SLOW_CLIENT_POLICY = config["slow_client_policy"]
+    SLOW_CLIENT_CLOSE_CODE = config["slow_client_close_code"]
+    fanout.max_queue = OUTBOUND_QUEUE_SIZE
+    fanout.policy = SLOW_CLIENT_POLICY
+    fanout.close_code = SLOW_CLIENT_CLOSE_CODE
+    RATE_LIMIT = config["rate_limit"]
+    RATE_BURST = config["rate_burst"]
+    USER_RATE_LIMIT = config["user_rate_limit"]
+    USER_RATE_BURST = config["user_rate_burst"]
+    RATE_LIMIT_DISCONNECT = config["rate_limit_disconnect"]
+    limiter.connections.rate, limiter.connections.burst = RATE_LIMIT, RATE_BURST
+    limiter.users.rate, limiter.users.burst = USER_RATE_LIMIT, USER_RATE_BURST
+    user_manager.configure(config["users_file"])
+    start, end = config["allowed_hours"]
+    ALLOWED_HOURS = range(start, end)
+    AUTH_TIMEOUT = config["auth_timeout"]
+    HANDSHAKE_TIMEOUT = config["handshake_timeout"]
+    MAX_PENDING_AUTH = config["max_pending_auth"]
+    MAX_CONNECTIONS_PER_IP = config["max_connections_per_ip"]
+    IP_CONNECT_RATE = config["ip_connect_rate"]
+    IP_CONNECT_BURST = config["ip_connect_burst"]
+    ADMISSION_QUEUE_SIZE = config["admission_queue_size"]
+    ADMISSION_QUEUE_TIMEOUT = config["admission_queue_timeout"]
+    RETRY_AFTER = config["retry_after"]
+    admission = create_admission()
+    PING_INTERVAL = config["ping_interval"]
+    PING_TIMEOUT = config["ping_timeout"]
+    RTT_SAMPLE_INTERVAL = config["rtt_sample_interval"]
+    RTT_SAMPLE_SIZE = config["rtt_sample_size"]
+    PRESENCE_WINDOW_MS = config["presence_window_ms"]
+    PRESENCE_LOG_SIZE = config["presence_log_size"]
+    MAILBOX_DIR = config["mailbox_dir"]
+    MAILBOX_CAP = config["mailbox_cap"]
+    MAILBOX_TTL = config["mailbox_ttl"]
+    LOOP_LAG_MS = config["loop_lag_ms"]
+    STAGE_TIMING = config["stage_timing"]
+    fanout.send_observer = stage_send.observe if STAGE_TIMING else None
+    PROFILE_ENDPOINT = config["profile_endpoint"]
+    PROFILE_SECONDS = config["profile_seconds"]
+    PROFILE_DIR = config["profile_dir"]
+    RECORD_PATH = config["record"]
+    MAX_ROOMS_PER_CONNECTION = config["max_rooms_per_connection"]
+    SEARCH_DIR = config["search_dir"]
+    SEARCH_FLUSH_DOCS = config["search_flush_docs"]
+    LISTEN_FDS = config["listen_fds"]
+    SNAPSHOT_PATH = config["snapshot"]
+
+def run_worker(worker_id, config, bus_path):
+    """Entry point proses worker dalam mode multi-worker"""
+    apply_config(config)
+    logger.info(f"Worker {worker_id} dimulai")
+    try:
+        asyncio.run(main(reuse_port=True, bus_path=bus_path))
+    except KeyboardInterrupt:
+        pass
+
+def parse_hours(value):
+    """Parse rentang jam akses dengan format MULAI-AKHIR, misalnya 8-20"""
+    try:
+        start, end = (int(part) for part in value.split("-"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("format jam harus MULAI-AKHIR, misalnya 8-20")
+    if not 0 <= start <= end <= 24:
+        raise argparse.ArgumentTypeError("jam harus berada di antara 0 dan 24")
+    return start, end
+
+def parse_args(argv=None):
+    """Membaca konfigurasi server dari file konfigurasi (--config) dan argumen CLI"""
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--config")
+    known, rest = pre.parse_known_args(argv)
+
+    parser = argparse.ArgumentParser(description="Server chat WebSocket")
+    parser.add_argument("--config", help="file konfigurasi JSON, opsi CLI menimpa isinya")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="jumlah proses worker yang berbagi port (SO_REUSEPORT)")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help="maksimal koneksi per worker")
+    parser.add_argument("--allowed-hours", type=parse_hours,
+                        default=(ALLOWED_HOURS.start, ALLOWED_HOURS.stop),
+                        help="rentang jam akses, misalnya 8-20")
+    parser.add_argument("--history-dir", default=HISTORY_DIR,
+                        help="direktori log riwayat pesan")
+    parser.add_argument("--compression", choices=["deflate", "none"], default=COMPRESSION or "none",
+                        help="ekstensi permessage-deflate")
+    parser.add_argument("--deflate-window-bits", type=int, choices=range(9, 16), default=DEFLATE_WINDOW_BITS,
+                        metavar="9-15")
+    parser.add_argument("--deflate-mem-level", type=int, choices=range(1, 10), default=DEFLATE_MEM_LEVEL,
+                        metavar="1-9")
+    parser.add_argument("--deflate-level", type=int, choices=range(0, 10), default=DEFLATE_LEVEL,
+                        metavar="0-9")
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW_MS,
+                        help="window micro-batching frame keluar dalam ms, 0 untuk mematikan")
+    parser.add_argument("--batch-max", type=int, default=BATCH_MAX,
+                        help="maksimal frame dalam satu batch")
+    parser.add_argument("--max-rooms-per-connection", type=int, default=MAX_ROOMS_PER_CONNECTION,
+                        help="maksimal room yang diikuti satu koneksi, 0 = tanpa batas")
+    parser.add_argument("--outbound-queue-size", type=int, default=OUTBOUND_QUEUE_SIZE,
+                        help="maksimal frame di antrian keluar per klien")
+    parser.add_argument("--slow-client-policy", choices=POLICIES, default=SLOW_CLIENT_POLICY,
+                        help="tindakan saat antrian keluar klien penuh")
+    parser.add_argument("--slow-client-close-code", type=int, default=SLOW_CLIENT_CLOSE_CODE,
+                        help="kode close untuk klien lambat yang diputus (kebijakan disconnect)")
+    parser.add_argument("--presence-window-ms", type=float, default=PRESENCE_WINDOW_MS,
+                        help="jendela penggabungan diff presence (ms)")
+    parser.add_argument("--presence-log-size", type=int, default=PRESENCE_LOG_SIZE,
+                        help="jumlah diff presence yang disimpan untuk klien tertinggal")
+    parser.add_argument("--mailbox-dir", default=MAILBOX_DIR,
+                        help="direktori kotak surat offline")
+    parser.add_argument("--mailbox-cap", type=int, default=MAILBOX_CAP,
+                        help="maksimal pesan offline per pengguna, 0 = nonaktif")
+    parser.add_argument("--mailbox-ttl", type=float, default=MAILBOX_TTL,
+                        help="masa simpan pesan offline (detik)")
+    parser.add_argument("--search-dir", default=SEARCH_DIR,
+                        help="direktori segmen indeks pencarian")
+    parser.add_argument("--search-flush-docs", type=int, default=SEARCH_FLUSH_DOCS,
+                        help="pesan per segmen indeks pencarian, 0 = pencarian nonaktif")
+    parser.add_argument("--rate-limit", type=float, default=RATE_LIMIT,
+                        help="pesan/detik per koneksi, 0 untuk tanpa batas")
+    parser.add_argument("--rate-burst", type=float, default=RATE_BURST)
+    parser.add_argument("--user-rate-limit", type=float, default=USER_RATE_LIMIT,
+                        help="pesan/detik per pengguna (semua koneksinya), 0 untuk tanpa batas")
+    parser.add_argument("--user-rate-burst", type=float, default=USER_RATE_BURST)
+    parser.add_argument("--rate-limit-disconnect", type=int, default=RATE_LIMIT_DISCONNECT,
+                        help="putus setelah N pesan berturut-turut dibatasi, 0 untuk tidak pernah")
+    parser.add_argument("--auth-timeout", type=float, default=AUTH_TIMEOUT,
+                        help="detik untuk menyelesaikan autentikasi")
+    parser.add_argument("--handshake-timeout", type=float, default=HANDSHAKE_TIMEOUT,
+                        help="detik untuk menyelesaikan handshake WebSocket")
+    parser.add_argument("--max-pending-auth", type=int, default=MAX_PENDING_AUTH,
+                        help="maksimal koneksi yang sedang autentikasi, 0 untuk tanpa batas")
+    parser.add_argument("--max-connections-per-ip", type=int, default=MAX_CONNECTIONS_PER_IP,
+                        help="koneksi bersamaan per IP, 0 untuk tanpa batas")
+    parser.add_argument("--ip-connect-rate", type=float, default=IP_CONNECT_RATE,
+                        help="koneksi baru per detik per IP, 0 untuk tanpa batas")
+    parser.add_argument("--ip-connect-burst", type=float, default=IP_CONNECT_BURST)
+    parser.add_argument("--admission-queue-size", type=int, default=ADMISSION_QUEUE_SIZE,
+                        help="koneksi yang boleh menunggu saat server penuh, 0 untuk langsung ditolak")
+    parser.add_argument("--admission-queue-timeout", type=float, default=ADMISSION_QUEUE_TIMEOUT)
+    parser.add_argument("--retry-after", type=int, default=RETRY_AFTER,
+                        help="saran detik menunggu pada alasan close 1013")
+    parser.add_argument("--ping-interval", type=float, default=PING_INTERVAL,
+                        help="interval ping keepalive (detik), 0 = nonaktif")
+    parser.add_argument("--ping-timeout", type=float, default=PING_TIMEOUT,
+                        help="batas tunggu pong sebelum koneksi ditutup (detik), 0 = nonaktif")
+    parser.add_argument("--rtt-sample-interval", type=float, default=RTT_SAMPLE_INTERVAL,
+                        help="interval sampling RTT keepalive ke histogram (detik), 0 = nonaktif")
+    parser.add_argument("--rtt-sample-size", type=int, default=RTT_SAMPLE_SIZE,
+                        help="jumlah klien acak per sampling RTT")
+    parser.add_argument("--loop-lag-ms", type=float, default=LOOP_LAG_MS,
+                        help="catat lag event loop di atas ambang ini beserta stack (ms), 0 = nonaktif")
+    parser.add_argument("--stage-timing", action="store_true", default=STAGE_TIMING,
+                        help="ukur durasi auth/decode/validate/handle/fanout/send ke chat_stage_seconds")
+    parser.add_argument("--profile-endpoint", action="store_true", default=PROFILE_ENDPOINT,
+                        help="aktifkan GET /debug/profile?seconds=N dari localhost")
+    parser.add_argument("--profile-seconds", type=float, default=PROFILE_SECONDS,
+                        help="lama profil yang dipicu SIGUSR1 (detik)")
+    parser.add_argument("--profile-dir", default=PROFILE_DIR,
+                        help="direktori file profil SIGUSR1")
+    parser.add_argument("--record", default=RECORD_PATH, metavar="FILE",
+                        help="rekam frame masuk ke capture JSONL untuk replay.py")
+    parser.add_argument("--listen-fds", type=lambda v: [int(fd) for fd in v.split(",")], default=[],
+                        help=argparse.SUPPRESS)  # diisi proses lama saat drain
+    parser.add_argument("--snapshot", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--users-file", default=user_manager.users_file,
+                        help="penyimpanan pengguna: .json (default), .journal, atau .db/.sqlite")
+    file_args = config_args(known.config) if known.config else []
+    # Opsi CLI diletakkan setelah isi file sehingga menimpanya
+    return vars(parser.parse_args(file_args + rest))
 
 if __name__ == "__main__":
+    config = parse_args()
+    apply_config(config)
     try:
-        asyncio.run(main())
+        if WORKERS > 1:
+            asyncio.run(Cluster(run_worker, WORKERS, config).run())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Program dihentikan oleh user")
     except Exception as e:
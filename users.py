@@ -1,69 +1,468 @@
 # users.py
+import asyncio
+import base64
+import hashlib
+import hmac
 import json
 import os
-from typing import Dict, Optional
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
 
-class UserManager:
-    def __init__(self, users_file: str = "users.json"):
-        self.users_file = users_file
-        self.users: Dict[str, str] = {}
-        self.load_users()
+# Pengguna bawaan saat penyimpanan baru dibuat
+DEFAULT_USERS = {
+    "adminganteng": "admin123",
+    "maulana": "pass123",
+    "atha": "pass123"
+}
 
-    def load_users(self) -> None:
-        """Memuat data pengguna dari file JSON"""
-        if os.path.exists(self.users_file):
+# Journal dipadatkan jika jumlah baris melebihi jumlah pengguna sebanyak ini kali lipat
+JOURNAL_COMPACT_RATIO = 2
+JOURNAL_COMPACT_MIN = 1000
+
+# Parameter scrypt untuk hash password (sekitar 16 MiB memori per verifikasi)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_MAXMEM = 64 * 1024 * 1024
+HASH_PREFIX = "scrypt$"
+
+# Verifikasi dijalankan di thread pool agar tidak memblokir event loop
+VERIFY_WORKERS = 4
+VERIFY_CONCURRENCY = 8
+# Cache verifikasi sukses yang berumur pendek
+VERIFY_CACHE_SIZE = 1024
+VERIFY_CACHE_TTL = 60
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def hash_password(password: str) -> str:
+    """Membuat hash scrypt bergaram dengan format scrypt$n$r$p$salt$hash"""
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R,
+                            p=SCRYPT_P, maxmem=SCRYPT_MAXMEM, dklen=32)
+    return f"{HASH_PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored: str) -> bool:
+    """Cek apakah password tersimpan sudah berupa hash"""
+    return stored.startswith(HASH_PREFIX)
+
+
+def check_password(password: str, stored: str) -> bool:
+    """Membandingkan password dengan hash tersimpan secara constant-time"""
+    try:
+        _, n, r, p, salt, expected = stored.split("$")
+        digest = hashlib.scrypt(password.encode(), salt=base64.b64decode(salt), n=int(n),
+                                r=int(r), p=int(p), maxmem=SCRYPT_MAXMEM, dklen=32)
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest, base64.b64decode(expected))
+
+
+# Hash pengganti untuk username yang tidak ada, agar waktu respons tidak membocorkan username.
+# Dibuat saat pertama dibutuhkan sehingga import modul tidak menjalankan scrypt
+_dummy_hash: Optional[str] = None
+
+
+def _get_dummy_hash() -> str:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_urlsafe(16))
+    return _dummy_hash
+
+
+class UserBackend:
+    """Antarmuka penyimpanan pengguna: username -> hash password"""
+
+    # True jika penyimpanan baru dibuat dan belum berisi data
+    created = False
+
+    def get(self, username: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, username: str, password: str) -> None:
+        raise NotImplementedError
+
+    def delete(self, username: str) -> bool:
+        raise NotImplementedError
+
+    def set_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Menyimpan banyak pengguna sekaligus dalam satu transaksi"""
+        raise NotImplementedError
+
+    def iter_items(self) -> Iterator[Tuple[str, str]]:
+        raise NotImplementedError
+
+    def iter_plaintext(self) -> Iterator[Tuple[str, str]]:
+        """Pengguna yang passwordnya belum di-hash"""
+        return ((username, stored) for username, stored in self.iter_items() if not is_hashed(stored))
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, username: str) -> bool:
+        return self.get(username) is not None
+
+    def flush(self) -> None:
+        """Memastikan semua perubahan tersimpan"""
+
+    def close(self) -> None:
+        self.flush()
+
+
+def _atomic_write(path: str, data: str) -> None:
+    """Menulis file lewat file sementara lalu rename agar tidak rusak saat crash"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JsonBackend(UserBackend):
+    """Backend default: seluruh pengguna di satu file JSON yang ditulis ulang setiap perubahan"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.users: Dict[str, str] = {}
+        if os.path.exists(path):
             try:
-                with open(self.users_file, 'r') as f:
+                with open(path, 'r') as f:
                     self.users = json.load(f)
             except json.JSONDecodeError:
-                print("Error: File users.json rusak. Membuat file baru.")
+                print(f"Error: File {path} rusak. Membuat file baru.")
                 self.users = {}
-                self.save_users()
+                self.flush()
+        else:
+            self.created = True
+
+    def get(self, username: str) -> Optional[str]:
+        return self.users.get(username)
+
+    def set(self, username: str, password: str) -> None:
+        self.users[username] = password
+        self.flush()
+
+    def delete(self, username: str) -> bool:
+        if self.users.pop(username, None) is None:
+            return False
+        self.flush()
+        return True
+
+    def set_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        self.users.update(items)
+        self.flush()
+
+    def iter_items(self) -> Iterator[Tuple[str, str]]:
+        return iter(self.users.items())
+
+    def count(self) -> int:
+        return len(self.users)
+
+    def flush(self) -> None:
+        _atomic_write(self.path, json.dumps(self.users, indent=4))
+
+
+class JournalBackend(UserBackend):
+    """Journal append-only: setiap perubahan satu baris, dipadatkan berkala lewat rename atomik"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.users: Dict[str, str] = {}
+        self.lines = 0
+        if os.path.exists(path):
+            self._replay()
         else:
-            # Buat file dengan beberapa pengguna default
-            self.users = {
-                "adminganteng": "admin123",
-                "maulana": "pass123",
-                "atha": "pass123"
-            }
-            self.save_users()
+            self.created = True
+        self._file = open(path, "a")
+
+    def _replay(self) -> None:
+        """Memutar ulang journal ke memori, mengabaikan baris terakhir yang terpotong"""
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Peringatan: baris journal {self.path} rusak diabaikan")
+                    continue
+                if entry["op"] == "set":
+                    self.users[entry["username"]] = entry["password"]
+                elif entry["op"] == "del":
+                    self.users.pop(entry["username"], None)
+                self.lines += 1
+
+    def _append(self, entries: Iterable[dict]) -> None:
+        """Menambahkan entri ke journal lalu fsync"""
+        data = "".join(json.dumps(entry) + "\n" for entry in entries)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.lines += data.count("\n")
+        if self.lines > JOURNAL_COMPACT_MIN and self.lines > JOURNAL_COMPACT_RATIO * len(self.users):
+            self.compact()
+
+    def compact(self) -> None:
+        """Menulis ulang journal berisi hanya pengguna yang masih ada"""
+        self._file.close()
+        _atomic_write(self.path, "".join(
+            json.dumps({"op": "set", "username": username, "password": password}) + "\n"
+            for username, password in self.users.items()))
+        self.lines = len(self.users)
+        self._file = open(self.path, "a")
+
+    def get(self, username: str) -> Optional[str]:
+        return self.users.get(username)
+
+    def set(self, username: str, password: str) -> None:
+        self.users[username] = password
+        self._append([{"op": "set", "username": username, "password": password}])
+
+    def delete(self, username: str) -> bool:
+        if self.users.pop(username, None) is None:
+            return False
+        self._append([{"op": "del", "username": username}])
+        return True
+
+    def set_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        entries = []
+        for username, password in items:
+            self.users[username] = password
+            entries.append({"op": "set", "username": username, "password": password})
+        self._append(entries)
+
+    def iter_items(self) -> Iterator[Tuple[str, str]]:
+        return iter(self.users.items())
+
+    def count(self) -> int:
+        return len(self.users)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SqliteBackend(UserBackend):
+    """Backend SQLite dengan kolom username terindeks, tanpa memuat semua pengguna ke memori"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.created = not os.path.exists(path)
+        # Koneksi dipakai bersama thread pool verifikasi, akses dijaga lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL)")
+        self._db.commit()
+
+    def get(self, username: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, username: str, password: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)",
+                             (username, password))
+
+    def delete(self, username: str) -> bool:
+        with self._lock, self._db:
+            cursor = self._db.execute("DELETE FROM users WHERE username = ?", (username,))
+        return cursor.rowcount > 0
+
+    def set_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)", items)
+
+    def iter_items(self) -> Iterator[Tuple[str, str]]:
+        # Cursor terpisah agar baris dibaca bertahap, bukan disalin sekaligus
+        with self._lock:
+            cursor = self._db.execute("SELECT username, password FROM users ORDER BY username")
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(500)
+            if not rows:
+                return
+            yield from rows
+
+    def iter_plaintext(self) -> Iterator[Tuple[str, str]]:
+        with self._lock:
+            rows = self._db.execute("SELECT username, password FROM users WHERE substr(password, 1, ?) != ?",
+                                    (len(HASH_PREFIX), HASH_PREFIX)).fetchall()
+        return iter(rows)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def create_backend(path: str) -> UserBackend:
+    """Memilih backend dari ekstensi file: .json, .journal, atau .db/.sqlite/.sqlite3"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".db", ".sqlite", ".sqlite3"):
+        return SqliteBackend(path)
+    if extension == ".journal":
+        return JournalBackend(path)
+    return JsonBackend(path)
+
+
+class UserManager:
+    def __init__(self, users_file: str = "users.json", backend: Optional[UserBackend] = None):
+        self.users_file = users_file
+        self._backend: Optional[UserBackend] = backend
+        # Backend dibuka (dan pengguna default/migrasi dijalankan) saat pertama dipakai,
+        # setelah konfigurasi server menentukan users_file
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore = asyncio.Semaphore(VERIFY_CONCURRENCY)
+        # Key cache adalah HMAC dari username+password dengan kunci acak per proses,
+        # sehingga password asli tidak pernah disimpan di memori
+        self._cache_key = secrets.token_bytes(32)
+        self._cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+    @property
+    def backend(self) -> UserBackend:
+        """Backend penyimpanan pengguna, dibuka dari users_file saat pertama dipakai"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load_users()
+        return self._backend
+
+    def load_users(self) -> None:
+        """Membuka backend penyimpanan pengguna"""
+        if self._backend is None:
+            self._backend = create_backend(self.users_file)
+        self._loaded = True
+        if self.backend.created and self.backend.count() == 0:
+            # Buat penyimpanan dengan beberapa pengguna default
+            self.backend.set_many((username, hash_password(password))
+                                  for username, password in DEFAULT_USERS.items())
+        self._migrate_plaintext()
+
+    def use_backend(self, backend: Optional[UserBackend]) -> None:
+        """Mengganti backend penyimpanan; None berarti dibuka dari users_file saat dipakai"""
+        if self._loaded:
+            self._backend.close()
+        self._backend = backend
+        self._loaded = False
+        self._cache.clear()
+
+    def configure(self, users_file: str) -> None:
+        """Mengganti file pengguna dari konfigurasi server tanpa langsung membukanya"""
+        if users_file != self.users_file:
+            self.users_file = users_file
+            self.use_backend(None)
+
+    def _migrate_plaintext(self) -> None:
+        """Mengganti password plaintext lama dengan hash dalam satu transaksi"""
+        plaintext = list(self.backend.iter_plaintext())
+        if plaintext:
+            self.backend.set_many((username, hash_password(password)) for username, password in plaintext)
 
     def save_users(self) -> None:
-        """Menyimpan data pengguna ke file JSON"""
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users, f, indent=4)
+        """Memastikan data pengguna tersimpan di backend"""
+        self.backend.flush()
 
     def verify_credentials(self, username: str, password: str) -> bool:
-        """Verifikasi kredensial pengguna"""
-        return username in self.users and self.users[username] == password
+        """Verifikasi kredensial pengguna (blocking, gunakan verify_credentials_async di event loop)"""
+        stored = self.backend.get(username)
+        if stored is None:
+            check_password(password, _get_dummy_hash())
+            return False
+        return check_password(password, stored)
+
+    def _cache_lookup_key(self, username: str, password: str) -> bytes:
+        return hmac.new(self._cache_key, f"{username}\0{password}".encode(), hashlib.sha256).digest()
+
+    def _invalidate_cache(self, username: str) -> None:
+        """Membuang cache verifikasi milik satu pengguna"""
+        stale = [key for key, (owner, _) in self._cache.items() if owner == username]
+        for key in stale:
+            del self._cache[key]
+
+    async def verify_credentials_async(self, username: str, password: str) -> bool:
+        """Verifikasi kredensial di thread pool dengan batas konkurensi dan cache LRU"""
+        key = self._cache_lookup_key(username, password)
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[1] > time.monotonic():
+                self._cache.move_to_end(key)
+                return True
+            del self._cache[key]
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(VERIFY_WORKERS, thread_name_prefix="verify")
+        async with self._semaphore:
+            # Lookup ikut dijalankan di thread pool karena backend SQLite membaca disk
+            loop = asyncio.get_running_loop()
+            valid = await loop.run_in_executor(self._executor, self.verify_credentials, username, password)
+
+        if valid:
+            self._cache[key] = (username, time.monotonic() + VERIFY_CACHE_TTL)
+            if len(self._cache) > VERIFY_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return valid
+
+    async def existing_async(self, usernames: Iterable[str]) -> Set[str]:
+        """Username yang terdaftar, dicek di executor agar event loop tidak menunggu backend"""
+        candidates = list(usernames)
+        if not candidates:
+            return set()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, lambda: {username for username in candidates if username in self.backend})
 
     def add_user(self, username: str, password: str) -> bool:
         """Menambahkan pengguna baru"""
-        if username in self.users:
+        if username in self.backend:
             return False
-        self.users[username] = password
-        self.save_users()
+        self.backend.set(username, hash_password(password))
         return True
 
+    def add_users(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Impor banyak pengguna (username, password) dalam satu transaksi, yang sudah ada dilewati"""
+        hashed = [(username, hash_password(password)) for username, password in items
+                  if username not in self.backend]
+        self.backend.set_many(hashed)
+        return len(hashed)
+
     def remove_user(self, username: str) -> bool:
         """Menghapus pengguna"""
-        if username not in self.users:
+        if not self.backend.delete(username):
             return False
-        del self.users[username]
-        self.save_users()
+        self._invalidate_cache(username)
         return True
 
     def change_password(self, username: str, new_password: str) -> bool:
         """Mengubah password pengguna"""
-        if username not in self.users:
+        if username not in self.backend:
             return False
-        self.users[username] = new_password
-        self.save_users()
+        self.backend.set(username, hash_password(new_password))
+        self._invalidate_cache(username)
         return True
 
     def get_all_users(self) -> Dict[str, str]:
         """Mendapatkan semua data pengguna"""
-        return self.users.copy()
+        return dict(self.backend.iter_items())
+
+    def iter_users(self) -> Iterator[Tuple[str, str]]:
+        """Iterator bertahap atas (username, hash), tanpa menyalin semua pengguna"""
+        return self.backend.iter_items()
 
 # Buat instance UserManager global
 user_manager = UserManager() 
\ No newline at end of file